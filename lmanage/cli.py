@@ -16,6 +16,8 @@
 
 import click
 from lmanage import get_content_with_views
+from lmanage import lineage_server
+from lmanage import query_lineage
 from coloredlogger import ColoredLogger
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -31,23 +33,170 @@ def lmanage():
 @lmanage.command()
 @click.option("-fp", "--path",
               type=click.Path(exists=True),
-              help="input your file path to save a csv of results")
+              help="input your file path to save a csv (or --format file) of results")
 @click.option("-i", "--ini-file",
               help="Path to the ini file to use for sdk authentication")
 @click.option("-p", "--project",
               help="Path folder containing your lookml files, often taken using a git pull from your connected lookml project repository")
-@click.option("-t", "--table",
-              help="Add a view name to search for elements that rely on this view")
-@click.option("-f", "--field",
-              help="Add a fully scoped fieldname (e.g. view_name.field_name) to return a csv with these values")
+@click.option("-t", "--table", multiple=True,
+              help="Add a view name to search for elements that rely on this view, repeat to search for several views in one run")
+@click.option("-f", "--field", multiple=True,
+              help="Add a fully scoped fieldname (e.g. view_name.field_name) to return a csv with these values, repeat to search for several fields in one run")
+@click.option("--format", "format",
+              type=click.Choice(['csv', 'parquet', 'arrow', 'jsonl']), default='csv', show_default=True,
+              help="Format of the output file, parquet and arrow (which need pyarrow) and jsonl keep the list columns as lists")
+@click.option("--mask-file",
+              type=click.Path(exists=True, dir_okay=False),
+              help="File of table:view_name and field:view_name.field_name lines to search for in one run")
+@click.option("--mask-output",
+              type=click.Choice(['per-mask', 'long']), default='per-mask', show_default=True,
+              help="With several tables or fields, write a csv per table or field next to --path, or one long csv with a mask column")
+@click.option("-c", "--concurrency",
+              type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of dashboard element queries to fetch from the Looker API at the same time")
+@click.option("--rate-limit",
+              type=click.FloatRange(min=0.001),
+              help="Maximum number of Looker API calls per second")
+@click.option("--retries",
+              type=click.IntRange(min=0), default=4, show_default=True,
+              help="Number of times a call throttled (429), failing on the server (5xx) or timing out is retried, with exponential backoff")
+@click.option("--query-timeout",
+              type=click.FloatRange(min=0.001),
+              help="Seconds a Looker API call may take before it fails as a timeout, defaults to the timeout of the ini file")
+@click.option("--all-sql-table-names", is_flag=True,
+              help="Fill the sql_table_name column of every row with all the sql_table_names of the project, instead of the ones the element reads from")
+@click.option("--page-size",
+              type=click.IntRange(min=1), default=5000, show_default=True,
+              help="Number of dashboard elements requested from System Activity per page")
+@click.option("--batch-size",
+              type=click.IntRange(min=1), default=1000, show_default=True,
+              help="Number of dashboard elements fetched, matched and written to the csv together")
+@click.option("-w", "--parse-workers",
+              type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of processes used to parse the lookml files and the sql of the dashboard element queries")
+@click.option("--offline", "--fields-only", "offline", is_flag=True,
+              help="Resolve the views of each element from its fields and the lookml instead of fetching its sql, one System Activity call in total")
+@click.option("--state",
+              type=click.Path(dir_okay=False),
+              help="State file of incremental runs, only dashboard elements added or changed since the run that wrote it are fetched and matched")
+@click.option("--resume", is_flag=True,
+              help="Carry on an interrupted run from its checkpoint (--path with a .checkpoint suffix, or the --state file) without repeating the api calls it completed")
+@click.option("--sqlite",
+              type=click.Path(dir_okay=False),
+              help="Also write the rows to this SQLite lineage store, indexed by view, table and field for lmanage query")
+@click.option("--engine",
+              type=click.Choice(['python', 'pandas']), default='python', show_default=True,
+              help="Match dashboard elements to LookML row by row (python) or a batch at a time with DataFrame merges (pandas)")
+@click.option("--cache-dir",
+              type=click.Path(file_okay=False),
+              help="Folder for the local cache of query sql and parsed lookml files, defaults to ~/.lmanage/cache")
+@click.option("--cache-max-age",
+              type=float, default=30, show_default=True,
+              help="Days a cached query sql is kept before it is fetched again")
+@click.option("--cache-max-size",
+              type=float, default=256, show_default=True,
+              help="Size in MB of the cached query sql before the least recently used queries are evicted")
+@click.option("--no-cache", is_flag=True,
+              help="Fetch the sql of every query from the Looker API and parse every lookml file without reading or writing the local cache")
+@click.option("--refresh-cache", is_flag=True,
+              help="Fetch the sql of every query from the Looker API and overwrite the local cache")
 def mapview(**kwargs):
-    arguments = ['PATH', 'INI_FILE', 'PROJECT', 'TABLE', 'FIELD']
+    arguments = ['PATH', 'INI_FILE', 'PROJECT', 'TABLE', 'FIELD', 'MASK_FILE']
+    required = ['PATH', 'INI_FILE', 'PROJECT']
     for argument in arguments:
         logger.success(
-            f'You have set {kwargs.get(argument)} for your {argument} variable')
-        if kwargs.get(argument) == None:
+            f'You have set {kwargs.get(argument.lower())} for your {argument} variable')
+    for argument in required:
+        if kwargs.get(argument.lower()) == None:
             logger.wtf(
                 f'There is no value set for {argument} please use the `--help` flag to see input parameters')
             return 'test fail response'
-        else:
-            get_content_with_views.main(**kwargs)
+    get_content_with_views.main(**kwargs)
+
+
+@lmanage.command()
+@click.option("-i", "--ini-file",
+              help="Path to the ini file to use for sdk authentication")
+@click.option("-p", "--project",
+              help="Path folder containing your lookml files, often taken using a git pull from your connected lookml project repository")
+@click.option("--host", default='127.0.0.1', show_default=True,
+              help="Address the lookup API listens on")
+@click.option("--port",
+              type=click.IntRange(min=0, max=65535), default=8765, show_default=True,
+              help="Port the lookup API listens on")
+@click.option("--socket",
+              type=click.Path(dir_okay=False),
+              help="Listen on this unix socket, only readable by you, instead of --host and --port")
+@click.option("--poll-interval",
+              type=click.FloatRange(min=0.1), default=2, show_default=True,
+              help="Seconds between checks of the lookml files for changes")
+@click.option("--refresh-interval",
+              type=click.FloatRange(min=0.1),
+              help="Minutes between refreshes of the dashboard elements, to pick up new and edited tiles, by default only on POST /refresh and lookml changes")
+@click.option("-c", "--concurrency",
+              type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of dashboard element queries to fetch from the Looker API at the same time")
+@click.option("--rate-limit",
+              type=click.FloatRange(min=0.001),
+              help="Maximum number of Looker API calls per second")
+@click.option("--retries",
+              type=click.IntRange(min=0), default=4, show_default=True,
+              help="Number of times a call throttled (429), failing on the server (5xx) or timing out is retried, with exponential backoff")
+@click.option("--query-timeout",
+              type=click.FloatRange(min=0.001),
+              help="Seconds a Looker API call may take before it fails as a timeout, defaults to the timeout of the ini file")
+@click.option("--page-size",
+              type=click.IntRange(min=1), default=5000, show_default=True,
+              help="Number of dashboard elements requested from System Activity per page")
+@click.option("--batch-size",
+              type=click.IntRange(min=1), default=1000, show_default=True,
+              help="Number of dashboard elements fetched and matched together")
+@click.option("-w", "--parse-workers",
+              type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of processes used to parse the lookml files and the sql of the dashboard element queries")
+@click.option("--offline", "--fields-only", "offline", is_flag=True,
+              help="Resolve the views of each element from its fields and the lookml instead of fetching its sql")
+@click.option("--cache-dir",
+              type=click.Path(file_okay=False),
+              help="Folder for the local cache of query sql and parsed lookml files, defaults to ~/.lmanage/cache")
+@click.option("--no-cache", is_flag=True,
+              help="Fetch the sql of every query on each refresh and parse every lookml file without reading or writing the local cache")
+def serve(**kwargs):
+    arguments = ['INI_FILE', 'PROJECT', 'SOCKET']
+    required = ['INI_FILE', 'PROJECT']
+    for argument in arguments:
+        logger.success(
+            f'You have set {kwargs.get(argument.lower())} for your {argument} variable')
+    for argument in required:
+        if kwargs.get(argument.lower()) == None:
+            logger.wtf(
+                f'There is no value set for {argument} please use the `--help` flag to see input parameters')
+            return 'test fail response'
+    lineage_server.main(**kwargs)
+
+
+@lmanage.command()
+@click.option("--db",
+              type=click.Path(exists=True, dir_okay=False),
+              help="SQLite lineage store written by mapview --sqlite")
+@click.option("-t", "--table", multiple=True,
+              help="Return the elements that rely on this view, repeat to search for several views")
+@click.option("--sql-table", multiple=True,
+              help="Return the elements whose sql reads this database table (e.g. schema.table_name), repeat to search for several tables")
+@click.option("-f", "--field", multiple=True,
+              help="Return the elements that use this fully scoped fieldname (e.g. view_name.field_name), repeat to search for several fields")
+@click.option("-d", "--dashboard", multiple=True,
+              help="Return the elements of this dashboard id, repeat to search for several dashboards")
+@click.option("--explores", is_flag=True,
+              help="List the explores that join the views of --table instead of the elements using them")
+@click.option("-fp", "--path",
+              type=click.Path(dir_okay=False),
+              help="Write the matching rows to this csv instead of printing them")
+def query(**kwargs):
+    required = ['DB']
+    for argument in required:
+        if kwargs.get(argument.lower()) == None:
+            logger.wtf(
+                f'There is no value set for {argument} please use the `--help` flag to see input parameters')
+            return 'test fail response'
+    query_lineage.main(**kwargs)
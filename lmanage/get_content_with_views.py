@@ -18,16 +18,27 @@ import sqlparse
 import looker_sdk
 from looker_sdk import models
 import json
+import hashlib
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict
 import pandas as pd
-import lookml
 import configparser as ConfigParser
 import snoop
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from itertools import chain
 from lmanage.utils import parsing_sql
 from lmanage.utils import create_df
+from lmanage.utils import sql_cache
+from lmanage.utils import lookml_index
+from lmanage.utils import lookml_cache
+from lmanage.utils import match_frame
+from lmanage.utils import run_state
+from lmanage.utils import scheduler
+from lmanage.utils import sdk_session
+from lmanage.utils import lineage_store
+from lmanage.utils import columnar
 from coloredlogger import ColoredLogger
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -74,31 +85,15 @@ def get_view_path(proj):
 
 def fetch_view_files(proj):
     """Fetches the all the named view objects listed in explores of a Model file specifically.
-    Identifies a model file, iterates over all the explore objects in the model file, appends their base view and joined views to a dict object
+    Identifies a model file, iterates over all the explore objects in the model file, appends their base view and joined views to a dict object.
+    Explores get the joins of the explores they extend and of their refinements, see `lookml_index.resolve_extends`.
     Args:
-        proj: The project from PyLookML
+        proj: The project from PyLookML, or its LookmlIndex
     Returns:
         A dict with key: being the base view and values: list of all the used views in the explore object.
         For example:
          defaultdict(<class 'list'>, {'order_items': ['order_items', 'order_facts', 'inventory_items', 'users', 'user_order_facts', 'products', 'repeat_purchase_facts', 'distribution_centers', 'test_ndt'], 'events':['events', 'sessions', 'session_landing_page', 'session_bounce_page', 'product_viewed', 'users', 'user_order_facts']})    """
-    file = find_model_files(proj)
-    true_view_names = defaultdict(list)
-    for explore in file.explores:
-        if 'view_name' not in explore and 'from' not in explore:
-            true_view_names[explore.name].append(explore.name)
-        if 'view_name' in explore:
-            true_view_names[explore['name']].append(
-                explore['view_name'].value)
-        if 'from' in explore:
-            true_view_names[explore['name']].append(explore['from'].value)
-        if 'join' in explore:
-            for join in explore['join']:
-                true_view_names[explore['name']].append(join['name'])
-                if 'view_name' in join:
-                    true_view_names[explore['name']].append(join['view_name'])
-                if 'from' in join:
-                    true_view_names[explore['name']].append(join['from'])
-    return true_view_names
+    return lookml_index.build_index(proj).explore_joins
 
 
 def get_sql_table_name(proj):
@@ -124,6 +119,44 @@ def get_sql_table_name(proj):
     return response
 
 
+# sql_joins of an element whose query could not be fetched because of rate limiting, server errors or timeouts, as opposed to
+# 'No Content' for a query Looker cannot generate SQL for. It is neither cached nor kept in the run state, so the next run retries it
+FETCH_FAILED = 'Fetch Failed'
+
+
+def fetch_sql(sdk, qid: int):
+    """Fetches the Looker generated SQL of a query.
+
+    Args:
+        sdk: Looker SDK object
+        qid: (int) query_id from a  Looker query (n.b. NOT THE SAME AS A QID in the url)
+    Returns:
+        The SQL text Looker would run for the query, None if the query is broken and the SDK raised an error,
+        or FETCH_FAILED if the API kept failing transiently, see `scheduler.RequestScheduler`.
+    """
+    try:
+        return sdk.run_query(query_id=qid, result_format='sql')
+    except scheduler.TransientError:
+        return FETCH_FAILED
+    except looker_sdk.error.SDKError:
+        return None
+
+
+def extract_sql_tables(sql_response):
+    """Runs the table extraction over a `fetch_sql` response.
+
+    Args:
+        sql_response: (str) Looker generated SQL, or the raw response of a failed fetch
+    Returns:
+        A list of the tables found in the SQL, 'No Content' if the query is broken, any other response is passed through untouched.
+    """
+    if sql_response is None:
+        return 'No Content'
+    if type(sql_response) == str:
+        return parsing_sql.extract_tables(sql_response)
+    return sql_response
+
+
 def parse_sql(sdk, qid: int):
     """Idenfies the base tables and joins used by a Looker query.
 
@@ -138,24 +171,68 @@ def parse_sql(sdk, qid: int):
     Exception:
         If a query is broken for whatever reason an Exception is raised to continue the program running
     """
-    try:
-        sql_response = sdk.run_query(query_id=qid, result_format='sql')
-        if type(sql_response) == str:
-            tables = parsing_sql.extract_tables(sql_response)
-            return tables
-        else:
-            return sql_response
-    except looker_sdk.error.SDKError:
-        return('No Content')
+    return extract_sql_tables(fetch_sql(sdk, qid))
+
+
+def sql_hash(sql_response: str):
+    """Returns a stable key for a SQL string so identical SQL text is only parsed once."""
+    return hashlib.sha1(sql_response.encode('utf-8')).hexdigest()
+
+
+def fetch_sql_texts(sdk, query_ids, concurrency=1):
+    """Fetches the SQL of a list of queries, the fetch stage of `get_sql_from_elements`.
+
+    Args:
+        sdk: Looker SDK object
+        query_ids: (list) Looker query ids
+        concurrency: (int) number of queries to fetch from the Looker API at the same time
+    Returns:
+        The `fetch_sql` response of each query, in the order of query_ids.
+    """
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(partial(fetch_sql, sdk), query_ids))
+    return [fetch_sql(sdk, query_id) for query_id in query_ids]
 
 
-def get_sql_from_elements(sdk, content_results):
-    """Amends returned SDK System__Activity reponse with sql tables used from the `parse_sql` function.
+def parse_sql_texts(sql_texts, parse_workers=1, parse_executor=None):
+    """Extracts the tables of a list of SQL strings, the parse stage of `get_sql_from_elements`.
 
-    Iterates over the response from get_dashboards and runs the parse_sql function for each returned dashboard element, returns the list of tables and amends the dict response and returns it
+    Parsing is CPU bound, so when parse_workers is greater than 1 the SQL is parsed in a pool of processes in chunked batches.
+    Args:
+        sql_texts: (list) Looker generated SQL strings
+        parse_workers: (int) number of processes to parse with
+        parse_executor: (ProcessPoolExecutor) optional pool of parse_workers processes kept for the whole run, e.g. by
+            `iter_mapview_batches`, otherwise a pool is started for this call
+    Returns:
+        The `parsing_sql.extract_tables` result of each SQL string, in the order of sql_texts.
+    """
+    if parse_workers > 1 and len(sql_texts) > 1:
+        chunksize = max(1, len(sql_texts) // (parse_workers * 4))
+        if parse_executor is not None:
+            return list(parse_executor.map(parsing_sql.extract_tables, sql_texts, chunksize=chunksize))
+        with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+            return list(executor.map(parsing_sql.extract_tables, sql_texts, chunksize=chunksize))
+    return [parsing_sql.extract_tables(sql_text) for sql_text in sql_texts]
+
+
+def get_sql_from_elements(sdk, content_results, concurrency=1, stats=None, cache=None, parse_workers=1, tables_per_query=None,
+                          parse_executor=None):
+    """Amends returned SDK System__Activity reponse with sql tables used from the `fetch_sql` function.
+
+    Collects the distinct query ids of the response from get_dashboards and fetches the SQL of each one once, identical SQL text is only parsed once.
+    The tables found are fanned back out to every dashboard element sharing the query and amended to the dict response.
+    Fetching is network bound and spread over concurrency threads, parsing is CPU bound and spread over parse_workers processes.
+    Both stages keep the order of their input, so the response is the same whatever the number of threads or processes.
     Args:
         sdk: Looker SDK object
         content_results: (dict) response from get_dashboards function call
+        concurrency: (int) number of queries to fetch from the Looker API at the same time
+        stats: (Counter) optional counter amended with the number of api calls and parses made and saved
+        cache: (SqlCache) optional on disk cache, queries found in it are not fetched or parsed again
+        parse_workers: (int) number of processes to parse the fetched SQL with
+        tables_per_query: (dict) optional query id -> tables memo shared by calls for successive pages of dashboard elements, queries already in it are not fetched again
+        parse_executor: (ProcessPoolExecutor) optional pool of parse_workers processes shared by calls, see `parse_sql_texts`
     Returns:
         An amended dict response with the sql columns used by each element extracted our of the Looker generated SQL for each dashboard object.
         For example:
@@ -171,21 +248,118 @@ def get_sql_from_elements(sdk, content_results):
          'look.id': None,
          'sql_joins': ['`looker-private-demo.ecomm.order_items`']}]
     """
-    for dash in content_results:
-        query_id = dash['query.id']
-        sql_value = parse_sql(sdk, query_id)
+    stats = Counter() if stats is None else stats
+    tables_per_query = {} if tables_per_query is None else tables_per_query
+    query_ids = [query_id for query_id in dict.fromkeys(
+        dash['query.id'] for dash in content_results) if query_id not in tables_per_query]
+    if cache is not None:
+        for query_id in query_ids:
+            cached = cache.get(query_id)
+            if cached is not None:
+                tables_per_query[query_id] = cached[1]
+        cache_misses = [
+            query_id for query_id in query_ids if query_id not in tables_per_query]
+        stats['cache_hits'] += len(query_ids) - len(cache_misses)
+        query_ids = cache_misses
+    stats['api_calls'] += len(query_ids)
+    stats['api_calls_saved'] += len(content_results) - len(query_ids)
+
+    sql_responses = fetch_sql_texts(sdk, query_ids, concurrency=concurrency)
+
+    sql_to_parse = {}
+    sql_per_query = {}
+    failed = {}
+    for query_id, sql_response in zip(query_ids, sql_responses):
+        if sql_response is None:
+            stats['fetch_failed_permanent'] += 1
+        if sql_response is FETCH_FAILED:
+            stats['fetch_failed_transient'] += 1
+            failed[query_id] = FETCH_FAILED
+            continue
+        if type(sql_response) != str:
+            tables_per_query[query_id] = extract_sql_tables(sql_response)
+            continue
+        key = sql_hash(sql_response)
+        if key in sql_to_parse:
+            stats['parses_saved'] += 1
+        else:
+            sql_to_parse[key] = sql_response
+            stats['parses'] += 1
+        sql_per_query[query_id] = key
 
-        dash['sql_joins'] = sql_value
+    parsed_sql = dict(zip(sql_to_parse, parse_sql_texts(
+        list(sql_to_parse.values()), parse_workers=parse_workers, parse_executor=parse_executor)))
+    for query_id, key in sql_per_query.items():
+        tables_per_query[query_id] = parsed_sql[key]
+        if cache is not None:
+            cache.put(query_id, sql_to_parse[key], parsed_sql[key])
+
+    for dash in content_results:
+        sql_value = failed.get(dash['query.id']) or tables_per_query[dash['query.id']]
+        dash['sql_joins'] = list(sql_value) if isinstance(
+            sql_value, list) else sql_value
 
     return content_results
 
 
-def get_dashboards(sdk):
+DASHBOARD_FIELDS = [
+    "dashboard.id",
+    "dashboard_element.id",
+    "dashboard_element.type",
+    "dashboard_element.result_source",
+    "query.model",
+    "query.view",
+    "query.formatted_fields",
+    "query.id",
+    "dashboard.title",
+    "look.id"
+]
+
+
+def iter_dashboard_pages(sdk, page_size=5000, after=None):
+    """Pages through the System__Activity dashboard_element metadata with keyset pagination.
+
+    Rows are sorted by dashboard_element.id and each page asks for the ids greater than the last id of the previous page,
+    so no row is skipped or repeated however many dashboard elements the instance has.
+    Args:
+        sdk: Looker SDK object
+        page_size: (int) number of rows requested per run_inline_query call
+        after: (int) optional dashboard_element.id to start after, e.g. the last id of a checkpointed run
+    Yields:
+        A list of at most page_size rows as returned by `get_dashboards`, until every dashboard element has been returned.
+    """
+    last_id = after
+    while True:
+        filters = {"dashboard_element.type": "-text"}
+        if last_id is not None:
+            filters["dashboard_element.id"] = f'>{last_id}'
+        query_config = models.WriteQuery(
+            model="system__activity",
+            view="dashboard",
+            fields=DASHBOARD_FIELDS,
+            filters=filters,
+            sorts=["dashboard_element.id"],
+            limit=str(page_size)
+        )
+        query_response = sdk.run_inline_query(
+            result_format='json',
+            body=query_config
+        )
+        page = json.loads(query_response)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1]['dashboard_element.id']
+
+
+def get_dashboards(sdk, page_size=5000):
     """Uses the Looker SDK System__Activity model to extract dashboard and dashboard_element metadata.
 
-    Simple run_inline_query call to Looker SDK
+    Collects every page of `iter_dashboard_pages`
     Args:
         sdk: Looker SDK object
+        page_size: (int) number of rows requested per run_inline_query call
     Returns:
         An dict response with the dashboard and dashboard_element metadata.
         For example:
@@ -200,34 +374,7 @@ def get_dashboards(sdk):
          'dashboard.title': 'dash_1',
          'look.id': None}]
     """
-    query_config = models.WriteQuery(
-        model="system__activity",
-        view="dashboard",
-        fields=[
-            "dashboard.id",
-            "dashboard_element.id",
-            "dashboard_element.type",
-            "dashboard_element.result_source",
-            "query.model",
-            "query.view",
-            "query.formatted_fields",
-            "query.id",
-            "dashboard.title",
-            "look.id"
-        ],
-        filters={
-            "dashboard_element.type": "-text"
-        },
-        limit='5000'
-    )
-    query_response = sdk.run_inline_query(
-        result_format='json',
-        body=query_config
-    )
-
-    query_response = json.loads(query_response)
-
-    return query_response
+    return list(chain.from_iterable(iter_dashboard_pages(sdk, page_size=page_size)))
 
 
 def test_period_appearence(input_response):
@@ -245,18 +392,54 @@ def test_period_appearence(input_response):
     return bool(test_period)
 
 
-def match_join_per_query(myresults):
+def match_join_per_query(myresults, proj=None):
+    """Finds the joins of a dashboard element that are modelled in LookML.
+
+    Joins without a schema (CTEs and derived tables) are kept, the remaining joins are kept if they are the sql_table_name of a view
+    or the scratch table of a persistent derived table. The tables derived tables read, through any number of other derived
+    tables, count as read by the element, see `LookmlIndex.view_lineage`.
+    Args:
+        myresults: (dict) a row of `match_view_to_dash`
+        proj: LookmlIndex of the project, when omitted the sql_table_name list of the row is used as the catalog
+    Returns:
+        The row amended with used_joins, and with sql_table_name set to the sql_table_names the element reads from
+        unless the row already carries the project wide list.
+    """
+    if proj is None:
+        index = None
+        table_names = {lookml_index.normalize_table_name(
+            name): name for name in myresults['sql_table_name']}
+    else:
+        index = lookml_index.build_index(proj)
+        table_names = index.table_names
     result = []
+    matched_tables = []
+    derived_views = []
     sql_join = myresults['sql_joins']
-    sql_table_name = myresults['sql_table_name']
+    if not isinstance(sql_join, list):
+        sql_join = []
 
     for sql in sql_join:
         if not bool(test_period_appearence(sql)):
             result.append(sql)
-        for name in sql_table_name:
-            if sql == name:
-                result.append(sql)
+            derived_views.append(sql)
+        name = table_names.get(lookml_index.normalize_table_name(sql))
+        if name is not None:
+            result.append(sql)
+            matched_tables.append(name)
+            continue
+        pdt_view = index.pdt_view(sql) if index is not None else None
+        if pdt_view is not None:
+            result.append(sql)
+            derived_views.append(pdt_view)
+    if index is not None:
+        for view in dict.fromkeys(derived_views):
+            for name in index.lineage_sql_table_names(view):
+                if name not in matched_tables:
+                    matched_tables.append(name)
     myresults['used_joins'] = result
+    if 'sql_table_name' not in myresults:
+        myresults['sql_table_name'] = matched_tables
     return myresults
 
 
@@ -280,42 +463,57 @@ def all_joins(myresults):
 
 
 def all_views(myresults, proj):
+    index = lookml_index.build_index(proj)
     result = []
     for element in range(0, len(myresults)):
         used_joins = myresults[element]['used_joins']
         for join in used_joins:
             if not bool(test_period_appearence(join)):
                 result.append(join)
-        for file in proj.files():
-            path = file.path
-            myFile = proj.file(path)
-            if myFile.type != 'model':
-                for view in myFile.views:
-                    if view.sql_table_name.value in used_joins:
-                        result.append(view.name)
+        for join in dict.fromkeys(used_joins):
+            result.extend(index.views_for_table(join))
 
     myresults[element]['used_view_names'] = result
     return myresults
 
 
 def match_views_per_query(myresults, proj):
+    """Names the views used by a dashboard element.
+
+    Joins without a schema (CTEs and derived tables) are views in their own right, the remaining joins are looked up in the LookML index by sql_table_name.
+    The views upstream of the views found, through derived tables, follow them.
+    Args:
+        myresults: (dict) a row of `match_view_to_dash` amended by `match_join_per_query`
+        proj: LookmlIndex of the project, a PyLookML project is indexed on the fly
+    Returns:
+        The row amended with used_view_names.
+    """
+    index = lookml_index.build_index(proj)
     result = []
     used_joins = myresults['used_joins']
     for join in used_joins:
         if not bool(test_period_appearence(join)):
             result.append(join)
-    for file in proj.files():
-        path = file.path
-        myFile = proj.file(path)
-        if myFile.type != 'model':
-            for view in myFile.views:
-                if view.sql_table_name.value in used_joins:
-                    result.append(view.name)
+    for join in dict.fromkeys(used_joins):
+        result.extend(index.views_for_table(join))
+    result.extend(upstream_views(result, index))
 
     myresults['used_view_names'] = result
     return myresults
 
 
+def upstream_views(views, index):
+    """Lists the views upstream of views in their lineage that are not in views already, in order of first appearance."""
+    seen = set(views)
+    result = []
+    for view in dict.fromkeys(views):
+        for upstream in index.view_lineage(view).views:
+            if upstream not in seen:
+                seen.add(upstream)
+                result.append(upstream)
+    return result
+
+
 def find_unused_views(myresults):
     used_view_names = sorted(myresults['used_view_names'])
     potential_joins = sorted(myresults['potential_join'])
@@ -329,6 +527,18 @@ def find_unused_views(myresults):
 
 
 def match_view_to_dash(content_results, explore_results, sql_table_name, proj):
+    """Builds a mapview row for each dashboard element whose query is on an explore of the project.
+
+    Args:
+        content_results: (list) response of `get_sql_from_elements`
+        explore_results: (dict) (model, explore) -> views available in the explore, e.g. `LookmlIndex.model_explore_joins`,
+            rows are looked up by query.model and query.view, falling back to a dict keyed by explore name only
+        sql_table_name: (list) optional project wide sql_table_name list copied into every row, None leaves the column to
+            `match_join_per_query` which fills it with the tables the element reads from
+        proj: LookmlIndex of the project
+    Returns:
+        A list of rows with dashboard_id, element_id, sql_joins, fields_used, potential_join and possibly sql_table_name.
+    """
     tables_in_explore = []
 
     for content in content_results:
@@ -338,15 +548,489 @@ def match_view_to_dash(content_results, explore_results, sql_table_name, proj):
         result['sql_joins'] = content['sql_joins']
         result['fields_used'] = content['query.formatted_fields']
 
-        result['sql_table_name'] = sql_table_name
+        if sql_table_name is not None:
+            result['sql_table_name'] = sql_table_name
 
-        for explore, tables in explore_results.items():
-            if content['query.view'] == explore:
-                result['potential_join'] = tables
-                tables_in_explore.append(result)
+        tables = explore_results.get(
+            (content.get('query.model'), content['query.view']), explore_results.get(content['query.view']))
+        if tables is not None:
+            result['potential_join'] = tables
+            tables_in_explore.append(result)
     return tables_in_explore
 
 
+def match_fields_to_dash(content_results, proj, sql_table_name=None, stats=None, unresolved=None):
+    """Builds mapview rows from query.formatted_fields and the LookML alone, without fetching the SQL of the queries.
+
+    The views of an element are the views its fields are referenced from, resolved through the aliases of its explore, plus
+    the other views declared on the same tables and the views upstream of derived tables, as `match_views_per_query` would find
+    them in the SQL. used_joins holds the sql_table_name of each view, or the view name for derived tables, which is how they
+    appear in Looker generated SQL.
+    Views only used in join conditions or in the sql of other fields are not seen.
+    Args:
+        content_results: (list) rows of `get_dashboards`
+        proj: LookmlIndex of the project
+        sql_table_name: (list) optional project wide sql_table_name list copied into every row
+        stats: (Counter) optional counter amended with elements_unresolved
+        unresolved: (list) optional list amended with the element ids that have fields no view of their explore declares
+    Returns:
+        A list of rows with the columns of `OUTPUT_COLUMNS`, sql_joins is empty.
+    """
+    response = []
+    for content in content_results:
+        key = (content.get('query.model'), content.get('query.view'))
+        tables = proj.explore_views(*key)
+        if tables is None:
+            continue
+        aliases = proj.model_explore_aliases.get(key, {})
+        result = defaultdict(list)
+        result['dashboard_id'] = content['dashboard.id']
+        result['element_id'] = content['dashboard_element.id']
+        result['sql_joins'] = []
+        result['fields_used'] = content['query.formatted_fields']
+        result['potential_join'] = tables
+
+        views = []
+        missing = []
+        for field in element_fields(content['query.formatted_fields']):
+            view = aliases.get(field.split('.')[0]) if '.' in field else None
+            if view is None:
+                missing.append(field)
+            else:
+                views.append(view)
+
+        used_joins = []
+        used_view_names = []
+        matched_tables = []
+        derived_views = []
+        for view in dict.fromkeys(views):
+            table = proj.view_sql_table_name(view)
+            if table is None:
+                used_joins.append(view)
+                used_view_names.append(view)
+                derived_views.append(view)
+            else:
+                used_joins.append(table)
+                used_view_names.extend(proj.views_for_table(table))
+                matched_tables.append(table)
+        for view in derived_views:
+            for table in proj.lineage_sql_table_names(view):
+                if table not in matched_tables:
+                    matched_tables.append(table)
+        used_view_names = list(dict.fromkeys(used_view_names))
+        result['used_joins'] = used_joins
+        result['used_view_names'] = used_view_names + upstream_views(used_view_names, proj)
+        result['sql_table_name'] = matched_tables if sql_table_name is None else sql_table_name
+        find_unused_views(result)
+
+        if missing:
+            if stats is not None:
+                stats['elements_unresolved'] += 1
+            if unresolved is not None:
+                unresolved.append(content['dashboard_element.id'])
+        response.append(result)
+    return response
+
+
+def element_can_match(element, proj, masks=None):
+    """Decides from the inventory alone whether a dashboard element can end up in the output.
+
+    Elements on explores the project does not declare are dropped by `match_view_to_dash`. With masks, a field mask is
+    decided by query.formatted_fields and a table mask by the views the explore can reach, see `LookmlIndex.explore_reach`.
+    Args:
+        element: (dict) a row of `get_dashboards`
+        proj: LookmlIndex of the project
+        masks: (list) optional (mask type, name) tuples, the element is kept if it can match any of them
+    Returns:
+        False when fetching the SQL of the element cannot change the output.
+    """
+    model, explore = element.get('query.model'), element.get('query.view')
+    if proj.explore_views(model, explore) is None:
+        return False
+    if not masks:
+        return True
+    fields = None
+    for mask_type, name in masks:
+        if mask_type == 'field':
+            if fields is None:
+                fields = set(element_fields(element.get('query.formatted_fields')))
+            if name in fields:
+                return True
+        else:
+            reach = proj.explore_reach(model, explore)
+            if reach is None or name in reach:
+                return True
+    return False
+
+
+def prune_elements(elements, proj, masks=None, stats=None):
+    """Drops the dashboard elements that cannot match before their SQL is fetched, counting them in stats['elements_pruned']."""
+    kept = [element for element in elements if element_can_match(
+        element, proj, masks=masks)]
+    if stats is not None:
+        stats['elements_pruned'] += len(elements) - len(kept)
+    return kept
+
+
+OUTPUT_COLUMNS = [
+    'dashboard_id',
+    'element_id',
+    'sql_joins',
+    'fields_used',
+    'sql_table_name',
+    'potential_join',
+    'used_joins',
+    'used_view_names',
+    'unused_joins'
+]
+
+# number of query id -> tables results kept in memory to dedupe queries across batches
+QUERY_MEMO_SIZE = 10000
+
+
+def match_elements(sdk, proj, elements, concurrency=1, parse_workers=1, cache=None, stats=None, all_sql_table_names=False,
+                   engine='python', offline=False, unresolved=None, tables_per_query=None, parse_executor=None):
+    """Fetches, parses and matches one batch of dashboard elements, see `iter_mapview_batches` for the arguments.
+
+    Returns:
+        A list of mapview rows, or a DataFrame of the same rows with the pandas engine.
+    """
+    if offline:
+        return match_fields_to_dash(
+            elements, proj, sql_table_name=proj.sql_table_names if all_sql_table_names else None,
+            stats=stats, unresolved=unresolved)
+
+    content_results = get_sql_from_elements(
+        sdk, elements, concurrency=concurrency, stats=stats, cache=cache,
+        parse_workers=parse_workers, tables_per_query=tables_per_query, parse_executor=parse_executor)
+    if tables_per_query is not None:
+        while len(tables_per_query) > QUERY_MEMO_SIZE:
+            tables_per_query.popitem(last=False)
+
+    if engine == 'pandas':
+        return match_frame.match_frame(
+            content_results, proj, all_sql_table_names=all_sql_table_names)
+
+    combine = match_view_to_dash(
+        content_results, proj.model_explore_joins,
+        proj.sql_table_names if all_sql_table_names else None, proj=proj)
+    for row in combine:
+        match_join_per_query(row, proj)
+        match_views_per_query(row, proj)
+        find_unused_views(row)
+    return combine
+
+
+def state_fingerprint(proj, all_sql_table_names=False, offline=False):
+    """Digests what a mapview row depends on besides its query, the LookML index and the options that change the rows."""
+    return hashlib.sha1(json.dumps(
+        [proj.files, bool(all_sql_table_names), bool(offline)], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def match_elements_incremental(state, elements, match, stats=None):
+    """Reuses the stored rows of unchanged elements and matches the others, see `run_state.RunState`.
+
+    Args:
+        state: (RunState) rows of the previous run
+        elements: (list) a batch of dashboard elements
+        match: (callable) matches a list of elements to mapview rows, e.g. a partial of `match_elements`
+        stats: (Counter) optional counter amended with elements_reused
+    Returns:
+        The rows of the batch in the order of elements, stored rows and new rows mixed.
+    """
+    reused = {}
+    changed = []
+    for element in elements:
+        row = state.get(element['dashboard_element.id'], element['query.id'])
+        if row is None:
+            changed.append(element)
+        else:
+            reused[element['dashboard_element.id']] = row
+    if stats is not None:
+        stats['elements_reused'] += len(reused)
+
+    rows = match(changed) if changed else []
+    if isinstance(rows, pd.DataFrame):
+        rows = rows.to_dict('records')
+    query_ids = {element['dashboard_element.id']: element['query.id'] for element in changed}
+    for row in rows:
+        if row['sql_joins'] != FETCH_FAILED:
+            state.put(row['element_id'], query_ids[row['element_id']], row)
+        reused[row['element_id']] = row
+    state.commit()
+    return [reused[element['dashboard_element.id']] for element in elements
+            if element['dashboard_element.id'] in reused]
+
+
+def iter_inventory(sdk, page_size=5000, state=None):
+    """Pages through the dashboard elements, checkpointing each page in state.
+
+    When state resumes an unfinished run, the pages it read are replayed from the state file and paging carries on after them.
+    """
+    after = None
+    if state is not None and state.resuming:
+        after = state.last_element_id()
+        yield from state.pages(page_size)
+    for page in iter_dashboard_pages(sdk, page_size=page_size, after=after):
+        if state is not None:
+            state.add_page(page)
+        yield page
+
+
+def iter_mapview_batches(sdk, proj, page_size=5000, batch_size=1000, concurrency=1, parse_workers=1, cache=None, stats=None,
+                         all_sql_table_names=False, engine='python', masks=None, offline=False, unresolved=None, state=None):
+    """Streams the mapview rows of every dashboard element in fixed size batches.
+
+    Each page of dashboard elements is split in batches of batch_size, the SQL of a batch is fetched and parsed and its rows are matched
+    to the LookML index before the next batch is started, so only one page of inventory and one batch of rows are held in memory at a time.
+    Args:
+        sdk: Looker SDK object
+        proj: LookmlIndex of the project
+        page_size: (int) number of rows requested per System__Activity call
+        batch_size: (int) number of dashboard elements processed together
+        concurrency: (int) number of queries to fetch from the Looker API at the same time
+        parse_workers: (int) number of processes to parse the fetched SQL with
+        cache: (SqlCache) optional on disk cache of query SQL
+        stats: (Counter) optional counter amended with the number of api calls and parses made and saved
+        all_sql_table_names: (bool) fill the sql_table_name column with every sql_table_name of the project instead of the tables matched
+        engine: (str) 'python' matches the rows of a batch one by one, 'pandas' matches the whole batch with `match_frame.match_frame`
+        masks: (list) optional (mask type, name) filters, elements that cannot match any of them are pruned before their SQL is fetched
+        offline: (bool) build the rows from query.formatted_fields with `match_fields_to_dash` instead of fetching the SQL of every query
+        unresolved: (list) optional list amended with the element ids the offline mode could not resolve every field of
+        state: (RunState) optional rows of the previous run, only new and changed elements are fetched and matched and the rows of
+            elements deleted since are dropped once every batch has been consumed. Rows and inventory are checkpointed
+            batch by batch, so a state resuming an interrupted run repeats none of its API calls
+    Yields:
+        A list of matched rows per batch, as returned by `match_view_to_dash` and amended by `match_join_per_query`,
+        `match_views_per_query` and `find_unused_views`, or a DataFrame of the same rows with the pandas engine.
+    """
+    # one pool of parse processes for the whole run rather than one per batch
+    parse_executor = ProcessPoolExecutor(
+        max_workers=parse_workers) if parse_workers > 1 and not offline else None
+    match = partial(match_elements, sdk, proj, concurrency=concurrency, parse_workers=parse_workers, cache=cache, stats=stats,
+                    all_sql_table_names=all_sql_table_names, engine=engine, offline=offline, unresolved=unresolved,
+                    tables_per_query=OrderedDict(), parse_executor=parse_executor)
+    try:
+        for page in iter_inventory(sdk, page_size=page_size, state=state):
+            if state is not None:
+                state.seen(element['dashboard_element.id'] for element in page)
+            page = prune_elements(page, proj, masks=masks, stats=stats)
+            for start in range(0, len(page), batch_size):
+                if state is None:
+                    yield match(page[start:start + batch_size])
+                else:
+                    yield match_elements_incremental(state, page[start:start + batch_size], match, stats=stats)
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown()
+    if state is not None:
+        deleted = state.finish()
+        if stats is not None:
+            stats['elements_deleted'] += deleted
+
+
+def element_fields(fields_used):
+    """Returns the fields of an element query from its query.formatted_fields JSON string, an empty list if it has none."""
+    if not isinstance(fields_used, str):
+        return []
+    try:
+        fields = json.loads(fields_used)
+    except ValueError:
+        return []
+    return fields if isinstance(fields, list) else []
+
+
+def filter_rows(df, table_mask=None, field_mask=None):
+    """Keeps the rows of a batch that use the view table_mask, or failing that the field field_mask."""
+    if df.empty:
+        return df
+    if table_mask != None:
+        return df[df['used_view_names'].apply(lambda x: table_mask in x)]
+    if field_mask != None:
+        return df[df['fields_used'].apply(lambda x: field_mask in element_fields(x))]
+    return df
+
+
+def write_csv_batches(batches, file_path, table_mask=None, field_mask=None, file_format='csv'):
+    """Writes batches of mapview rows to a csv file, or a file of another format, as they are produced.
+
+    The first batch creates the file with its header, later batches are appended. Rows keep a running index,
+    so the file is the same as writing all the rows in one DataFrame.
+    Args:
+        batches: (iterable) lists or DataFrames of mapview rows, e.g. `iter_mapview_batches`
+        file_path: (str) path of the csv file
+        table_mask: (str) optional view name rows are filtered on
+        field_mask: (str) optional fully scoped field name rows are filtered on
+        file_format: (str) one of `columnar.FORMATS`, parquet and arrow write a row group per batch, see `columnar.open_writer`
+    Returns:
+        A (rows matched, rows written) tuple.
+    """
+    writer = columnar.open_writer(file_path, OUTPUT_COLUMNS, file_format=file_format)
+    rows_matched = 0
+    rows_written = 0
+    try:
+        for batch in batches:
+            df = pd.DataFrame(batch, columns=OUTPUT_COLUMNS)
+            df.index = range(rows_matched, rows_matched + len(batch))
+            rows_matched += len(batch)
+            df = filter_rows(df, table_mask=table_mask, field_mask=field_mask)
+            writer.write(df)
+            rows_written += len(df)
+    finally:
+        writer.close()
+    return rows_matched, rows_written
+
+
+def store_batches(batches, store):
+    """Writes each batch of mapview rows to a `lineage_store.LineageStore` before passing it on to the csv writer."""
+    for batch in batches:
+        store.put_rows(batch)
+        yield batch
+
+
+MASK_TYPES = ('table', 'field')
+
+
+def read_mask_file(file_path):
+    """Reads the masks of a batch filter run from a text file.
+
+    Each line holds one mask as type:name, blank lines and lines starting with # are skipped.
+    Args:
+        file_path: (str) path of the mask file
+    Returns:
+        A list of (mask type, name) tuples.
+        For example:
+        'table: order_items' -> [('table', 'order_items')]
+    """
+    masks = []
+    with open(file_path, encoding='utf-8') as mask_file:
+        for line_number, line in enumerate(mask_file, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            mask_type, _, name = line.partition(':')
+            if mask_type.strip() not in MASK_TYPES or not name.strip():
+                raise ValueError(
+                    f'line {line_number} of {file_path} should look like table:view_name or field:view_name.field_name')
+            masks.append((mask_type.strip(), name.strip()))
+    return masks
+
+
+def index_masks(df):
+    """Builds an inverted index from the views and fields of a batch to the positions of the rows that use them.
+
+    Args:
+        df: (DataFrame) a batch of mapview rows
+    Returns:
+        A dict of (mask type, name) -> row positions.
+        For example:
+        {('table', 'users'): [0, 2], ('field', 'users.id'): [2]}
+    """
+    index = defaultdict(list)
+    for position, (views, fields) in enumerate(zip(df['used_view_names'], df['fields_used'])):
+        for view in dict.fromkeys(views if isinstance(views, list) else []):
+            index[('table', view)].append(position)
+        for field in dict.fromkeys(element_fields(fields)):
+            index[('field', field)].append(position)
+    return index
+
+
+def mask_file_path(file_path, mask):
+    """Names the output file of a mask, e.g. ('table', 'users') -> mapview_table_users.csv next to mapview.csv."""
+    file_path = Path(file_path)
+    name = re.sub(r'[^\w.-]', '_', mask[1])
+    return file_path.with_name(f'{file_path.stem}_{mask[0]}_{name}{file_path.suffix}')
+
+
+def write_mask_csv_batches(batches, file_path, masks, layout='per-mask', file_format='csv'):
+    """Writes the rows of every mask of a batch filter run as the batches are produced.
+
+    Each batch is indexed once with `index_masks`, so a mask costs a dict lookup per batch rather than a scan of the batch.
+    Args:
+        batches: (iterable) lists or DataFrames of mapview rows, e.g. `iter_mapview_batches`
+        file_path: (str) path of the csv file
+        masks: (list) (mask type, name) tuples, see `read_mask_file`
+        layout: (str) 'per-mask' writes a csv per mask named by `mask_file_path`, 'long' writes every mask to file_path
+            with mask_type and mask columns in front of the mapview columns
+        file_format: (str) one of `columnar.FORMATS`, see `write_csv_batches`
+    Returns:
+        A (rows matched, rows written per mask) tuple.
+    """
+    masks = list(dict.fromkeys(masks))
+    if layout == 'long':
+        writers = {mask: columnar.open_writer(file_path, ['mask_type', 'mask'] + OUTPUT_COLUMNS, file_format=file_format)
+                   for mask in masks[:1]}
+        writers.update({mask: writers[masks[0]] for mask in masks[1:]})
+    else:
+        writers = {mask: columnar.open_writer(mask_file_path(file_path, mask), OUTPUT_COLUMNS, file_format=file_format)
+                   for mask in masks}
+    rows_matched = 0
+    rows_written = Counter()
+    try:
+        for batch in batches:
+            df = pd.DataFrame(batch, columns=OUTPUT_COLUMNS)
+            df.index = range(rows_matched, rows_matched + len(batch))
+            rows_matched += len(batch)
+            index = index_masks(df)
+            for mask in masks:
+                rows = df.iloc[index.get(mask, [])]
+                rows_written[mask] += len(rows)
+                if layout == 'long':
+                    rows.insert(0, 'mask', mask[1])
+                    rows.insert(0, 'mask_type', mask[0])
+                writers[mask].write(rows)
+    finally:
+        for writer in dict.fromkeys(writers.values()):
+            writer.close()
+    return rows_matched, rows_written
+
+
+def as_list(value):
+    """Returns the values of an option that may be unset, a single value or repeated."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def connect(ini_file, concurrency=1, rate_limit=None, retries=None, query_timeout=None, token_cache=None):
+    """Creates the Looker SDK of an ini file behind a `scheduler.RequestScheduler`.
+
+    Args:
+        ini_file: (str) path of the ini file
+        concurrency: (int) number of threads calling the API, the size of the connection pool
+        rate_limit: (float) optional maximum number of calls per second
+        retries: (int) number of retries of a transient error, defaults to 4
+        query_timeout: (float) optional seconds a call may take
+        token_cache: (TokenCache) optional store of the API token of the last run
+    Returns:
+        The RequestScheduler, the SDK itself is its sdk attribute.
+    """
+    looker = looker_sdk.init31(config_file=ini_file)
+    sdk_session.configure_session(looker, pool_size=concurrency)
+    restored = token_cache is not None and token_cache.restore(looker)
+    if restored:
+        logger.success('reusing the api token of the last run')
+    return scheduler.RequestScheduler(
+        looker, concurrency=concurrency, rate=rate_limit,
+        retries=4 if retries is None else retries, timeout=query_timeout, token_cache=token_cache if restored else None)
+
+
+def index_project(project_repo, cache_dir=None, parse_workers=1):
+    """Builds the LookmlIndex of a project folder, parsing only the files that changed since they were cached in cache_dir."""
+    lookml_stats = Counter()
+    parse_cache = lookml_cache.LookmlCache(
+        cache_dir, project_repo) if cache_dir is not None else None
+    project = lookml_index.LookmlIndex.from_path(
+        project_repo, cache=parse_cache, stats=lookml_stats, workers=parse_workers)
+    if parse_cache is not None:
+        parse_cache.close()
+    logger.success(
+        f'indexed {len(project.files)} lookml files, {lookml_stats["lookml_cache_hits"]} from the cache and {lookml_stats["lookml_cache_misses"]} parsed')
+    return project
+
+
 # @snoop
 def main(**kwargs):
     cwd = Path.cwd()
@@ -357,54 +1041,129 @@ def main(**kwargs):
     logger.success(f'your project repo is at {project_repo}')
     file_path = kwargs.get("path")
     logger.success(f'your output file is at {file_path}')
-    table_mask = kwargs.get("table")
-    field_mask = kwargs.get("field")
+    masks = [('table', table) for table in as_list(kwargs.get("table"))] + \
+        [('field', field) for field in as_list(kwargs.get("field"))]
+    if kwargs.get("mask_file"):
+        masks += read_mask_file(kwargs.get("mask_file"))
+    masks = list(dict.fromkeys(masks))
+    table_mask = masks[0][1] if len(masks) == 1 and masks[0][0] == 'table' else None
+    field_mask = masks[0][1] if len(masks) == 1 and masks[0][0] == 'field' else None
+    concurrency = kwargs.get("concurrency") or 1
+    parse_workers = kwargs.get("parse_workers") or 1
+    page_size = kwargs.get("page_size") or 5000
+    batch_size = kwargs.get("batch_size") or 1000
+    use_cache = not kwargs.get("no_cache")
+    engine = kwargs.get("engine") or 'python'
+    offline = bool(kwargs.get("offline"))
+    file_format = kwargs.get("format") or 'csv'
 
     create_df.check_ini(ini_file)
 
-    sdk = looker_sdk.init31(config_file=ini_file)
-
-    project = lookml.Project(
-        path=project_repo
-    )
-
-    content_results = get_dashboards(sdk)
-    db_response = get_sql_from_elements(sdk, content_results)
-    explore_results = fetch_view_files(proj=project)
-    sql_table_names = get_sql_table_name(proj=project)
-
-    combine = match_view_to_dash(
-        db_response, explore_results, sql_table_names, proj=project)
-    for element in range(0, len(combine)):
-        match_join_per_query(combine[element])
-        match_views_per_query(combine[element], project)
-        find_unused_views(combine[element])
-
-    df = pd.DataFrame(combine)
-
-    if table_mask == None and field_mask == None:
+    cache_dir = kwargs.get("cache_dir") or sql_cache.DEFAULT_CACHE_DIR
+    token_cache = sdk_session.TokenCache(
+        Path(cache_dir) / 'tokens.json') if use_cache else None
+    sdk = connect(ini_file, concurrency=concurrency, rate_limit=kwargs.get("rate_limit"),
+                  retries=kwargs.get("retries"), query_timeout=kwargs.get("query_timeout"), token_cache=token_cache)
+    project = index_project(project_repo, cache_dir=cache_dir if use_cache else None, parse_workers=parse_workers)
+
+    if use_cache and not offline:
+        cache = sql_cache.SqlCache(
+            cache_dir=cache_dir,
+            base_url=sdk.auth.settings.base_url,
+            max_age_days=kwargs.get("cache_max_age") or 30,
+            max_size_mb=kwargs.get("cache_max_size") or 256,
+            refresh=bool(kwargs.get("refresh_cache")))
+    else:
+        cache = None
+
+    if not masks:
         logger.success('you have not set any field or table filters')
-
-        df.to_csv(f'{file_path}')
-        logger.success(df)
-
     elif table_mask != None:
         logger.success(f'your table filter = {table_mask}')
-
-        mask = df['used_view_names'].apply(lambda x: table_mask in x)
-        df = df[mask]
-        df.to_csv(f'{file_path}')
-
-        logger.success(df)
-
     elif field_mask != None:
         logger.success(f'your field filter = {field_mask}')
-
-        mask = df['fields_used'].apply(lambda x: field_mask in x)
-        df = df[mask]
-        df.to_csv(f'{file_path}')
-
-        logger.success(df)
+    else:
+        logger.success(f'your {len(masks)} filters = {masks}')
+
+    if offline:
+        logger.success(
+            'offline mode, views are resolved from the fields of each element without fetching its sql')
+
+    state_path = kwargs.get("state") or f'{file_path}.checkpoint'
+    if not kwargs.get("state") and not kwargs.get("resume") and Path(state_path).exists():
+        Path(state_path).unlink()
+    state = run_state.RunState(state_path, state_fingerprint(
+        project, all_sql_table_names=kwargs.get("all_sql_table_names"), offline=offline), resume=bool(kwargs.get("resume")))
+    if state.resuming:
+        logger.success(
+            f'resuming the run checkpointed in {state_path} after dashboard element {state.last_element_id()}')
+    elif kwargs.get("resume"):
+        logger.success(
+            f'there is no unfinished run in {state_path} to resume, starting a new run')
+    if kwargs.get("state"):
+        logger.success(
+            f'incremental run {state.run}, rows of unchanged elements are read from {state_path}')
+
+    fetch_stats = Counter()
+    unresolved = []
+    batches = iter_mapview_batches(
+        sdk, project, page_size=page_size, batch_size=batch_size, concurrency=concurrency,
+        parse_workers=parse_workers, cache=cache, stats=fetch_stats,
+        all_sql_table_names=bool(kwargs.get("all_sql_table_names")), engine=engine, masks=masks,
+        offline=offline, unresolved=unresolved, state=state)
+    store = None
+    if kwargs.get("sqlite"):
+        store = lineage_store.LineageStore(kwargs.get("sqlite"))
+        store.reset(project.model_explore_joins)
+        batches = store_batches(batches, store)
+    if len(masks) > 1:
+        layout = kwargs.get("mask_output") or 'per-mask'
+        rows_matched, rows_written = write_mask_csv_batches(
+            batches, file_path, masks, layout=layout, file_format=file_format)
+    else:
+        rows_matched, rows_written = write_csv_batches(
+            batches, file_path, table_mask=table_mask, field_mask=field_mask, file_format=file_format)
+    if cache is not None:
+        cache.close()
+    if token_cache is not None:
+        token_cache.save(sdk.sdk)
+    if store is not None:
+        logger.success(
+            f'stored the lineage of {store.meta()["elements"]} dashboard elements in {kwargs.get("sqlite")}, see lmanage query')
+        store.close()
+    state.close()
+    if kwargs.get("state"):
+        logger.success(
+            f'reused the rows of {fetch_stats["elements_reused"]} unchanged dashboard elements and dropped {fetch_stats["elements_deleted"]} deleted ones')
+    else:
+        Path(state_path).unlink()
+
+    if offline:
+        if unresolved:
+            logger.wtf(
+                f'{len(unresolved)} dashboard elements use fields no view of their explore declares, e.g. elements {unresolved[:20]}')
+    else:
+        logger.success(
+            f'fetched sql for {fetch_stats["api_calls"]} distinct queries ({fetch_stats["cache_hits"]} more from the cache), saved {fetch_stats["api_calls_saved"]} api calls and {fetch_stats["parses_saved"]} sql parses')
+        logger.success(
+            f'{sdk.stats["retries"]} api calls retried, concurrency ended at {sdk.limiter.limit} of {concurrency}')
+        if fetch_stats["fetch_failed_permanent"]:
+            logger.wtf(
+                f'{fetch_stats["fetch_failed_permanent"]} queries are broken, their elements have sql_joins No Content')
+        if fetch_stats["fetch_failed_transient"]:
+            logger.wtf(
+                f'{fetch_stats["fetch_failed_transient"]} queries could not be fetched after {sdk.retries} retries, their elements have sql_joins {FETCH_FAILED} and are retried by the next run')
+    logger.success(
+        f'skipped {fetch_stats["elements_pruned"]} dashboard elements that are not on an explore of the project or cannot match the filters')
+    if len(masks) > 1:
+        for mask in masks:
+            output = file_path if layout == 'long' else mask_file_path(
+                file_path, mask)
+            logger.success(
+                f'wrote {rows_written[mask]} of {rows_matched} dashboard elements for {mask[0]} {mask[1]} to {output}')
+    else:
+        logger.success(
+            f'wrote {rows_written} of {rows_matched} dashboard elements to {file_path}')
 
 
 if __name__ == "__main__":
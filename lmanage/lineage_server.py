@@ -0,0 +1,301 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import pandas as pd
+from lmanage import get_content_with_views
+from lmanage.utils import create_df
+from lmanage.utils import lookml_index
+from lmanage.utils import sdk_session
+from lmanage.utils import sql_cache
+from coloredlogger import ColoredLogger
+
+logger = ColoredLogger()
+
+# lookup kinds of the API, /<kind>/<name>
+LOOKUPS = {'tables': 'table', 'fields': 'field', 'dashboards': 'dashboard'}
+
+
+class Snapshot():
+    """The mapview rows of every dashboard element, with inverted indexes answering each lookup with dict reads.
+
+    A snapshot is not changed once built, a refresh builds a new one and swaps it in, so requests never wait for a refresh.
+    Args:
+        rows: (iterable) mapview rows, e.g. the batches of `get_content_with_views.iter_mapview_batches` chained
+    """
+
+    def __init__(self, rows):
+        self.rows = []
+        for row in rows:
+            row = {column: row[column]
+                   for column in get_content_with_views.OUTPUT_COLUMNS}
+            row['fields_used'] = get_content_with_views.element_fields(
+                row['fields_used'])
+            self.rows.append(row)
+        self.positions = get_content_with_views.index_masks(pd.DataFrame({
+            'used_view_names': [row['used_view_names'] for row in self.rows],
+            'fields_used': [json.dumps(row['fields_used']) for row in self.rows]}))
+        for position, row in enumerate(self.rows):
+            self.positions[('dashboard', str(row['dashboard_id']))].append(position)
+        self.built_at = datetime.now().isoformat(timespec='seconds')
+
+    def lookup(self, kind, name):
+        """Returns the rows of the elements that use the view (table), field or are on the dashboard name."""
+        return [self.rows[position] for position in self.positions.get((kind, name), [])]
+
+
+class LineageService():
+    """Keeps the LookML index and the lineage of every dashboard element in memory and up to date.
+
+    The project folder is polled for changed files, which are parsed again (through the LookML cache) and the rows rematched.
+    Rows are also refreshed on request and every refresh_interval seconds, to pick up new dashboards. Refreshes read query SQL
+    from the SQL cache, so after the first one they make the System Activity calls and fetch only new queries.
+    Args:
+        project_path: (str) root folder of the LookML project
+        sdk: Looker SDK object, e.g. from `get_content_with_views.connect`
+        cache_dir: (str) optional folder of the LookML and SQL caches, None disables both
+        parse_workers: (int) number of processes parsing LookML files and query SQL
+        concurrency: (int) number of queries fetched at the same time
+        page_size: (int) number of dashboard elements requested per System Activity call
+        batch_size: (int) number of dashboard elements fetched and matched together
+        offline: (bool) resolve views from the fields of each element instead of fetching its SQL
+    """
+
+    def __init__(self, project_path, sdk, cache_dir=None, parse_workers=1, concurrency=1, page_size=5000, batch_size=1000,
+                 offline=False):
+        self.project_path = project_path
+        self.sdk = sdk
+        self.cache_dir = cache_dir
+        self.parse_workers = parse_workers
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.offline = offline
+        self.project = None
+        self.signature = None
+        self.snapshot = Snapshot([])
+        self.stats = Counter()
+        self.refresh_requested = threading.Event()
+        self.refreshing = False
+        self.last_refresh = None
+        if cache_dir is not None and not offline:
+            self.cache = sql_cache.SqlCache(
+                cache_dir=cache_dir, base_url=sdk.auth.settings.base_url)
+        else:
+            self.cache = None
+
+    def project_signature(self):
+        """Lists the path, modification time and size of every LookML file of the project, which changes with any edit."""
+        signature = []
+        for file_path, lookml_path in lookml_index.project_files(self.project_path):
+            stat = os.stat(file_path)
+            signature.append((lookml_path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load_project(self):
+        """Indexes the LookML project, the signature is read first so edits made while parsing are seen by the next poll."""
+        self.signature = self.project_signature()
+        self.project = get_content_with_views.index_project(
+            self.project_path, cache_dir=self.cache_dir, parse_workers=self.parse_workers)
+
+    def refresh(self):
+        """Matches every dashboard element to the current index and swaps in the new rows."""
+        self.refreshing = True
+        start = time.monotonic()
+        stats = Counter()
+        try:
+            batches = get_content_with_views.iter_mapview_batches(
+                self.sdk, self.project, page_size=self.page_size, batch_size=self.batch_size, concurrency=self.concurrency,
+                parse_workers=self.parse_workers, cache=self.cache, stats=stats, offline=self.offline)
+            self.snapshot = Snapshot(chain.from_iterable(batches))
+        finally:
+            self.refreshing = False
+            if self.cache is not None:
+                self.cache.commit()
+        self.last_refresh = time.monotonic()
+        self.stats.update(stats)
+        self.stats['refreshes'] += 1
+        logger.success(
+            f'matched {len(self.snapshot.rows)} dashboard elements in {self.last_refresh - start:.1f}s, fetched sql for {stats["api_calls"]} queries and {stats["cache_hits"]} from the cache')
+
+    def poll(self, refresh_interval=None):
+        """Runs one check of the service loop, reindexing the project if a file changed and refreshing the rows if needed.
+
+        Returns:
+            True when the rows were refreshed.
+        """
+        changed = self.project_signature() != self.signature
+        if changed:
+            logger.success(
+                f'lookml files of {self.project_path} changed, indexing them again')
+            self.load_project()
+        due = refresh_interval is not None and self.last_refresh is not None and \
+            time.monotonic() - self.last_refresh >= refresh_interval
+        if changed or due or self.refresh_requested.is_set():
+            self.refresh_requested.clear()
+            self.refresh()
+            return True
+        return False
+
+    def run(self, poll_interval=2, refresh_interval=None, stop=None):
+        """Polls the project and refreshes the rows until stop is set, waking up early when a refresh is requested."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.refresh_requested.wait(poll_interval)
+            try:
+                self.poll(refresh_interval=refresh_interval)
+            except Exception as error:
+                logger.wtf(
+                    f'refresh failed, still serving the rows of {self.snapshot.built_at}: {error}')
+
+    def lookup(self, kind, name):
+        """Answers a table, field or dashboard lookup with the rows of the elements it finds."""
+        rows = self.snapshot.lookup(kind, name)
+        return {kind: name, 'elements': rows, 'count': len(rows)}
+
+    def health(self):
+        return {'status': 'ok',
+                'lookml_files': len(self.project.files) if self.project is not None else 0,
+                'elements': len(self.snapshot.rows),
+                'built_at': self.snapshot.built_at,
+                'refreshing': self.refreshing,
+                'refreshes': self.stats['refreshes']}
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+
+class LineageHandler(BaseHTTPRequestHandler):
+    """Answers GET /tables/<view>, /fields/<view.field>, /dashboards/<id> and /health, and POST /refresh with JSON."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body are separate writes, without TCP_NODELAY the body of each keep-alive reply waits for a delayed ack
+        self.disable_nagle_algorithm = isinstance(self.client_address, tuple)
+        super().setup()
+
+    def address_string(self):
+        # clients of a unix socket have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        body = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self):
+        return [unquote(part) for part in urlsplit(self.path).path.strip('/').split('/')]
+
+    def do_GET(self):
+        service = self.server.service
+        parts = self.route()
+        if parts == ['health']:
+            self.reply(200, service.health())
+        elif len(parts) == 2 and parts[0] in LOOKUPS:
+            self.reply(200, service.lookup(LOOKUPS[parts[0]], parts[1]))
+        else:
+            self.reply(404, {'error': f'unknown path {self.path}, use /tables/<view>, /fields/<view.field>, '
+                                      f'/dashboards/<id> or /health'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.route() == ['refresh']:
+            self.server.service.refresh_requested.set()
+            self.reply(202, {'status': 'refresh requested'})
+        else:
+            self.reply(404, {'error': f'unknown path {self.path}'})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None):
+    """Creates the HTTP server of a LineageService, on a unix socket readable only by its owner when socket_path is set."""
+    if socket_path is not None:
+        if Path(socket_path).exists():
+            Path(socket_path).unlink()
+        # the socket is created by bind, so it is restricted by the umask before any client can connect
+        umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(str(socket_path), LineageHandler)
+        finally:
+            os.umask(umask)
+    else:
+        server = ThreadingHTTPServer((host, port), LineageHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(**kwargs):
+    project_repo = kwargs.get("project")
+    ini_file = kwargs.get("ini_file")
+    use_cache = not kwargs.get("no_cache")
+    cache_dir = (kwargs.get("cache_dir") or sql_cache.DEFAULT_CACHE_DIR) if use_cache else None
+    concurrency = kwargs.get("concurrency") or 1
+    create_df.check_ini(ini_file)
+
+    token_cache = sdk_session.TokenCache(
+        Path(cache_dir) / 'tokens.json') if use_cache else None
+    sdk = get_content_with_views.connect(
+        ini_file, concurrency=concurrency, rate_limit=kwargs.get("rate_limit"), retries=kwargs.get("retries"),
+        query_timeout=kwargs.get("query_timeout"), token_cache=token_cache)
+    service = LineageService(
+        project_repo, sdk, cache_dir=cache_dir, parse_workers=kwargs.get("parse_workers") or 1, concurrency=concurrency,
+        page_size=kwargs.get("page_size") or 5000, batch_size=kwargs.get("batch_size") or 1000,
+        offline=bool(kwargs.get("offline")))
+    service.load_project()
+    service.refresh()
+    if token_cache is not None:
+        token_cache.save(sdk.sdk)
+
+    socket_path = kwargs.get("socket")
+    server = make_server(service, host=kwargs.get("host") or '127.0.0.1',
+                         port=kwargs.get("port", 8765), socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = socket_path or f'http://{server.server_address[0]}:{server.server_address[1]}'
+    logger.success(
+        f'serving lineage lookups on {address}, e.g. /tables/<view>, /fields/<view.field>, /dashboards/<id>')
+    refresh_minutes = kwargs.get("refresh_interval")
+    try:
+        service.run(poll_interval=kwargs.get("poll_interval") or 2,
+                    refresh_interval=refresh_minutes * 60 if refresh_minutes else None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+        if socket_path is not None and Path(socket_path).exists():
+            Path(socket_path).unlink()
+        logger.success('stopped serving lineage lookups')
@@ -0,0 +1,57 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import sys
+import pandas as pd
+from lmanage import get_content_with_views
+from lmanage.utils import lineage_store
+from coloredlogger import ColoredLogger
+
+logger = ColoredLogger()
+
+
+def query_lookups(**kwargs):
+    """Returns the (kind, name) lookups of the query options, see `LineageStore.elements`."""
+    lookups = []
+    for kind in lineage_store.LOOKUPS:
+        lookups += [(kind, name) for name in get_content_with_views.as_list(kwargs.get(kind))]
+    return list(dict.fromkeys(lookups))
+
+
+def main(**kwargs):
+    lookups = query_lookups(**kwargs)
+    file_path = kwargs.get("path")
+    store = lineage_store.LineageStore(kwargs.get("db"))
+    try:
+        if kwargs.get("explores"):
+            views = [name for kind, name in lookups if kind == 'table']
+            explores = store.explores(views)
+            for model, explore in explores:
+                print(f'{model}::{explore}')
+            return explores
+
+        rows = store.elements(lookups)
+        df = pd.DataFrame(rows, columns=get_content_with_views.OUTPUT_COLUMNS)
+        if not file_path:
+            # stdout only gets the csv, so it can be piped
+            df.to_csv(sys.stdout)
+            return rows
+        df.to_csv(file_path)
+        logger.success(
+            f'wrote the {len(rows)} dashboard elements on {df["dashboard_id"].nunique()} dashboards matching {lookups} '
+            f'to {file_path}, from the lineage stored on {store.meta().get("built_at")}')
+        return rows
+    finally:
+        store.close()
@@ -0,0 +1,191 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import numpy as np
+import pandas as pd
+
+FORMATS = ('csv', 'parquet', 'arrow', 'jsonl')
+# mapview columns holding a list of names, fields_used holds the JSON of one
+LIST_COLUMNS = ['sql_joins', 'fields_used', 'sql_table_name', 'potential_join', 'used_joins', 'used_view_names',
+                'unused_joins']
+# sql_joins of an element without SQL, e.g. 'No Content', which a list column cannot hold
+SQL_ERROR = 'sql_error'
+
+
+def as_list(value):
+    """Returns the list of a list column value, fields_used JSON is decoded, None for anything else."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return None
+
+
+def native_columns(df):
+    """Converts a batch of mapview rows to columns of native values, with list columns as lists, for formats that are not csv.
+
+    The sql_joins of an element without SQL, e.g. 'No Content', moves to a sql_error column next to it.
+    Returns:
+        A dict of column -> list of values.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column].tolist()
+        if column in LIST_COLUMNS:
+            columns[column] = [as_list(value) for value in values]
+        else:
+            columns[column] = values
+        if column == 'sql_joins':
+            columns[SQL_ERROR] = [value if isinstance(value, str) else None for value in values]
+    return columns
+
+
+def native_rows(df):
+    """Converts a batch of mapview rows to dicts of native values, see `native_columns`.
+
+    For example:
+        {'fields_used': '["users.id"]', 'sql_joins': 'No Content', ...}
+        -> {'fields_used': ['users.id'], 'sql_joins': None, 'sql_error': 'No Content', ...}
+    """
+    columns = native_columns(df)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def native_value(value):
+    # numpy scalars of pandas records are not serializable by json
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class CsvWriter():
+    """Writes batches to a csv, the header first and then each batch appended with its index."""
+
+    def __init__(self, file_path, columns):
+        self.file_path = file_path
+        pd.DataFrame(columns=columns).to_csv(f'{file_path}')
+
+    def write(self, df):
+        df.to_csv(f'{self.file_path}', mode='a', header=False)
+
+    def close(self):
+        pass
+
+
+class JsonlWriter():
+    """Writes one JSON object per row, with the list columns as arrays."""
+
+    def __init__(self, file_path, columns):
+        self.file = open(file_path, 'w', encoding='utf-8')
+
+    def write(self, df):
+        for row in native_rows(df):
+            self.file.write(json.dumps(row, default=native_value) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter():
+    """Writes each batch as a row group of a Parquet file or a record batch of an Arrow IPC file.
+
+    Names (views, tables, fields, dashboard ids) are dictionary encoded and list columns are lists of them. The dictionary
+    of each column grows across batches, so an Arrow file holds one dictionary per column extended by deltas.
+    Args:
+        file_path: (str) path of the file
+        columns: (list) columns of the rows, `native_rows` adds sql_error after sql_joins
+        file_format: (str) 'parquet' or 'arrow'
+    """
+
+    def __init__(self, file_path, columns, file_format):
+        try:
+            import pyarrow as pa
+            import pyarrow.compute
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                f'writing {file_format} files needs pyarrow, install it with pip install pyarrow or use --format csv or jsonl')
+        self.pa = pa
+        names = pa.dictionary(pa.int32(), pa.string())
+        fields = []
+        for column in columns:
+            if column == 'element_id':
+                fields.append(pa.field(column, pa.int64()))
+            elif column in LIST_COLUMNS:
+                fields.append(pa.field(column, pa.list_(names)))
+            else:
+                fields.append(pa.field(column, names))
+            if column == 'sql_joins':
+                fields.append(pa.field(SQL_ERROR, names))
+        self.schema = pa.schema(fields)
+        self.dictionaries = {field.name: {} for field in fields}
+        if file_format == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(str(file_path), self.schema)
+        else:
+            self.writer = pa.ipc.new_file(str(file_path), self.schema,
+                                          options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def encode(self, column, values):
+        """Dictionary encodes a string array against the running dictionary of column.
+
+        The array is encoded by pyarrow and only its distinct values are looked up in the running dictionary.
+        """
+        pa = self.pa
+        encoded = values.dictionary_encode()
+        codes = self.dictionaries[column]
+        mapping = pa.array([codes.setdefault(value, len(codes)) for value in encoded.dictionary.to_pylist()],
+                           type=pa.int32())
+        return pa.DictionaryArray.from_arrays(
+            pa.compute.take(mapping, encoded.indices), pa.array(list(codes), type=pa.string()))
+
+    def write(self, df):
+        if df.empty:
+            return
+        pa = self.pa
+        columns = native_columns(df)
+        arrays = []
+        for field in self.schema:
+            values = columns[field.name]
+            if field.name == 'element_id':
+                # System Activity may return ids as strings, the sqlite store coerces them the same way
+                arrays.append(pa.array([int(value) for value in values], type=pa.int64()))
+            elif field.name in LIST_COLUMNS:
+                lists = pa.array(values, type=pa.list_(pa.string()))
+                arrays.append(pa.ListArray.from_arrays(
+                    lists.offsets, self.encode(field.name, lists.flatten()), mask=lists.is_null()))
+            else:
+                # NaN, e.g. a column pandas filled in, is null like None
+                arrays.append(self.encode(field.name, pa.array(
+                    [None if value is None or value != value else str(value) for value in values], type=pa.string())))
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(file_path, columns, file_format='csv'):
+    """Opens a writer of mapview batches for file_format, one of FORMATS, each batch is written with its write method."""
+    if file_format == 'csv':
+        return CsvWriter(file_path, columns)
+    if file_format == 'jsonl':
+        return JsonlWriter(file_path, columns)
+    if file_format in ('parquet', 'arrow'):
+        return ArrowWriter(file_path, columns, file_format)
+    raise ValueError(f'unknown format {file_format}, use one of {", ".join(FORMATS)}')
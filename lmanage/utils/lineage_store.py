@@ -0,0 +1,183 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from lmanage.utils.lookml_index import normalize_table_name
+
+# columns of the elements table holding a list, stored as JSON
+LIST_COLUMNS = ['sql_joins', 'sql_table_name', 'potential_join', 'used_joins', 'used_view_names', 'unused_joins']
+ELEMENT_COLUMNS = ['element_id', 'dashboard_id', 'sql_joins', 'fields_used', 'sql_table_name', 'potential_join',
+                   'used_joins', 'used_view_names', 'unused_joins']
+# lookup kind -> (link table, column), every column has an index
+LOOKUPS = {
+    'table': ('element_views', 'view_name'),
+    'sql_table': ('element_tables', 'table_name'),
+    'field': ('element_fields', 'field_name'),
+    'dashboard': ('elements', 'dashboard_id')}
+encode_list = json.JSONEncoder(check_circular=False, separators=(',', ':')).encode
+
+
+def as_json_list(value):
+    """Stores a list column as JSON, the markers of elements without SQL ('No Content', 'Fetch Failed') as they are."""
+    return encode_list(value) if isinstance(value, list) else value
+
+
+def from_json_list(value):
+    if isinstance(value, str) and value.startswith('['):
+        return json.loads(value)
+    return value
+
+
+class LineageStore():
+    """Mapview rows in a SQLite file, normalized so reverse dependency questions are answered with index lookups.
+
+    Besides the rows themselves (elements), each element is linked to the views it uses (element_views), the tables its
+    SQL reads (element_tables) and its fields (element_fields), and the joins of every explore of the project are kept in
+    explore_joins. Each link table is indexed on the view, table or field, so finding the elements that use one costs an
+    index seek instead of a scan of every row and a parse of its list columns.
+    Args:
+        path: (str) path of the SQLite file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS elements (
+                element_id INTEGER PRIMARY KEY,
+                dashboard_id TEXT,
+                sql_joins TEXT,
+                fields_used TEXT,
+                sql_table_name TEXT,
+                potential_join TEXT,
+                used_joins TEXT,
+                used_view_names TEXT,
+                unused_joins TEXT);
+            CREATE TABLE IF NOT EXISTS element_views (
+                element_id INTEGER NOT NULL, view_name TEXT NOT NULL, PRIMARY KEY (element_id, view_name)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS element_tables (
+                element_id INTEGER NOT NULL, table_name TEXT NOT NULL, PRIMARY KEY (element_id, table_name)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS element_fields (
+                element_id INTEGER NOT NULL, field_name TEXT NOT NULL, PRIMARY KEY (element_id, field_name)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS explore_joins (
+                model TEXT NOT NULL, explore TEXT NOT NULL, position INTEGER NOT NULL, view_name TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS elements_dashboard_id ON elements (dashboard_id);
+            CREATE INDEX IF NOT EXISTS element_views_view_name ON element_views (view_name);
+            CREATE INDEX IF NOT EXISTS element_tables_table_name ON element_tables (table_name);
+            CREATE INDEX IF NOT EXISTS element_fields_field_name ON element_fields (field_name);
+            CREATE INDEX IF NOT EXISTS explore_joins_view_name ON explore_joins (view_name);''')
+
+    def reset(self, model_explore_joins):
+        """Empties the store for a new run and writes the joins of every explore, see `LookmlIndex.model_explore_joins`."""
+        for table in ['elements', 'element_views', 'element_tables', 'element_fields', 'explore_joins']:
+            self.conn.execute(f'DELETE FROM {table}')
+        self.conn.executemany('INSERT INTO explore_joins VALUES (?, ?, ?, ?)', [
+            (model, explore, position, view_name)
+            for (model, explore), views in model_explore_joins.items()
+            for position, view_name in enumerate(views)])
+        self.conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+            ('built_at', datetime.now().isoformat(timespec='seconds')), ('elements', '0')])
+        self.conn.commit()
+
+    def put_rows(self, rows):
+        """Stores a batch of mapview rows and their links, in one transaction.
+
+        Args:
+            rows: (list) mapview rows or a DataFrame of them, e.g. a batch of `iter_mapview_batches`
+        """
+        # imported here, get_content_with_views imports this module
+        from lmanage.get_content_with_views import element_fields
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict('records')
+        elements, views, tables, fields = [], [], [], []
+        for row in rows:
+            element_id = int(row['element_id'])
+            elements.append(tuple(
+                [element_id, str(row['dashboard_id']), as_json_list(row['sql_joins']), row['fields_used']] +
+                [as_json_list(row[column]) for column in ELEMENT_COLUMNS[4:]]))
+            views.extend((element_id, view) for view in dict.fromkeys(
+                row['used_view_names'] if isinstance(row['used_view_names'], list) else []))
+            tables.extend((element_id, table) for table in dict.fromkeys(
+                normalize_table_name(table) for table in (row['sql_joins'] if isinstance(row['sql_joins'], list) else [])))
+            fields.extend((element_id, field) for field in dict.fromkeys(element_fields(row['fields_used'])))
+        # links of an element stored before are replaced, the primary key of each link table starts with element_id
+        element_ids = [(element[0],) for element in elements]
+        for table in ['element_views', 'element_tables', 'element_fields']:
+            self.conn.executemany(f'DELETE FROM {table} WHERE element_id = ?', element_ids)
+        self.conn.executemany(
+            f'INSERT OR REPLACE INTO elements VALUES ({", ".join("?" * len(ELEMENT_COLUMNS))})', elements)
+        self.conn.executemany('INSERT INTO element_views VALUES (?, ?)', views)
+        self.conn.executemany('INSERT INTO element_tables VALUES (?, ?)', tables)
+        self.conn.executemany('INSERT INTO element_fields VALUES (?, ?)', fields)
+        self.conn.execute("UPDATE meta SET value = (SELECT COUNT(*) FROM elements) WHERE key = 'elements'")
+        self.conn.commit()
+
+    def element_ids(self, kind, names):
+        """Returns the sorted ids of the elements that use any of the views, tables or fields, or are on the dashboards, names."""
+        table, column = LOOKUPS[kind]
+        names = [normalize_table_name(name) for name in names] if kind == 'sql_table' else [str(name) for name in names]
+        if not names:
+            return []
+        return [element_id for (element_id,) in self.conn.execute(
+            f'SELECT DISTINCT element_id FROM {table} WHERE {column} IN ({", ".join("?" * len(names))}) ORDER BY element_id',
+            names)]
+
+    def elements(self, lookups):
+        """Returns the rows of the elements matching any lookup, with their list columns decoded.
+
+        Args:
+            lookups: (list) (kind, name) tuples, kind is one of table (a view name), sql_table, field or dashboard
+        Returns:
+            A list of mapview rows ordered by element id.
+            For example:
+            [('table', 'users')] -> [{'dashboard_id': '1', 'element_id': 3, ..., 'used_view_names': ['events', 'users'], ...}]
+        """
+        element_ids = set()
+        for kind in LOOKUPS:
+            element_ids.update(self.element_ids(kind, [name for lookup_kind, name in lookups if lookup_kind == kind]))
+        element_ids = sorted(element_ids)
+        rows = []
+        for start in range(0, len(element_ids), 500):
+            chunk = element_ids[start:start + 500]
+            for values in self.conn.execute(
+                    f'SELECT {", ".join(ELEMENT_COLUMNS)} FROM elements WHERE element_id IN ({", ".join("?" * len(chunk))}) '
+                    f'ORDER BY element_id', chunk):
+                row = dict(zip(ELEMENT_COLUMNS, values))
+                for column in LIST_COLUMNS:
+                    row[column] = from_json_list(row[column])
+                rows.append(row)
+        return rows
+
+    def explores(self, views):
+        """Returns the (model, explore) of every explore joining any of views, sorted."""
+        views = list(views)
+        if not views:
+            return []
+        return self.conn.execute(
+            f'SELECT DISTINCT model, explore FROM explore_joins WHERE view_name IN ({", ".join("?" * len(views))}) '
+            f'ORDER BY model, explore', views).fetchall()
+
+    def meta(self):
+        return dict(self.conn.execute('SELECT key, value FROM meta'))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
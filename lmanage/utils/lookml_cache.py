@@ -0,0 +1,75 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+# bump when the records produced by `lookml_index.index_text` change shape, so older entries are parsed again
+INDEX_VERSION = 7
+
+
+class LookmlCache():
+    """On disk store of the metadata `lookml_index.index_text` extracts from each file of a LookML project.
+
+    Entries are keyed by (project, path) and hold the sha1 of the file content they were parsed from,
+    so on later runs only files whose content changed are parsed again.
+    Args:
+        cache_dir: (str) folder holding the cache file
+        project: (str) root folder of the LookML project, entries of other projects are kept apart
+    """
+
+    def __init__(self, cache_dir, project):
+        self.project = os.path.abspath(str(project))
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.path = Path(cache_dir).joinpath('lookml_files.sqlite')
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS lookml_files (
+                project TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                record TEXT NOT NULL,
+                PRIMARY KEY (project, path))''')
+
+    def get(self, lookml_path, content_hash):
+        """Returns the cached record of a file or None if the file is not cached or its content changed."""
+        row = self.conn.execute(
+            'SELECT record FROM lookml_files WHERE project = ? AND path = ? AND content_hash = ? AND version = ?',
+            (self.project, lookml_path, content_hash, INDEX_VERSION)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, lookml_path, content_hash, record):
+        """Stores the record parsed from a file, replacing the record of an earlier version of the file."""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO lookml_files VALUES (?, ?, ?, ?, ?)',
+            (self.project, lookml_path, content_hash, INDEX_VERSION, json.dumps(record)))
+
+    def prune(self, lookml_paths):
+        """Drops the entries of files that are no longer in the project and commits."""
+        keep = set(lookml_paths)
+        stale = [(self.project, path) for (path,) in self.conn.execute(
+            'SELECT path FROM lookml_files WHERE project = ?', (self.project,)) if path not in keep]
+        self.conn.executemany(
+            'DELETE FROM lookml_files WHERE project = ? AND path = ?', stale)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
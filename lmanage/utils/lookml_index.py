@@ -0,0 +1,700 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import os
+import re
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from lookml import lkml
+from lmanage.utils import parsing_sql
+
+# ${view.SQL_TABLE_NAME} references to other derived tables
+SQL_TABLE_NAME_REF = re.compile(r'\$\{\s*(\w+)\.SQL_TABLE_NAME\s*\}', re.IGNORECASE)
+# liquid tags and other substitutions that are not SQL
+TEMPLATE = re.compile(r'\{%.*?%\}|\{\{.*?\}\}|\$\{[^}]*\}', re.DOTALL)
+CTE_NAME = re.compile(r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s+AS\s*\(', re.IGNORECASE)
+# LookML SQL that can read a table of its own, e.g. a subquery in a dimension or a sql_on
+SQL_READS = re.compile(r'\b(?:from|join)\b|\bSQL_TABLE_NAME\b', re.IGNORECASE)
+# parameters of view fields and of explores and joins whose SQL ends up in the queries of an explore
+FIELD_TYPES = ('dimensions', 'dimension_groups', 'measures', 'filters', 'parameters')
+FIELD_SQL = ('sql', 'sql_start', 'sql_end')
+EXPLORE_SQL = ('sql_always_where', 'sql_always_having')
+JOIN_SQL = ('sql_on', 'sql_where', 'sql')
+# tables Looker persists derived tables in, e.g. looker_scratch.LR$5B6HE1587138455880_user_facts
+PDT_TABLE = re.compile(r'^l[a-z][$_][a-z0-9]+_(\w+)$')
+
+# what a view reads: upstream views, normalized physical tables, and whether every dependency was found in the project
+Lineage = namedtuple('Lineage', ['views', 'tables', 'complete'])
+
+
+def normalize_table_name(name):
+    """Normalizes a sql_table_name so it compares equal to the tables returned by `parsing_sql.extract_tables`.
+
+    Args:
+        name: (str) sql_table_name of a view or a table found in Looker generated SQL
+    Returns:
+        The name stripped of whitespace, double quotes and backticks and lower cased.
+        For example:
+        '"PUBLIC"."ORDER_ITEMS"' -> 'public.order_items'
+    """
+    return name.strip().replace('"', '').replace('`', '').lower()
+
+
+def file_type(name):
+    """Returns the PyLookML file type of a LookML file name, 'model', 'manifest' or 'partial_model'."""
+    typ = name.split('.')[-2]
+    if typ in ('model', 'manifest'):
+        return typ
+    return 'partial_model'
+
+
+def explore_view_names(explore):
+    """Lists the base view and joined views of a parsed explore.
+
+    Mirrors `get_content_with_views.fetch_view_files` for a single explore.
+    Args:
+        explore: (dict) an explore as parsed by lkml
+    Returns:
+        A list of the view names available in the explore.
+        For example:
+        ['events', 'sessions', 'session_landing_page', 'events']
+    """
+    result = []
+    if 'view_name' not in explore and 'from' not in explore:
+        result.append(explore['name'])
+    if 'view_name' in explore:
+        result.append(explore['view_name'])
+    if 'from' in explore:
+        result.append(explore['from'])
+    for join in explore.get('joins', []):
+        result.append(join['name'])
+        if 'view_name' in join:
+            result.append(join['view_name'])
+        if 'from' in join:
+            result.append(join['from'])
+    return result
+
+
+def explore_aliases(explore):
+    """Maps the names fields of a parsed explore are referenced by to the views they come from.
+
+    The explore and each join are referenced by their own name, which is an alias when they are based on a view with from.
+    Args:
+        explore: (dict) an explore as parsed by lkml
+    Returns:
+        A dict of alias -> view name.
+        For example:
+        explore: orders { from: order_items join: buyers { from: users } } -> {'orders': 'order_items', 'order_items': 'order_items',
+        'buyers': 'users', 'users': 'users'}
+    """
+    aliases = {}
+    for item in [explore] + explore.get('joins', []):
+        view = item.get('from') or item.get('view_name') or item['name']
+        aliases.setdefault(item['name'], view)
+        aliases.setdefault(view, view)
+    return aliases
+
+
+def sql_sources(sqls):
+    """Lists the views and tables read by pieces of LookML SQL, the way `derived_table_sources` reads the sql of a derived table.
+
+    Args:
+        sqls: (iterable) SQL strings, None for parameters that are not set
+    Returns:
+        A dict of the views referenced with ${view.SQL_TABLE_NAME} and the normalized tables.
+        For example:
+        ['(SELECT COUNT(*) FROM public.orders WHERE orders.user_id = ${TABLE}.id)'] -> {'views': [], 'tables': ['public.orders']}
+    """
+    views = {}
+    tables = {}
+    for sql in sqls:
+        # most field SQL only reads columns of ${TABLE}, it is not tokenized
+        if not isinstance(sql, str) or not SQL_READS.search(sql):
+            continue
+        refs = SQL_TABLE_NAME_REF.findall(sql)
+        views.update(dict.fromkeys(refs))
+        skipped = {name.lower() for name in CTE_NAME.findall(sql)} | {view.lower() for view in refs}
+        sql = TEMPLATE.sub(' ', SQL_TABLE_NAME_REF.sub(lambda ref: ref.group(1), sql))
+        tables.update(dict.fromkeys(normalize_table_name(table)
+                                    for table in parsing_sql.extract_tables(sql) if table not in skipped))
+    return {'views': list(views), 'tables': list(tables)}
+
+
+def merge_sources(*sources):
+    """Merges `sql_sources` results, None stands for no sources."""
+    return {key: list(dict.fromkeys(name for source in sources if source for name in source[key]))
+            for key in ('views', 'tables')}
+
+
+def derived_table_sources(derived_table):
+    """Lists what a derived table is built from, as written in its LookML.
+
+    SQL derived tables read the tables named in their sql, with ${view.SQL_TABLE_NAME} references naming other views.
+    Native derived tables read the fields of the columns of their explore_source, a column without a field reads the field of
+    the explore named like the column.
+    Args:
+        derived_table: (dict) the derived_table of a view as parsed by lkml
+    Returns:
+        A dict of the views and normalized tables in the sql, and the explore and fields of an explore_source, or None when the
+        derived table has neither, e.g. one built by sql_create.
+        For example:
+        {'views': ['user_order_product'], 'tables': ['ecomm.products'], 'explore_source': None, 'fields': []}
+    """
+    sql = derived_table.get('sql')
+    explore_source = derived_table.get('explore_source')
+    if sql is None and explore_source is None:
+        return None
+    sources = sql_sources([sql])
+    fields = []
+    if explore_source is not None:
+        for column in explore_source.get('columns', []):
+            fields.append(column.get('field') or f'{explore_source["name"]}.{column["name"]}')
+    return {
+        'views': sources['views'],
+        'tables': sources['tables'],
+        'explore_source': explore_source['name'] if explore_source is not None else None,
+        'fields': fields}
+
+
+def explore_record(explore):
+    """Keeps the parameters of a parsed explore that decide which views it reads, see `explore_view_names`.
+
+    The tables its sql_on, sql_where and sql_always_where read besides the joined views are kept in sql_sources.
+    """
+    record = {key: explore[key] for key in (
+        'name', 'from', 'view_name', 'extends', 'extension') if key in explore}
+    record['joins'] = [{key: join[key] for key in ('name', 'from', 'view_name') if key in join}
+                       for join in explore.get('joins', [])]
+    record['sql_sources'] = sql_sources([explore.get(key) for key in EXPLORE_SQL] + [
+        join.get(key) for join in explore.get('joins', []) for key in JOIN_SQL])
+    return record
+
+
+def merge_explores(parent, child, name=None):
+    """Merges an explore over the explore it extends or refines, the way Looker does.
+
+    The child keeps its own from or view_name, or else reads from the base view of the parent. Joins of the parent come first,
+    a join of the child with the name of a parent join amends it, e.g. to point it at another view with from.
+    Args:
+        parent: (dict) explore record of the parent, already merged with its own parents
+        child: (dict) explore record of the extending explore or of the refinement
+        name: (str) name of the merged explore, defaults to the child's
+    Returns:
+        A new explore record.
+    """
+    merged = {'name': name or child['name']}
+    base = child if 'from' in child or 'view_name' in child else parent
+    for key in ('from', 'view_name'):
+        if key in base:
+            merged[key] = base[key]
+    if 'from' not in merged and 'view_name' not in merged:
+        merged['view_name'] = parent['name']
+    joins = {join['name']: dict(join) for join in parent.get('joins', [])}
+    for join in child.get('joins', []):
+        joins.setdefault(join['name'], {}).update(join)
+    merged['joins'] = list(joins.values())
+    merged['extends'] = list(child.get('extends', [])) if name is None else \
+        list(parent.get('extends', [])) + list(child.get('extends', []))
+    if 'extension' in child:
+        merged['extension'] = child['extension']
+    merged['sql_sources'] = merge_sources(parent.get('sql_sources'), child.get('sql_sources'))
+    return merged
+
+
+def merge_views(parent, child, name=None):
+    """Merges a view over the view it extends or refines, the child keeps its own sql_table_name or derived table if it has one."""
+    merged = dict(parent)
+    merged['name'] = name or child['name']
+    if child.get('sql_table_name') or child.get('derived_table'):
+        merged['sql_table_name'] = child.get('sql_table_name')
+        merged['derived_table'] = child.get('derived_table', False)
+        merged['derived_from'] = child.get('derived_from')
+    merged['extends'] = list(child.get('extends', [])) if name is None else \
+        list(parent.get('extends', [])) + list(child.get('extends', []))
+    merged['field_sources'] = merge_sources(parent.get('field_sources'), child.get('field_sources'))
+    return merged
+
+
+def refine(items, merge):
+    """Applies +refinements, in the order they are read, to the explores or views they refine.
+
+    Args:
+        items: (iterable) explore or view records, refinements are named with a leading +
+        merge: (callable) `merge_explores` or `merge_views`
+    Returns:
+        A dict of name -> refined record, the first declaration of a name wins. Refinements of names not declared stand for them.
+    """
+    declared = {}
+    refinements = []
+    for item in items:
+        if item['name'].startswith('+'):
+            refinements.append(item)
+        else:
+            declared.setdefault(item['name'], item)
+    for refinement in refinements:
+        name = refinement['name'][1:]
+        base = declared.get(name)
+        declared[name] = merge(base, refinement, name=name) if base is not None else dict(refinement, name=name)
+    return declared
+
+
+def resolve_extends(items, merge):
+    """Merges every explore or view with the ones it extends, in a single topological pass.
+
+    The extends graph is walked depth first without recursion, and each record is merged once and memoized, so a parent shared
+    by many children, or a long chain of layers, is not merged again for each record that reaches it. Parents missing from
+    items and extends cycles are left out.
+    Args:
+        items: (dict) name -> explore or view record with an optional extends list
+        merge: (callable) `merge_explores` or `merge_views`
+    Returns:
+        A dict of name -> merged record, in the order of items.
+    """
+    resolved = {}
+    for root in items:
+        stack = [(root, False)]
+        visiting = set()
+        while stack:
+            name, expanded = stack.pop()
+            if name in resolved or (not expanded and name in visiting):
+                continue
+            parents = [parent for parent in items[name].get('extends', []) if parent in items]
+            if not expanded:
+                visiting.add(name)
+                stack.append((name, True))
+                stack.extend((parent, False) for parent in reversed(parents)
+                             if parent not in resolved and parent not in visiting)
+                continue
+            merged = None
+            for parent in parents:
+                if parent in resolved:
+                    merged = resolved[parent] if merged is None else merge(merged, resolved[parent])
+            resolved[name] = dict(items[name]) if merged is None else merge(merged, items[name])
+            visiting.discard(name)
+    return {name: resolved[name] for name in items}
+
+
+def index_text(text, lookml_path):
+    """Parses the content of a LookML file and extracts the view and explore metadata used to match content to LookML.
+
+    Args:
+        text: (str) LookML content of the file
+        lookml_path: (str) path of the file relative to the project root
+    Returns:
+        A dict of plain python values describing the file.
+        For example:
+        {'path': 'views/01_order_items.view.lkml',
+         'type': 'partial_model',
+         'views': [{'name': 'order_items', 'sql_table_name': '`looker-private-demo.ecomm.order_items`',
+                    'derived_table': False, 'derived_from': None, 'extends': [],
+                    'field_sources': {'views': [], 'tables': []}}],
+         'explores': [],
+         'includes': ['/models/**/thelook.model.lkml']}
+    """
+    parsed = lkml.load(text)
+    return {
+        'path': lookml_path,
+        'type': file_type(os.path.basename(lookml_path)),
+        'views': [
+            {'name': view['name'],
+             'sql_table_name': view.get('sql_table_name'),
+             'derived_table': 'derived_table' in view,
+             'derived_from': derived_table_sources(view['derived_table']) if 'derived_table' in view else None,
+             'extends': view.get('extends', []),
+             'field_sources': sql_sources(
+                 field.get(key) for field_type in FIELD_TYPES for field in view.get(field_type, []) for key in FIELD_SQL)}
+            for view in parsed.get('views', [])],
+        'explores': [explore_record(explore) for explore in parsed.get('explores', [])],
+        'includes': parsed.get('includes', []),
+    }
+
+
+def index_file(path, lookml_path):
+    """Parses the LookML file at path with `index_text`."""
+    with open(path, encoding='utf-8') as lookml_file:
+        return index_text(lookml_file.read(), lookml_path)
+
+
+def index_texts(texts, lookml_paths, workers=1):
+    """Runs `index_text` over many files, in a pool of processes when workers is greater than 1.
+
+    Args:
+        texts: (list) LookML content of each file
+        lookml_paths: (list) path of each file relative to the project root
+        workers: (int) number of processes to parse with
+    Returns:
+        The record of each file, in the order of texts.
+    """
+    if workers > 1 and len(texts) > 1:
+        chunksize = max(1, len(texts) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(index_text, texts, lookml_paths, chunksize=chunksize))
+    return [index_text(text, lookml_path) for text, lookml_path in zip(texts, lookml_paths)]
+
+
+def content_hash(text):
+    """Returns the sha1 hex digest of the content of a LookML file."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def model_name(lookml_path):
+    """Returns the name Looker gives the model declared in a model file, e.g. 'models/thelook.model.lkml' -> 'thelook'."""
+    return os.path.basename(lookml_path)[:-len('.model.lkml')]
+
+
+def include_pattern(include, lookml_path):
+    """Compiles a LookML include into a regex over project relative paths.
+
+    Includes starting with / are relative to the project root, others to the folder of the including file. * matches within a
+    folder, ** across folders, and the .lkml extension may be left out as Looker allows. Includes of other projects (//) match nothing.
+    Args:
+        include: (str) value of an include parameter
+        lookml_path: (str) path of the including file relative to the project root
+    Returns:
+        A compiled regex, or None for includes of other projects.
+        For example:
+        '/views/**/*.view' matches 'views/01_order_items.view.lkml' and 'views/extra/users.view.lkml'
+    """
+    if include.startswith('//'):
+        return None
+    if include.startswith('/'):
+        include = include[1:]
+    else:
+        include = os.path.normpath(os.path.join(
+            os.path.dirname(lookml_path), include)).replace(os.sep, '/')
+    if not include.endswith(('.lkml', '.lookml')):
+        include += '.lkml'
+    pattern = ''
+    for token in re.split(r'(\*\*/|\*\*|\*|\?)', include):
+        if token == '**/':
+            pattern += '(?:.*/)?'
+        elif token == '**':
+            pattern += '.*'
+        elif token == '*':
+            pattern += '[^/]*'
+        elif token == '?':
+            pattern += '[^/]'
+        else:
+            pattern += re.escape(token)
+    return re.compile(pattern + r'\Z')
+
+
+def project_files(path):
+    """Lists the LookML files of a project folder as (path on disk, path relative to the project) tuples."""
+    response = []
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if name.endswith('.lkml'):
+                file_path = os.path.join(root, name)
+                response.append(
+                    (file_path, os.path.relpath(file_path, path)))
+    return sorted(response, key=lambda f: f[1])
+
+
+class LookmlIndex():
+    """Lookup tables over a LookML project, built once per run.
+
+    Replaces walking every file of the project for every dashboard element with dictionary lookups.
+    Args:
+        files: (list) per file metadata as returned by `index_file`
+    Attributes:
+        views_by_table: normalized sql_table_name -> names of the views reading from that table
+        view_files: view name -> LookML paths the view is declared in
+        model_explore_joins: (model, explore) -> views available in the explore, for every model file of the project and the
+            explores it includes, with refinements applied and the joins of the explores it extends merged in
+        model_explore_aliases: (model, explore) -> names fields of the explore are referenced by -> view name
+        model_explore_sources: (model, explore) -> views and tables read by the sql_on, sql_where and sql_always_where of the
+            explore, see `sql_sources`
+        explore_joins: explore name -> views available in the explore of the project's first model file
+        sql_table_names: every sql_table_name declared in the project
+        table_names: normalized sql_table_name -> sql_table_name as declared, for O(1) membership tests
+        view_tables: view name -> sql_table_name as declared, or inherited from a view it extends or a refinement
+        open_views: views whose tables cannot be read from the LookML, derived tables with neither sql nor explore_source
+            and views extending others without a sql_table_name of their own
+        derived_from: view name -> what its derived table is built from, see `derived_table_sources`
+        views_by_lower_name: lower cased view name -> view name, to find the view of a persistent derived table
+        view_sources: view name -> views and tables read by the SQL of its fields, e.g. a subquery in a dimension, for the views
+            whose fields read any
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.views_by_table = defaultdict(list)
+        self.view_files = defaultdict(list)
+        self.model_explore_joins = defaultdict(list)
+        self.model_explore_aliases = defaultdict(dict)
+        self.model_explore_sources = {}
+        self.explore_joins = defaultdict(list)
+        self.sql_table_names = []
+        self.table_names = {}
+        self.open_views = set()
+        self.view_tables = {}
+        self.derived_from = {}
+        self.view_sources = {}
+        self._reach = {}
+        self._lineage = {}
+        self._explores_by_name = defaultdict(list)
+
+        explore_files = []
+        for lookml_file in files:
+            for view in lookml_file['views']:
+                self.view_files[view['name'].lstrip('+')].append(lookml_file['path'])
+            if lookml_file['explores'] and lookml_file['type'] != 'model':
+                explore_files.append(lookml_file)
+        self.views_by_lower_name = {}
+        for name in self.view_files:
+            self.views_by_lower_name.setdefault(name.lower(), name)
+
+        views = resolve_extends(refine(
+            (view for lookml_file in files for view in lookml_file['views']), merge_views), merge_views)
+        for view in views.values():
+            if view['sql_table_name']:
+                self.sql_table_names.append(view['sql_table_name'])
+                table = normalize_table_name(view['sql_table_name'])
+                self.views_by_table[table].append(view['name'])
+                self.view_tables[view['name']] = view['sql_table_name']
+                self.table_names.setdefault(table, view['sql_table_name'])
+            elif view.get('derived_from') is not None:
+                self.derived_from[view['name']] = view['derived_from']
+            elif view.get('derived_table') or view.get('extends'):
+                self.open_views.add(view['name'])
+            sources = view.get('field_sources')
+            if sources and (sources['views'] or sources['tables']):
+                self.view_sources[view['name']] = sources
+
+        models = [f for f in files if f['type'] == 'model']
+        for model in models:
+            name = model_name(model['path'])
+            patterns = [pattern for pattern in (include_pattern(include, model['path'])
+                                                for include in model.get('includes', [])) if pattern is not None]
+            included = [f for f in explore_files if any(
+                pattern.match(f['path']) for pattern in patterns)]
+            explores = resolve_extends(refine(
+                (explore for lookml_file in [model] + included for explore in lookml_file['explores']),
+                merge_explores), merge_explores)
+            for explore in explores.values():
+                if explore.get('extension') == 'required':
+                    continue
+                self.model_explore_joins[(name, explore['name'])] = explore_view_names(explore)
+                self.model_explore_aliases[(name, explore['name'])] = explore_aliases(explore)
+                self.model_explore_sources[(name, explore['name'])] = explore.get('sql_sources')
+
+        for model, explore in self.model_explore_aliases:
+            self._explores_by_name[explore].append((model, explore))
+
+        if models:
+            name = model_name(models[0]['path'])
+            for explore in dict.fromkeys(explore['name'].lstrip('+') for explore in models[0]['explores']):
+                if (name, explore) in self.model_explore_joins:
+                    self.explore_joins[explore] = self.model_explore_joins[(name, explore)]
+
+    @classmethod
+    def from_path(cls, path, cache=None, stats=None, workers=1):
+        """Builds the index of the LookML project kept in the folder path.
+
+        Args:
+            path: (str) root folder of the LookML project
+            cache: (LookmlCache) optional on disk cache of parsed files, only files whose content changed are parsed
+            stats: (Counter) optional counter amended with lookml_cache_hits and lookml_cache_misses
+            workers: (int) number of processes the files missing from the cache are parsed with
+        """
+        files = []
+        misses = []
+        for file_path, lookml_path in project_files(path):
+            with open(file_path, encoding='utf-8') as lookml_file:
+                text = lookml_file.read()
+            digest = content_hash(text)
+            record = cache.get(lookml_path, digest) if cache is not None else None
+            if stats is not None:
+                stats['lookml_cache_hits' if record is not None else 'lookml_cache_misses'] += 1
+            if record is None:
+                misses.append((len(files), lookml_path, digest, text))
+            files.append(record)
+
+        records = index_texts([miss[3] for miss in misses], [
+                              miss[1] for miss in misses], workers=workers)
+        for (position, lookml_path, digest, text), record in zip(misses, records):
+            files[position] = record
+            if cache is not None:
+                cache.put(lookml_path, digest, record)
+        if cache is not None:
+            cache.prune([f['path'] for f in files])
+        return cls(files)
+
+    @classmethod
+    def from_project(cls, proj):
+        """Builds the index of a PyLookML project object."""
+        return cls(sorted(
+            [index_file(f.python_path, f.path) for f in proj.files()],
+            key=lambda f: f['path']))
+
+    def explore_views(self, model, explore):
+        """Returns the views available in an explore of a model, or None if the model has no such explore."""
+        return self.model_explore_joins.get((model, explore))
+
+    def view_sql_table_name(self, view):
+        """Returns the sql_table_name declared by a view, or None for derived tables and views not in the project."""
+        return self.view_tables.get(view)
+
+    def explore_reach(self, model, explore):
+        """Lists every view an element on an explore can end up in the used_view_names of.
+
+        The SQL of an explore reads the tables of its views, so the reach is the views of the explore, the views their derived
+        tables are built from, and every other view declared on the same tables. SQL of the explore's joins and of its views'
+        fields can read more tables, e.g. in a subquery, the views of those tables and the views it references are reached too.
+        When the explore reads a view whose lineage is not complete its SQL can read any table and the reach is unbounded.
+        Results are memoized per explore.
+        Args:
+            model: (str) model name, query.model
+            explore: (str) explore name, query.view
+        Returns:
+            A set of view names, or None when any view can be reached or the explore is not in the project.
+        """
+        key = (model, explore)
+        if key not in self._reach:
+            reach = set()
+            names = list(self.model_explore_joins.get(key) or [None])
+            sources = [self.model_explore_sources.get(key)] + [self.view_sources.get(name) for name in names]
+            for source in filter(None, sources):
+                names.extend(source['views'])
+                for table in source['tables']:
+                    names.extend(self.views_for_table(table))
+            for name in names:
+                lineage = self.view_lineage(name) if name is not None else None
+                if lineage is None or not lineage.complete:
+                    reach = None
+                    break
+                reach.add(name)
+                reach.update(lineage.views)
+            if reach is not None:
+                for table, views in self.views_by_table.items():
+                    if reach.intersection(views):
+                        reach.update(views)
+            self._reach[key] = reach
+        return self._reach[key]
+
+    def views_for_table(self, table):
+        """Returns the names of the views whose sql_table_name is table, or the view a persistent derived table is built for."""
+        views = self.views_by_table.get(normalize_table_name(table))
+        if views:
+            return views
+        view = self.pdt_view(table)
+        return [view] if view is not None else []
+
+    def pdt_view(self, table):
+        """Returns the view a table of the scratch schema persists, e.g. 'looker_scratch.LR$5B6HE1587138455880_user_facts' ->
+        'user_facts', or None when the table is not a persistent derived table of the project."""
+        match = PDT_TABLE.match(normalize_table_name(table).split('.')[-1])
+        if match is None:
+            return None
+        view = self.views_by_lower_name.get(match.group(1))
+        return view if view in self.derived_from else None
+
+    def explore_source_views(self, explore, fields):
+        """Resolves the fields of the columns of a native derived table to views, through the aliases of its explore_source.
+
+        Returns:
+            A (views, complete) tuple, complete is False when the explore or a field's view is not in the project.
+        """
+        keys = self._explores_by_name.get(explore)
+        if not keys:
+            return [], False
+        views = []
+        complete = True
+        for field in fields or [explore + '.']:
+            alias = field.split('.')[0]
+            found = [self.model_explore_aliases[key][alias]
+                     for key in keys if alias in self.model_explore_aliases[key]]
+            complete = complete and bool(found)
+            views.extend(found)
+        return list(dict.fromkeys(views)), complete
+
+    def _direct_lineage(self, view):
+        """The views and normalized tables a view reads directly, see `view_lineage`."""
+        if view in self.view_tables:
+            table = normalize_table_name(self.view_tables[view])
+            return [name for name in self.views_by_table[table] if name != view], [table], True
+        sources = self.derived_from.get(view)
+        if sources is None:
+            return [], [], view not in self.open_views
+        views = list(sources['views'])
+        complete = all(name in self.view_files for name in views)
+        if sources['explore_source'] is not None:
+            explore_views, explore_complete = self.explore_source_views(
+                sources['explore_source'], sources['fields'])
+            views.extend(explore_views)
+            complete = complete and explore_complete
+        for table in sources['tables']:
+            views.extend(self.views_by_table.get(table, []))
+        return list(dict.fromkeys(views)), list(sources['tables']), complete
+
+    def view_lineage(self, view):
+        """Lists everything a view reads from, through any number of derived tables.
+
+        The dependency graph is walked depth first once per view, without recursion, and the closure of every view visited is
+        memoized, so later lookups of the view or of any view upstream of it are dictionary reads. A view with a sql_table_name
+        reads its table, and shares it with the other views declared on it. A SQL derived table reads the tables in its sql and
+        the views it references with ${view.SQL_TABLE_NAME}, a native derived table the views of the fields of its columns.
+        Args:
+            view: (str) view name
+        Returns:
+            A Lineage of the upstream views, the normalized tables read, and complete, False when a derived table or a view
+            it depends on cannot be resolved in the project.
+            For example:
+            'affinity' -> Lineage(views=('user_order_product', 'total_order_product'),
+                                  tables=('ecomm.order_items', 'ecomm.inventory_items', 'ecomm.products'), complete=True)
+        """
+        if view in self._lineage:
+            return self._lineage[view]
+        stack = [(view, False)]
+        visiting = set()
+        while stack:
+            name, expanded = stack.pop()
+            if name in self._lineage:
+                continue
+            views, tables, complete = self._direct_lineage(name)
+            if not expanded:
+                visiting.add(name)
+                stack.append((name, True))
+                stack.extend((upstream, False) for upstream in reversed(views)
+                             if upstream not in self._lineage and upstream not in visiting)
+                continue
+            closure_views = {}
+            closure_tables = dict.fromkeys(tables)
+            for upstream in views:
+                closure_views[upstream] = None
+                # a view still being visited is part of a cycle, its closure is left out
+                lineage = self._lineage.get(upstream)
+                if lineage is not None:
+                    closure_views.update(dict.fromkeys(lineage.views))
+                    closure_tables.update(dict.fromkeys(lineage.tables))
+                    complete = complete and lineage.complete
+            closure_views.pop(name, None)
+            self._lineage[name] = Lineage(
+                tuple(closure_views), tuple(closure_tables), complete)
+            visiting.discard(name)
+        return self._lineage[view]
+
+    def lineage_sql_table_names(self, view):
+        """Returns the sql_table_names, as declared, of the tables in the lineage of a view."""
+        return [self.table_names[table] for table in self.view_lineage(view).tables if table in self.table_names]
+
+
+def build_index(proj):
+    """Returns proj if it is already a LookmlIndex, otherwise indexes the PyLookML project."""
+    if isinstance(proj, LookmlIndex):
+        return proj
+    return LookmlIndex.from_project(proj)
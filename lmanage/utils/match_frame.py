@@ -0,0 +1,202 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import numpy as np
+import pandas as pd
+from lmanage.utils import lookml_index
+
+
+def normalize_table_names(tables):
+    """`lookml_index.normalize_table_name` over a Series of table names, applied once per distinct name.
+
+    Returns:
+        A categorical Series of normalized names aligned with tables.
+    """
+    codes, names = pd.factorize(tables)
+    name_codes, normalized = pd.factorize(
+        pd.Series([lookml_index.normalize_table_name(name) for name in names], dtype=object))
+    return pd.Series(pd.Categorical.from_codes(
+        name_codes[codes], categories=normalized), index=tables.index)
+
+
+def explode_lists(df, column, name):
+    """Explodes a list column into one row per item, with the position of the item in its list.
+
+    Values of the column that are not lists (e.g. 'No Content') produce no rows.
+    Args:
+        df: (DataFrame) frame with a row column identifying each element
+        column: (str) name of the list column
+        name: (str) name of the item column in the response
+    Returns:
+        A long form DataFrame with row, pos and name columns.
+    """
+    lists = df[column].where(df[column].apply(
+        lambda x: isinstance(x, list)), None)
+    long = pd.DataFrame({'row': df['row'], name: lists}).explode(name)
+    long = long[long[name].notna()]
+    long['pos'] = long.groupby('row').cumcount()
+    return long.reset_index(drop=True)
+
+
+def collect_lists(long, column, rows):
+    """Groups a long form frame back into one list per element, in the order of the long frame.
+
+    The frame is stably sorted by row and split on the number of items per row, rather than aggregated group by group.
+    Args:
+        long: (DataFrame) long form frame sorted in the order items should appear
+        column: (str) item column to collect
+        rows: (Index) every element row, elements without items get an empty list
+    Returns:
+        A Series of lists indexed by row.
+    """
+    if len(rows) == 0:
+        return pd.Series([], index=rows, dtype=object)
+    long = long.sort_values('row', kind='stable')
+    values = long[column].to_numpy(dtype=object).tolist()
+    ends = np.cumsum(np.bincount(
+        long['row'].to_numpy(dtype=np.int64), minlength=len(rows))).tolist()
+    starts = [0] + ends[:-1]
+    return pd.Series([values[start:end] for start, end in zip(starts, ends)], index=rows)
+
+
+def with_occurrence(long, column, categories):
+    """Numbers repeated values of column within each element so multisets can be differenced with a merge."""
+    long = long[['row', column]].copy()
+    long[column] = pd.Categorical(long[column], categories=categories)
+    long['occurrence'] = long.groupby(['row', column], observed=True).cumcount()
+    return long
+
+
+def lineage_rows(long, column, lineage, existing, existing_column):
+    """Expands the items of each element to what lineage lists for them, the frame counterpart of `upstream_views`.
+
+    Args:
+        long: (DataFrame) long form frame with row and column, in the order items appear
+        column: (str) item column to expand
+        lineage: (callable) item -> list of upstream items, called once per distinct item
+        existing: (DataFrame) long form frame of the items elements already have, which are left out
+        existing_column: (str) item column of existing
+    Returns:
+        A long form DataFrame with row and item columns, in order of first appearance within each element.
+    """
+    distinct = long.drop_duplicates(['row', column])[['row', column]]
+    distinct['order'] = range(len(distinct))
+    upstream = pd.DataFrame(
+        [(name, position, item) for name in pd.unique(distinct[column])
+         for position, item in enumerate(lineage(name))],
+        columns=[column, 'lineage_pos', 'item']).astype({column: object, 'item': object})
+    expanded = distinct.astype({column: object}).merge(upstream, on=column, sort=False).sort_values(
+        ['order', 'lineage_pos'], kind='stable').drop_duplicates(['row', 'item'])
+    known = existing[['row', existing_column]].rename(
+        columns={existing_column: 'item'}).astype({'item': object}).drop_duplicates()
+    expanded = expanded[['row', 'item']].merge(
+        known, on=['row', 'item'], how='left', indicator=True)
+    return expanded.loc[expanded['_merge'] == 'left_only', ['row', 'item']]
+
+
+def match_frame(content_results, proj, all_sql_table_names=False):
+    """Vectorized alternative to running `match_view_to_dash`, `match_join_per_query`, `match_views_per_query`
+    and `find_unused_views` element by element.
+
+    sql_joins and potential_join are exploded into long form frames, joins are resolved to sql_table_names and views with
+    merges against the LookML index, the lineage of derived tables is appended per distinct view, and unused joins are the
+    multiset difference of potential and used views per element.
+    View and table names are held as categoricals. The response holds the same rows and values as the row by row path.
+    Args:
+        content_results: (list) response of `get_sql_from_elements`
+        proj: LookmlIndex of the project
+        all_sql_table_names: (bool) fill the sql_table_name column with every sql_table_name of the project
+    Returns:
+        A DataFrame with one row per element on an explore of the project.
+    """
+    index = lookml_index.build_index(proj)
+    content = pd.DataFrame(content_results, columns=[
+        'dashboard.id', 'dashboard_element.id', 'query.formatted_fields', 'query.model', 'query.view', 'sql_joins'])
+    explore_keys = list(zip(content['query.model'], content['query.view']))
+    content = content[np.array([key in index.model_explore_joins for key in explore_keys], dtype=bool)].reset_index(drop=True)
+    content['row'] = content.index
+    rows = content.index
+
+    # sql_joins -> used_joins and sql_table_name
+    joins = explode_lists(content, 'sql_joins', 'join')
+    joins['no_period'] = ~joins['join'].str.contains('.', regex=False)
+    joins['table'] = normalize_table_names(joins['join'])
+    declared = pd.DataFrame({'table': list(index.table_names),
+                             'declared': list(index.table_names.values())})
+    joins = joins.merge(declared, on='table', how='left', sort=False)
+    pdt_views = {join: index.pdt_view(join) for join in pd.unique(
+        joins.loc[joins['declared'].isna(), 'join'])}
+    joins['pdt'] = joins['join'].map(pdt_views)
+    joins['derived'] = joins['join'].where(joins['no_period'], joins['pdt'])
+
+    used_joins = pd.concat([
+        joins.loc[joins['no_period'], ['row', 'pos', 'join', 'no_period']].assign(step=0),
+        joins.loc[joins['declared'].notna() | joins['pdt'].notna(),
+                  ['row', 'pos', 'join', 'no_period']].assign(step=1)
+    ]).sort_values(['row', 'pos', 'step'], kind='stable')
+    matched_tables = joins[joins['declared'].notna()].sort_values(
+        ['row', 'pos'], kind='stable')
+    derived = joins[joins['derived'].notna()].sort_values(
+        ['row', 'pos'], kind='stable')
+    matched_tables = pd.concat([matched_tables[['row', 'declared']], lineage_rows(
+        derived, 'derived', index.lineage_sql_table_names, matched_tables, 'declared').rename(columns={'item': 'declared'})])
+
+    # used_joins -> used_view_names, bare joins first then the views of each distinct join
+    bare_views = used_joins.loc[used_joins['no_period'], ['row', 'join']].rename(
+        columns={'join': 'view'})
+    distinct_joins = used_joins.drop_duplicates(['row', 'join'])[['row', 'join']]
+    distinct_joins['order'] = range(len(distinct_joins))
+    views_by_join = pd.DataFrame(
+        [(join, view_pos, view) for join in pd.unique(distinct_joins['join'])
+         for view_pos, view in enumerate(index.views_for_table(join))],
+        columns=['join', 'view_pos', 'view']).astype({'join': object})
+    table_views = distinct_joins.merge(views_by_join, on='join', sort=False).sort_values(
+        ['order', 'view_pos'], kind='stable')[['row', 'view']]
+    used_views = pd.concat([bare_views, table_views]).sort_values(
+        'row', kind='stable')
+    used_views = pd.concat([used_views, lineage_rows(
+        used_views, 'view', lambda view: index.view_lineage(view).views, used_views, 'view').rename(
+        columns={'item': 'view'})]).sort_values('row', kind='stable')
+
+    # potential_join minus used_view_names -> unused_joins
+    explores = pd.DataFrame(
+        [(model, explore, view) for (model, explore), views in index.model_explore_joins.items()
+         for view in views],
+        columns=['query.model', 'query.view', 'view'])
+    potential = content[['row', 'query.model', 'query.view']].merge(
+        explores, on=['query.model', 'query.view'], sort=False).sort_values('row', kind='stable')
+    categories = pd.unique(pd.concat([potential['view'], used_views['view']]))
+    potential_long = with_occurrence(potential, 'view', categories)
+    used_long = with_occurrence(used_views, 'view', categories)
+    unused = potential_long.merge(
+        used_long, on=['row', 'view', 'occurrence'], how='left', indicator=True)
+    unused = unused[unused['_merge'] == 'left_only']
+    unused = unused.assign(view=unused['view'].astype(str)).sort_values(
+        ['row', 'view'], kind='stable')
+
+    response = pd.DataFrame({
+        'dashboard_id': content['dashboard.id'],
+        'element_id': content['dashboard_element.id'],
+        'sql_joins': content['sql_joins'],
+        'fields_used': content['query.formatted_fields'],
+        'sql_table_name': [index.sql_table_names] * len(content) if all_sql_table_names
+        else collect_lists(matched_tables, 'declared', rows),
+        'potential_join': pd.Series([index.model_explore_joins[key] for key in zip(content['query.model'], content['query.view'])],
+                                    index=rows, dtype=object),
+        'used_joins': collect_lists(used_joins, 'join', rows),
+        'used_view_names': collect_lists(used_views, 'view', rows),
+        'unused_joins': collect_lists(unused, 'view', rows),
+    }, index=rows)
+    return response
@@ -14,11 +14,24 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import itertools
+import re
 import sqlparse
 
 from sqlparse.sql import IdentifierList, Identifier
 from sqlparse.tokens import Keyword, DML
 
+TOKENS = re.compile(r"""
+    (?P<skip>--[^\n]*|/\*.*?\*/|'(?:[^'\\]|\\.|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<word>[\w$#@*{}]+(?:-[\w$#@*{}]+)*)
+  | (?P<punct>[.(),;])
+""", re.VERBOSE | re.DOTALL)
+
+CLAUSE_KEYWORDS = frozenset([
+    'SELECT', 'WHERE', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'OFFSET', 'FETCH',
+    'QUALIFY', 'WINDOW', 'UNION', 'INTERSECT', 'EXCEPT', 'MINUS', 'ON', 'USING',
+    'LEFT', 'RIGHT', 'INNER', 'FULL', 'CROSS', 'OUTER', 'NATURAL', 'JOIN'])
+
 
 def is_subselect(parsed):
     if not parsed.is_group:
@@ -59,7 +72,7 @@ def extract_table_identifiers(token_stream):
             yield value
 
 
-def extract_tables(sql):
+def extract_tables_sqlparse(sql):
     # let's handle multiple statements in one sql string
     extracted_tables = []
     statements = list(sqlparse.parse(sql))
@@ -86,6 +99,74 @@ def extract_tables(sql):
     return clean_table
 
 
+def extract_tables(sql):
+    """Lists the tables and CTEs a SQL string reads from, in a single pass over its tokens.
+
+    Tokens following FROM, JOIN or a comma of a FROM list are read as (dotted, quoted or backticked) table names.
+    A FROM counts only at the top level or inside a parenthesis opening a subquery, so EXTRACT(YEAR FROM x) is not a table.
+    A parenthesis right after FROM or JOIN opens a join group, e.g. FROM (a JOIN b ON a.id = b.id), whose tables are read.
+    Subqueries, table functions such as UNNEST(...) and the z__ aliases of Looker pivot wrappers are skipped.
+    Names are returned without double quotes and lower cased, the way `extract_tables_sqlparse` returns them.
+    Args:
+        sql: (str) Looker generated SQL, may hold several statements
+    Returns:
+        The distinct table names in order of appearance.
+        For example:
+        ['public.order_items', 'public.users', 'order_user_sequence_facts']
+    """
+    tokens = [(match.lastgroup, match.group())
+              for match in TOKENS.finditer(sql) if match.lastgroup != 'skip']
+    tables = {}
+    # one [is a query, in a FROM list] pair per open parenthesis
+    levels = [[True, False]]
+    expect_table = False
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        i += 1
+        if kind == 'punct':
+            if text == '(':
+                following = tokens[i][1].upper() if i < len(tokens) else ''
+                if expect_table and following not in ('SELECT', 'WITH'):
+                    # a join group, FROM (a JOIN b ON ...), opens on a table
+                    levels.append([True, True])
+                    continue
+                levels.append([following in ('SELECT', 'WITH'), False])
+                expect_table = False
+            elif text == ')':
+                if len(levels) > 1:
+                    levels.pop()
+                expect_table = False
+            elif text == ',':
+                expect_table = levels[-1][1]
+            elif text == ';':
+                levels = [[True, False]]
+                expect_table = False
+            continue
+
+        keyword = text.upper() if kind == 'word' else None
+        if keyword in ('FROM', 'JOIN'):
+            expect_table = levels[-1][0]
+            levels[-1][1] = keyword == 'FROM' and expect_table
+        elif expect_table and keyword in ('LATERAL', 'ONLY'):
+            continue
+        elif expect_table:
+            expect_table = False
+            name = [text]
+            while i + 1 < len(tokens) and tokens[i][1] == '.' and tokens[i + 1][0] != 'punct':
+                name.append(tokens[i + 1][1])
+                i += 2
+            if i < len(tokens) and tokens[i][1] == '(':
+                continue
+            table = '.'.join(name).replace('"', '').lower()
+            if not table.startswith('z__'):
+                tables[table] = None
+        elif keyword in CLAUSE_KEYWORDS:
+            levels[-1][1] = False
+
+    return list(tables)
+
+
 if __name__ == '__main__':
     sql = """WITH order_user_sequence_facts AS (select oi.user_id,oi.id as order_id,row_number() over(partition by oi.user_id order by oi.created_at asc ) as order_sequence,
         oi.created_at,
@@ -0,0 +1,125 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import sqlite3
+from pathlib import Path
+
+
+class RunState():
+    """Mapview rows of a previous run, kept so a later run only processes the dashboard elements that changed.
+
+    A Looker query is immutable, so editing a dashboard element gives it a new query id. A stored row is reused while the
+    element still has the query id it was computed from and the run has the same fingerprint, a digest of the LookML index
+    and of the options that shape the rows. A run with another fingerprint starts from an empty state.
+    Elements that are no longer in the inventory are dropped by `finish`.
+
+    Rows are committed batch by batch, along with the pages of inventory read so far, so the file is also the checkpoint of
+    a run in progress. Resuming a run that did not finish replays its inventory and carries on paging after the last element read.
+    Args:
+        path: (str) path of the state file
+        fingerprint: (str) digest of the LookML and options of the run
+        resume: (bool) carry on the unfinished run of the file instead of starting a new one
+    """
+
+    def __init__(self, path, fingerprint, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS elements (
+                element_id TEXT PRIMARY KEY,
+                query_id TEXT NOT NULL,
+                row TEXT NOT NULL,
+                run INTEGER NOT NULL)''')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS inventory (element_id INTEGER PRIMARY KEY, element TEXT NOT NULL)')
+        meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        same_lookml = meta.get('fingerprint') == fingerprint
+        self.resuming = resume and same_lookml and meta.get('complete') == '0'
+        if self.resuming:
+            self.run = int(meta['run'])
+        else:
+            self.run = int(meta.get('run', 0)) + 1
+            self.conn.execute('DELETE FROM inventory')
+        if not same_lookml:
+            self.conn.execute('DELETE FROM elements')
+        self.conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                              [('fingerprint', fingerprint), ('run', str(self.run)), ('complete', '0')])
+        self.conn.commit()
+        self._seen = []
+
+    def seen(self, element_ids):
+        """Marks elements as still in the inventory, so `finish` keeps their rows."""
+        self._seen.extend((self.run, str(element_id))
+                          for element_id in element_ids)
+
+    def add_page(self, elements):
+        """Checkpoints a page of inventory, committed with the rows of its first batch."""
+        self.conn.executemany('INSERT OR REPLACE INTO inventory VALUES (?, ?)',
+                              [(element['dashboard_element.id'], json.dumps(element)) for element in elements])
+
+    def pages(self, page_size):
+        """Replays the checkpointed inventory of the run being resumed in pages of page_size, ordered by element id."""
+        page = []
+        for (element,) in self.conn.execute('SELECT element FROM inventory ORDER BY element_id').fetchall():
+            page.append(json.loads(element))
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def last_element_id(self):
+        """Returns the id of the last checkpointed dashboard element, None when no inventory was read yet."""
+        return self.conn.execute('SELECT MAX(element_id) FROM inventory').fetchone()[0]
+
+    def get(self, element_id, query_id):
+        """Returns the stored row of an element if it was computed from query_id, otherwise None."""
+        row = self.conn.execute(
+            'SELECT row FROM elements WHERE element_id = ? AND query_id = ?',
+            (str(element_id), str(query_id))).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, element_id, query_id, row):
+        """Stores the row computed for an element from query_id."""
+        self.conn.execute('INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?)',
+                          (str(element_id), str(query_id), json.dumps(dict(row), default=int), self.run))
+
+    def commit(self):
+        """Writes the rows stored and elements seen since the last commit."""
+        self.conn.executemany(
+            'UPDATE elements SET run = ? WHERE element_id = ?', self._seen)
+        self._seen = []
+        self.conn.commit()
+
+    def finish(self):
+        """Drops the rows of elements that were not seen in this run's inventory and returns how many were dropped."""
+        self.commit()
+        deleted = self.conn.execute(
+            'DELETE FROM elements WHERE run != ?', (self.run,)).rowcount
+        self.conn.execute('DELETE FROM inventory')
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        self.conn.commit()
+        return deleted
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
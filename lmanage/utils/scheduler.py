@@ -0,0 +1,240 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+import looker_sdk
+
+# errors raised without an HTTP response, e.g. by requests, or with a body naming a transient status
+TRANSIENT_MESSAGE = re.compile(
+    r'timed? ?out|timeout|connection|temporar|too many requests|rate limit|'
+    r'bad gateway|service unavailable|gateway timeout|internal server error', re.IGNORECASE)
+
+
+class TransientError(looker_sdk.error.SDKError):
+    """Raised when a call still fails with a transient error (429, 5xx, timeout) after every retry."""
+
+
+def error_message(error):
+    """Returns the message of an SDKError, looker-sdk 0.1.x raises them without a message attribute."""
+    return getattr(error, 'message', None) or str(error)
+
+
+class TransportOptions(dict):
+    """Per call transport options, e.g. {'timeout': 60}.
+
+    looker-sdk 21 and later read them as a dict and 0.1.x by attribute, e.g. transport_options.timeout, so both work.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def is_transient(status, message):
+    """Decides whether a failed call is worth retrying.
+
+    Args:
+        status: (int) HTTP status of the response, None when no response was received
+        message: (str) message of the SDKError
+    Returns:
+        True for rate limiting, server errors, timeouts and connection errors.
+    """
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    return bool(TRANSIENT_MESSAGE.search(message or ''))
+
+
+class TokenBucket():
+    """Thread safe token bucket, `acquire` blocks until a call may be made so calls never exceed rate per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter():
+    """Caps the number of calls in flight and adapts the cap to the latency and errors observed (AIMD).
+
+    The cap halves when a call is throttled or fails transiently, drops by one when a call takes over slow_factor times the
+    fastest call seen, and grows by one after a full window of calls at the current cap succeed, up to max_limit.
+    Args:
+        max_limit: (int) ceiling of the cap, the number of threads calling
+        min_limit: (int) floor of the cap
+        slow_factor: (float) latency over the fastest call seen that counts as congestion
+    """
+
+    def __init__(self, max_limit, min_limit=1, slow_factor=3.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.slow_factor = slow_factor
+        self.baseline = None
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, congested=False):
+        with self.condition:
+            self.in_flight -= 1
+            if not congested:
+                self.baseline = latency if self.baseline is None else min(
+                    self.baseline, latency)
+            if congested:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.successes = 0
+            elif latency > self.slow_factor * self.baseline:
+                self.limit = max(self.min_limit, self.limit - 1)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class RequestScheduler():
+    """Proxy of a Looker SDK object that rate limits, retries and times out its API calls.
+
+    run_query and run_inline_query wait for the token bucket and the adaptive limiter, are given a timeout and are retried with
+    exponential backoff and jitter on 429, 5xx, timeouts and connection errors. Other SDKErrors are permanent and raised at once,
+    transient errors still failing after the last retry raise `TransientError`. Any other attribute is read from the SDK.
+    The HTTP status of a failed call is read from a response hook on the SDK's requests session, when it has one.
+    Args:
+        sdk: Looker SDK object
+        concurrency: (int) ceiling of the number of calls in flight, the number of threads calling
+        rate: (float) optional maximum number of calls per second
+        retries: (int) number of retries of a transient error
+        backoff: (float) seconds waited before the first retry, doubled for each further retry
+        max_backoff: (float) longest wait between retries
+        timeout: (float) optional seconds a call may take before it fails as a timeout
+        token_cache: (TokenCache) optional cache the SDK's token was restored from. A call rejected with 401, e.g. as the
+            token was revoked, drops the cached token and is retried once after logging in again
+    """
+
+    def __init__(self, sdk, concurrency=1, rate=None, retries=4, backoff=0.5, max_backoff=30, timeout=None, token_cache=None):
+        self.sdk = sdk
+        self.bucket = TokenBucket(rate) if rate else None
+        self.limiter = AdaptiveLimiter(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.stats = Counter()
+        self.token_cache = token_cache
+        self._restored_token = sdk.auth.token.access_token if token_cache is not None else None
+        self._token_lock = threading.Lock()
+        self._local = threading.local()
+        session = getattr(getattr(sdk, 'transport', None), 'session', None)
+        if session is not None:
+            session.hooks['response'].append(self._record_status)
+
+    def _record_status(self, response, *args, **kwargs):
+        self._local.status = response.status_code
+
+    def backoff_delay(self, attempt):
+        """Seconds to wait before retry number attempt + 1, with jitter so throttled threads do not retry in step."""
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+
+    def drop_restored_token(self):
+        """Forgets the token restored from the cache, once, so the SDK logs in again.
+
+        Returns:
+            True when the failed call may have used the restored token and is worth retrying.
+        """
+        if self.token_cache is None:
+            return False
+        with self._token_lock:
+            if self.sdk.auth.token.access_token == self._restored_token:
+                self.token_cache.forget(self.sdk)
+                self.stats['tokens_dropped'] += 1
+        return True
+
+    def call(self, method, **kwargs):
+        """Calls an SDK method under the rate limit, the concurrency cap, the timeout and the retry policy."""
+        try:
+            return self._call(method, **kwargs)
+        except looker_sdk.error.SDKError:
+            if getattr(self._local, 'status', None) != 401 or not self.drop_restored_token():
+                raise
+        return self._call(method, **kwargs)
+
+    def _call(self, method, **kwargs):
+        if self.timeout:
+            kwargs.setdefault('transport_options', TransportOptions(timeout=self.timeout))
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self.limiter.acquire()
+            self._local.status = None
+            start = time.monotonic()
+            try:
+                response = getattr(self.sdk, method)(**kwargs)
+            except looker_sdk.error.SDKError as error:
+                status = getattr(self._local, 'status', None)
+                transient = is_transient(status, error_message(error))
+                self.limiter.release(
+                    time.monotonic() - start, congested=transient)
+                if not transient:
+                    self.stats['permanent_errors'] += 1
+                    raise
+                self.stats['transient_errors'] += 1
+                last_error = error
+                if attempt < self.retries:
+                    self.stats['retries'] += 1
+                    time.sleep(self.backoff_delay(attempt))
+                continue
+            self.limiter.release(time.monotonic() - start)
+            return response
+        self.stats['gave_up'] += 1
+        raise TransientError(
+            f'{method} still failing after {self.retries} retries: {error_message(last_error)}')
+
+    def run_query(self, **kwargs):
+        return self.call('run_query', **kwargs)
+
+    def run_inline_query(self, **kwargs):
+        return self.call('run_inline_query', **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.sdk, name)
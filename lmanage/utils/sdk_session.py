@@ -0,0 +1,126 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+import looker_sdk
+from looker_sdk.rtl import auth_token
+from coloredlogger import ColoredLogger
+
+logger = ColoredLogger()
+
+# a cached token is not reused when it expires within this many seconds
+TOKEN_MARGIN = 60
+
+
+def configure_session(sdk, pool_size):
+    """Sizes the connection pool of the SDK's requests session to the number of threads calling the API.
+
+    requests keeps connections alive, but its default pool holds 10 connections per host, so with more threads than that
+    connections are closed after each call and every call pays for a new TCP and TLS handshake.
+    Args:
+        sdk: Looker SDK object
+        pool_size: (int) number of connections kept open to the Looker host
+    Returns:
+        The requests session, None when the SDK has no requests transport.
+    """
+    session = getattr(getattr(sdk, 'transport', None), 'session', None)
+    if session is None:
+        return None
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def access_token(sdk, **kwargs):
+    """Builds the AccessToken an AuthToken of sdk holds.
+
+    looker-sdk 21 and later declare it in auth_token, 0.1.x in the models of the API version its session logs in with.
+    """
+    model = getattr(auth_token, 'AccessToken', None) or getattr(
+        sdk.auth, 'token_model', None) or looker_sdk.models.AccessToken
+    return model(**kwargs)
+
+
+class TokenCache():
+    """File store of Looker API access tokens, so consecutive runs against an instance log in once per token lifetime.
+
+    Tokens are keyed by base url and client id, the client secret is never written. The file is only readable by its owner.
+    Args:
+        path: (str) path of the token file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _key(self, sdk):
+        config = sdk.auth.settings.read_config()
+        return hashlib.sha1(f'{sdk.auth.settings.base_url} {config.get("client_id")}'.encode('utf-8')).hexdigest()
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def restore(self, sdk):
+        """Gives the SDK a cached token of its instance and client id that is still valid, returns whether one was found."""
+        token = self._read().get(self._key(sdk))
+        if token is None:
+            return False
+        expires_in = int(token['expires_at'] - time.time())
+        if expires_in <= TOKEN_MARGIN:
+            return False
+        try:
+            sdk.auth.token = auth_token.AuthToken(access_token(
+                sdk, access_token=token['access_token'], token_type=token.get('token_type') or 'Bearer',
+                expires_in=expires_in))
+        except (AttributeError, TypeError, ValueError) as error:
+            # the SDK keeps its empty token, so its first call logs in
+            logger.wtf(f'could not reuse the cached Looker token, logging in again: {error}')
+            return False
+        return True
+
+    def save(self, sdk):
+        """Stores the current token of the SDK, if it logged in."""
+        token = sdk.auth.token
+        if not token.access_token or not token.is_active:
+            return
+        tokens = {key: value for key, value in self._read().items()
+                  if value['expires_at'] > time.time()}
+        tokens[self._key(sdk)] = {
+            'access_token': token.access_token,
+            'token_type': token.token_type,
+            'expires_at': token.expires_at.timestamp()}
+        self._write(tokens)
+
+    def forget(self, sdk):
+        """Drops the cached token of the SDK's instance and client id, e.g. once the API rejected it, and clears it from the SDK
+        so its next call logs in."""
+        tokens = self._read()
+        if tokens.pop(self._key(sdk), None) is not None:
+            self._write(tokens)
+        sdk.auth.token = auth_token.AuthToken()
+
+    def _write(self, tokens):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor = os.open(str(self.path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w') as token_file:
+            json.dump(tokens, token_file)
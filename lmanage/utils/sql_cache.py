@@ -0,0 +1,127 @@
+"""
+Copyright 2021 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+from coloredlogger import ColoredLogger
+logger = ColoredLogger()
+
+DEFAULT_CACHE_DIR = Path.home().joinpath('.lmanage', 'cache')
+COMMIT_EVERY = 500
+# bump when `parsing_sql.extract_tables` changes what it returns, so tables extracted by an older version are fetched again
+EXTRACTOR_VERSION = 3
+
+
+class SqlCache():
+    """On disk store of the SQL Looker generates for a query and the tables extracted from it.
+
+    A Looker query id is immutable, so once the SQL of a query has been fetched it can be reused across runs.
+    Entries are keyed by (base_url, query_id) and kept in a SQLite file in cache_dir. Entries whose tables were extracted by
+    another EXTRACTOR_VERSION are misses.
+    Entries older than max_age_days are evicted, and the least recently used entries are evicted once the cached
+    SQL grows over max_size_mb.
+    Args:
+        cache_dir: (str) folder holding the cache file
+        base_url: (str) base url of the Looker instance the query ids belong to
+        max_age_days: (float) entries fetched longer ago than this are dropped
+        max_size_mb: (float) upper bound on the size of the cached SQL text
+        refresh: (bool) ignore existing entries and overwrite them with freshly fetched SQL
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, base_url='', max_age_days=30, max_size_mb=256, refresh=False):
+        self.base_url = base_url
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.refresh = refresh
+        self._accessed = []
+        self._pending = 0
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.path = Path(cache_dir).joinpath('query_sql.sqlite')
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_sql (
+                base_url TEXT NOT NULL,
+                query_id TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                tables TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (base_url, query_id))''')
+        # caches written before entries were versioned, their entries are all misses
+        if 'version' not in [column[1] for column in self.conn.execute('PRAGMA table_info(query_sql)')]:
+            self.conn.execute('ALTER TABLE query_sql ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS query_sql_accessed_at ON query_sql (accessed_at)')
+        self.evict()
+
+    def get(self, query_id):
+        """Returns the cached (sql, tables) of a query or None if it is not cached."""
+        if self.refresh:
+            return None
+        row = self.conn.execute(
+            'SELECT sql, tables FROM query_sql WHERE base_url = ? AND query_id = ? AND version = ?',
+            (self.base_url, str(query_id), EXTRACTOR_VERSION)).fetchone()
+        if row is None:
+            return None
+        self._accessed.append((time.time(), self.base_url, str(query_id)))
+        return row[0], json.loads(row[1])
+
+    def put(self, query_id, sql, tables):
+        """Stores the SQL of a query and the tables extracted from it."""
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO query_sql VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.base_url, str(query_id), sql, json.dumps(tables), len(sql), now, now, EXTRACTOR_VERSION))
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """Writes pending entries and access times so other runs sharing the cache can read them."""
+        self.conn.executemany(
+            'UPDATE query_sql SET accessed_at = ? WHERE base_url = ? AND query_id = ?',
+            self._accessed)
+        self.conn.commit()
+        self._accessed = []
+        self._pending = 0
+
+    def evict(self):
+        """Drops entries older than max_age, then the least recently used entries until the cache fits in max_size."""
+        self.commit()
+        self.conn.execute('DELETE FROM query_sql WHERE created_at < ?',
+                          (time.time() - self.max_age,))
+        total = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM query_sql').fetchone()[0]
+        if total > self.max_size:
+            rows = self.conn.execute(
+                'SELECT base_url, query_id, size FROM query_sql ORDER BY accessed_at')
+            evicted = []
+            for base_url, query_id, size in rows:
+                if total <= self.max_size:
+                    break
+                evicted.append((base_url, query_id))
+                total -= size
+            self.conn.executemany(
+                'DELETE FROM query_sql WHERE base_url = ? AND query_id = ?', evicted)
+            logger.info(f'evicted {len(evicted)} queries from the sql cache')
+        self.commit()
+
+    def close(self):
+        self.evict()
+        self.conn.close()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from itertools import chain
+import pytest
+from lmanage import get_content_with_views as ipe
+from lmanage.utils import lineage_store
+
+
+@pytest.fixture
+def mapview_sdk(mocker):
+    """Returns a function making a mock SDK whose System Activity lists elements dashboard elements of the_look,
+    their query SQL reading one of three table sets. Elements in changed get another query id."""
+    def make(elements, changed=()):
+        sdk = mocker.Mock(spec=['run_inline_query', 'run_query'])
+        rows = [{'dashboard.id': element_id // 3,
+                 'dashboard_element.id': element_id,
+                 'query.model': 'thelook',
+                 'query.view': ['order_items', 'events', 'not_an_explore'][element_id % 3],
+                 'query.formatted_fields': f'["order_items.count", "users.id_{element_id % 5}"]',
+                 'query.id': element_id % 7 + (7 if element_id in changed else 0)} for element_id in range(elements)]
+        sdk.run_inline_query.side_effect = lambda result_format, body: json.dumps(
+            [row for row in rows
+             if row['dashboard_element.id'] > int(body.filters.get('dashboard_element.id', '>-1')[1:])][:int(body.limit)])
+        sdk.run_query.side_effect = lambda query_id, result_format: [
+            'SELECT 1 FROM `looker-private-demo.ecomm.order_items` AS order_items',
+            'SELECT 1 FROM `looker-private-demo.ecomm.events` AS events LEFT JOIN `looker-private-demo.ecomm.users` AS users ON 1=1',
+            'WITH test_ndt AS (SELECT 1) SELECT 1 FROM `looker-private-demo.ecomm.order_items` JOIN test_ndt ON 1=1'][query_id % 3]
+        return sdk
+    return make
+
+
+@pytest.fixture(scope='session')
+def project():
+    return ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+
+
+@pytest.fixture
+def rows(mapview_sdk, project):
+    return list(chain.from_iterable(ipe.iter_mapview_batches(
+        mapview_sdk(25), project, page_size=10, batch_size=4)))
+
+
+@pytest.fixture
+def store(tmp_path, rows, project):
+    store = lineage_store.LineageStore(tmp_path / 'lineage.db')
+    store.reset(project.model_explore_joins)
+    for start in range(0, len(rows), 4):
+        store.put_rows(rows[start:start + 4])
+    yield store
+    store.close()
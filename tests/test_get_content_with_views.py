@@ -14,11 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import pytest
 import pandas as pd
+from pathlib import Path
 import lmanage
-from collections import defaultdict
+from collections import Counter, defaultdict
+from itertools import chain
 import unittest
 import lookml
+import looker_sdk
 from lmanage import get_content_with_views as ipe
 
 
@@ -319,10 +324,12 @@ def test_get_sql_table_name(mocker):
 
 def test_get_sql_from_elements(mocker):
     sdk = MockSDK()
-    mocker.patch("lmanage.get_content_with_views.parse_sql")
+    mocker.patch("lmanage.get_content_with_views.fetch_sql")
+    mocker.patch("lmanage.utils.parsing_sql.extract_tables")
     sql_table_name = ['public.order_items',
                       'public.inventory_items', 'public.users', 'public.products']
-    lmanage.get_content_with_views.parse_sql.return_value = sql_table_name
+    lmanage.get_content_with_views.fetch_sql.return_value = 'SELECT 1'
+    lmanage.utils.parsing_sql.extract_tables.return_value = sql_table_name
     response = ipe.get_sql_from_elements(sdk, data)
     result = response[0]['sql_joins']
     assert isinstance(result, list)
@@ -330,6 +337,73 @@ def test_get_sql_from_elements(mocker):
     assert result == sql_table_name
 
 
+def test_get_sql_from_elements_concurrent(mocker):
+    sdk = MockSDK()
+    mocker.patch("lmanage.get_content_with_views.fetch_sql",
+                 side_effect=lambda sdk, qid: f'SELECT 1 FROM public.table_{qid}')
+    content_results = [{'query.id': qid} for qid in range(50)]
+    response = ipe.get_sql_from_elements(
+        sdk, content_results, concurrency=8)
+    assert [r['sql_joins'] for r in response] == [
+        [f'public.table_{qid}'] for qid in range(50)]
+
+
+def test_get_sql_from_elements_dedup(mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    sdk.run_query.side_effect = lambda query_id, result_format: {
+        1: 'SELECT 1 FROM public.order_items',
+        2: 'SELECT 1 FROM public.order_items',
+        3: 'SELECT 1 FROM public.users'}[query_id]
+    spy = mocker.spy(lmanage.utils.parsing_sql, "extract_tables")
+    content_results = [{'query.id': qid} for qid in [1, 1, 2, 3, 3, 3]]
+    stats = Counter()
+    response = ipe.get_sql_from_elements(sdk, content_results, stats=stats)
+    assert [r['sql_joins'] for r in response] == [
+        ['public.order_items']] * 3 + [['public.users']] * 3
+    assert response[0]['sql_joins'] is not response[1]['sql_joins']
+    assert sdk.run_query.call_count == 3
+    assert spy.call_count == 2
+    assert stats['api_calls'] == 3
+    assert stats['api_calls_saved'] == 3
+    assert stats['parses_saved'] == 1
+
+
+def test_get_sql_from_elements_parse_workers(mocker):
+    sdk = MockSDK()
+    sql_texts = [sql_file.read_text()
+                 for sql_file in sorted(Path('./tests/test_sql_files').glob('*.sql'))]
+    mocker.patch("lmanage.get_content_with_views.fetch_sql",
+                 side_effect=lambda sdk, qid: sql_texts[qid % len(sql_texts)])
+    serial = ipe.get_sql_from_elements(
+        sdk, [{'query.id': qid} for qid in range(40)])
+    parallel = ipe.get_sql_from_elements(
+        sdk, [{'query.id': qid} for qid in range(40)], parse_workers=3)
+    assert parallel == serial
+    assert serial[0]['sql_joins'] == ipe.parsing_sql.extract_tables(
+        sql_texts[0])
+
+
+def test_iter_mapview_batches_shares_parse_pool(mocker, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    serial = list(chain.from_iterable(ipe.iter_mapview_batches(
+        mapview_sdk(25), index, page_size=10, batch_size=4)))
+    pools = mocker.spy(ipe, 'ProcessPoolExecutor')
+    parallel = list(chain.from_iterable(ipe.iter_mapview_batches(
+        mapview_sdk(25), index, page_size=10, batch_size=4, parse_workers=2)))
+    assert parallel == serial
+    assert pools.call_count == 1
+
+
+def test_parse_sql_sdk_error(mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    sdk.run_query.side_effect = looker_sdk.error.SDKError('broken query')
+    test = ipe.parse_sql(sdk=sdk, qid=(777))
+    assert test == 'No Content'
+
+
 def test_get_dashboards(mocker):
     sdk = MockSDK()
     mocker.patch.object(sdk, "run_inline_query")
@@ -352,6 +426,52 @@ def test_get_dashboards(mocker):
     assert len(test[0]) == 10
 
 
+def test_iter_dashboard_pages(mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_inline_query")
+    rows = [{'dashboard.id': 1, 'dashboard_element.id': element_id,
+             'query.id': element_id} for element_id in range(1, 6)]
+    sdk.run_inline_query.side_effect = [
+        json.dumps(rows[0:2]), json.dumps(rows[2:4]), json.dumps(rows[4:])]
+    pages = ipe.iter_dashboard_pages(sdk=sdk, page_size=2)
+    assert next(pages) == rows[0:2]
+    assert sdk.run_inline_query.call_count == 1
+    assert list(pages) == [rows[2:4], rows[4:]]
+
+    bodies = [call.kwargs['body']
+              for call in sdk.run_inline_query.call_args_list]
+    assert [body.filters.get('dashboard_element.id') for body in bodies] == [
+        None, '>2', '>4']
+    assert all(body.sorts == ['dashboard_element.id'] for body in bodies)
+    assert all(body.limit == '2' for body in bodies)
+
+
+def test_get_dashboards_last_page_full(mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_inline_query")
+    rows = [{'dashboard_element.id': element_id}
+            for element_id in range(1, 5)]
+    sdk.run_inline_query.side_effect = [
+        json.dumps(rows[0:2]), json.dumps(rows[2:4]), '[]']
+    test = ipe.get_dashboards(sdk=sdk, page_size=2)
+    assert test == rows
+    assert sdk.run_inline_query.call_count == 3
+
+
+def test_get_sql_from_elements_across_pages(mocker):
+    sdk = MockSDK()
+    mocker.patch("lmanage.get_content_with_views.fetch_sql",
+                 return_value='SELECT 1 FROM public.users')
+    tables_per_query = {}
+    stats = Counter()
+    for page in [[{'query.id': 1}, {'query.id': 2}], [{'query.id': 2}, {'query.id': 3}]]:
+        ipe.get_sql_from_elements(
+            sdk, page, stats=stats, tables_per_query=tables_per_query)
+    assert lmanage.get_content_with_views.fetch_sql.call_count == 3
+    assert stats['api_calls_saved'] == 1
+    assert sorted(tables_per_query) == [1, 2, 3]
+
+
 def test_t_period_appearence(mocker):
     val = 'fliberrty.gibberty'
     test = ipe.test_period_appearence(val)
@@ -371,6 +491,19 @@ def test_match_join_per_query(mocker):
     assert test['used_joins'] == ['`looker-private-demo.ecomm.order_items`']
 
 
+def test_match_join_per_query_index(mocker):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    data = {'sql_joins': ['`looker-private-demo.ecomm.order_items`',
+                          '`LOOKER-PRIVATE-DEMO.ECOMM.USERS`',
+                          'public.not_modelled', 'test_ndt']}
+    test = ipe.match_join_per_query(data, index)
+    assert test['used_joins'] == ['`looker-private-demo.ecomm.order_items`',
+                                  '`LOOKER-PRIVATE-DEMO.ECOMM.USERS`', 'test_ndt']
+    assert test['sql_table_name'] == ['`looker-private-demo.ecomm.order_items`',
+                                      '`looker-private-demo.ecomm.users`']
+
+
 def test_match_views_per_query(mocker):
     data = match_data
     data['used_joins'] = ['`looker-private-demo.ecomm.order_items`']
@@ -413,3 +546,334 @@ def test_match_view_to_dash(mocker):
     assert len(test[0]) == 6
     assert isinstance(test[0]['fields_used'], str)
     assert test[0]['element_id'] == 1
+
+
+def test_write_csv_batches_matches_single_dataframe(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+
+    rows = list(chain.from_iterable(
+        ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=1000)))
+    assert len(rows) == 17
+    pd.DataFrame(rows, columns=ipe.OUTPUT_COLUMNS).to_csv(
+        tmp_path / 'expected.csv')
+
+    for page_size, batch_size, engine in [(10, 1, 'python'), (10, 4, 'python'), (100, 1000, 'python'),
+                                          (10, 4, 'pandas'), (100, 1000, 'pandas')]:
+        batches = ipe.iter_mapview_batches(
+            sdk, index, page_size=page_size, batch_size=batch_size, engine=engine)
+        test = ipe.write_csv_batches(batches, tmp_path / 'test.csv')
+        assert test == (17, 17)
+        assert (tmp_path / 'test.csv').read_text() == (tmp_path /
+                                                       'expected.csv').read_text()
+
+
+def test_write_csv_batches_filters(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=3)
+    test = ipe.write_csv_batches(
+        batches, tmp_path / 'test.csv', table_mask='users')
+    df = pd.read_csv(tmp_path / 'test.csv', index_col=0)
+    assert test == (17, len(df))
+    assert all('users' in views for views in df['used_view_names'])
+
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=3)
+    test = ipe.write_csv_batches(
+        batches, tmp_path / 'test.csv', field_mask='users.id_2')
+    df = pd.read_csv(tmp_path / 'test.csv', index_col=0)
+    assert test == (17, 3)
+    assert list(df.columns) == ipe.OUTPUT_COLUMNS
+
+
+def test_store_batches_writes_store_and_csv(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+
+    for engine in ['python', 'pandas']:
+        store = ipe.lineage_store.LineageStore(tmp_path / f'{engine}.db')
+        store.reset(index.model_explore_joins)
+        batches = ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=4, engine=engine)
+        test = ipe.write_csv_batches(ipe.store_batches(
+            batches, store), tmp_path / 'test.csv', table_mask='users')
+        df = pd.read_csv(tmp_path / 'test.csv', index_col=0)
+        assert test == (17, 5)
+        assert store.meta()['elements'] == '17'
+        assert [row['element_id'] for row in store.elements(
+            [('table', 'users')])] == list(df['element_id'])
+        store.close()
+
+
+def test_iter_mapview_batches_sql_table_name(mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(3)
+
+    rows = next(ipe.iter_mapview_batches(sdk, index))
+    assert rows[0]['sql_table_name'] == [
+        '`looker-private-demo.ecomm.order_items`']
+    assert rows[1]['sql_table_name'] == ['`looker-private-demo.ecomm.events`',
+                                         '`looker-private-demo.ecomm.users`']
+
+    rows = next(ipe.iter_mapview_batches(
+        sdk, index, all_sql_table_names=True))
+    assert rows[0]['sql_table_name'] is index.sql_table_names
+    assert rows[0]['used_joins'] == ['`looker-private-demo.ecomm.order_items`']
+
+
+def test_read_mask_file(tmp_path):
+    mask_file = tmp_path / 'masks.txt'
+    mask_file.write_text(
+        '# migration of ecomm\ntable: users\n\nfield:users.id_2\n')
+    assert ipe.read_mask_file(mask_file) == [
+        ('table', 'users'), ('field', 'users.id_2')]
+    mask_file.write_text('users\n')
+    with pytest.raises(ValueError):
+        ipe.read_mask_file(mask_file)
+
+
+def test_write_mask_csv_batches_matches_single_filters(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+    masks = [('table', 'users'), ('table', 'test_ndt'), ('field', 'users.id_2'),
+             ('field', 'users.id'), ('table', 'not_a_view')]
+
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=3)
+    rows_matched, rows_written = ipe.write_mask_csv_batches(
+        batches, tmp_path / 'mapview.csv', masks)
+    assert rows_matched == 17
+    assert rows_written[('field', 'users.id')] == 0
+    assert rows_written[('table', 'not_a_view')] == 0
+
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=3)
+    ipe.write_mask_csv_batches(
+        batches, tmp_path / 'long.csv', masks, layout='long')
+    long = pd.read_csv(tmp_path / 'long.csv', index_col=0)
+    assert list(long.columns) == ['mask_type', 'mask'] + ipe.OUTPUT_COLUMNS
+
+    for mask_type, name in masks:
+        batches = ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=3)
+        ipe.write_csv_batches(batches, tmp_path / 'single.csv',
+                              **{f'{mask_type}_mask': name})
+        expected = (tmp_path / 'single.csv').read_text()
+        test = ipe.mask_file_path(tmp_path / 'mapview.csv', (mask_type, name))
+        assert test.name == f'mapview_{mask_type}_{name}.csv'
+        assert test.read_text() == expected
+        assert rows_written[(mask_type, name)] == len(
+            pd.read_csv(tmp_path / 'single.csv'))
+        assert len(long[(long['mask_type'] == mask_type) & (
+            long['mask'] == name)]) == rows_written[(mask_type, name)]
+
+
+def test_iter_mapview_batches_prunes_before_fetching(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+    masks = [('field', 'users.id_2'), ('table', 'users')]
+
+    for mask_type, name in masks:
+        batches = ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=3)
+        ipe.write_csv_batches(batches, tmp_path / 'expected.csv',
+                              **{f'{mask_type}_mask': name})
+        expected = pd.read_csv(tmp_path / 'expected.csv', index_col=0)
+
+        sdk.run_query.reset_mock()
+        stats = Counter()
+        batches = ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=3, stats=stats, masks=[(mask_type, name)])
+        ipe.write_csv_batches(batches, tmp_path / 'test.csv',
+                              **{f'{mask_type}_mask': name})
+        test = pd.read_csv(tmp_path / 'test.csv', index_col=0)
+        assert test.to_dict('records') == expected.to_dict('records')
+        assert stats['elements_pruned'] > 0
+
+    assert sdk.run_query.call_count == stats['api_calls']
+
+
+def test_prune_keeps_tables_read_by_sql_on_and_dimensions(mocker, tmp_path):
+    (tmp_path / 'shop.view.lkml').write_text('''
+view: orders { sql_table_name: public.orders ;; dimension: user_count { sql: (SELECT COUNT(*) FROM public.users) ;; } }
+view: order_items { sql_table_name: public.order_items ;; }
+view: users { sql_table_name: public.users ;; }
+view: products { sql_table_name: public.products ;; }
+view: events { sql_table_name: public.events ;; }''')
+    (tmp_path / 'shop.model.lkml').write_text('''include: "*.view"
+explore: orders {}
+explore: events {}
+explore: order_items { join: orders { sql_on: ${order_items.order_id} = ${orders.id}
+  AND ${orders.id} IN (SELECT order_id FROM public.products) ;; relationship: many_to_one } }''')
+    index = ipe.lookml_index.LookmlIndex.from_path(tmp_path)
+    rows = [{'dashboard.id': 1, 'dashboard_element.id': element_id, 'query.model': 'shop', 'query.view': explore,
+             'query.formatted_fields': f'["{explore}.id"]', 'query.id': element_id}
+            for element_id, explore in enumerate(['orders', 'order_items', 'events'])]
+    sqls = ['SELECT (SELECT COUNT(*) FROM public.users) AS user_count FROM public.orders AS orders',
+            'SELECT 1 FROM public.order_items AS order_items LEFT JOIN public.orders AS orders '
+            'ON order_items.order_id = orders.id AND orders.id IN (SELECT order_id FROM public.products)',
+            'SELECT 1 FROM public.events AS events']
+    sdk = mocker.Mock(spec=['run_inline_query', 'run_query'])
+    sdk.run_inline_query.side_effect = lambda result_format, body: json.dumps(
+        [row for row in rows if row['dashboard_element.id'] > int(body.filters.get('dashboard_element.id', '>-1')[1:])])
+    sdk.run_query.side_effect = lambda query_id, result_format: sqls[query_id]
+
+    # order_items joins orders, whose dimension can read users, so it is fetched for users too
+    for name, element_ids, pruned in [('users', [0], 1), ('products', [1], 2)]:
+        expected = ipe.filter_rows(pd.DataFrame(list(chain.from_iterable(ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=3))), columns=ipe.OUTPUT_COLUMNS), table_mask=name)
+        stats = Counter()
+        test = ipe.filter_rows(pd.DataFrame(list(chain.from_iterable(ipe.iter_mapview_batches(
+            sdk, index, page_size=10, batch_size=3, stats=stats, masks=[('table', name)]))),
+            columns=ipe.OUTPUT_COLUMNS), table_mask=name)
+        assert list(expected['element_id']) == element_ids
+        assert test.to_dict('records') == expected.to_dict('records')
+        assert stats['elements_pruned'] == pruned
+
+
+def test_element_can_match():
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    element = {'query.model': 'thelook', 'query.view': 'kitten_order_items',
+               'query.formatted_fields': '["kitten_order_items.count", "users.id"]'}
+    assert ipe.element_can_match(element, index)
+    assert not ipe.element_can_match(
+        dict(element, **{'query.model': 'other_model'}), index)
+    assert ipe.element_can_match(element, index, [('field', 'users.id')])
+    assert not ipe.element_can_match(
+        element, index, [('field', 'users.id_2')])
+    assert ipe.element_can_match(element, index, [('table', 'users')])
+    assert not ipe.element_can_match(element, index, [('table', 'events')])
+    assert not ipe.element_can_match(
+        dict(element, **{'query.view': 'order_items'}), index, [('table', 'events')])
+    assert ipe.element_can_match(
+        dict(element, **{'query.view': 'inventory_snapshot'}), index, [('table', 'order_items')])
+
+
+def test_match_fields_to_dash():
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    content_results = [
+        {'dashboard.id': 1, 'dashboard_element.id': 1, 'query.model': 'thelook', 'query.view': 'order_items',
+         'query.formatted_fields': '["order_items.count", "users.id", "order_facts.order_sequence_number"]'},
+        {'dashboard.id': 1, 'dashboard_element.id': 2, 'query.model': 'thelook', 'query.view': 'order_items',
+         'query.formatted_fields': '["order_items.count", "not_a_view.id"]'},
+        {'dashboard.id': 1, 'dashboard_element.id': 3, 'query.model': 'thelook', 'query.view': 'not_an_explore',
+         'query.formatted_fields': '["order_items.count"]'}]
+    stats = Counter()
+    unresolved = []
+    test = ipe.match_fields_to_dash(
+        content_results, index, stats=stats, unresolved=unresolved)
+    assert len(test) == 2
+    assert test[0]['sql_joins'] == []
+    assert test[0]['used_joins'] == [
+        '`looker-private-demo.ecomm.order_items`', '`looker-private-demo.ecomm.users`', 'order_facts']
+    assert test[0]['used_view_names'] == [
+        'order_items', 'users', 'order_facts', 'inventory_items']
+    assert test[0]['sql_table_name'] == [
+        '`looker-private-demo.ecomm.order_items`', '`looker-private-demo.ecomm.users`',
+        '`looker-private-demo.ecomm.inventory_items`']
+    assert 'users' not in test[0]['unused_joins']
+    assert 'inventory_items' not in test[0]['unused_joins']
+    assert 'products' in test[0]['unused_joins']
+    assert unresolved == [2]
+    assert stats['elements_unresolved'] == 1
+
+
+def test_match_fields_to_dash_resolves_aliases(tmp_path):
+    (tmp_path / 'views.view.lkml').write_text(
+        'view: orders { sql_table_name: public.orders ;; }\n'
+        'view: users { sql_table_name: public.users ;; }\n')
+    (tmp_path / 'shop.model.lkml').write_text(
+        'include: "*.view"\n'
+        'explore: sales { from: orders join: buyers { from: users } join: sellers { from: users } }\n')
+    index = ipe.lookml_index.LookmlIndex.from_path(tmp_path)
+    content_results = [{'dashboard.id': 1, 'dashboard_element.id': 1, 'query.model': 'shop', 'query.view': 'sales',
+                        'query.formatted_fields': '["sales.count", "buyers.id", "sellers.id"]'}]
+    test = ipe.match_fields_to_dash(content_results, index)
+    assert test[0]['used_view_names'] == ['orders', 'users']
+    assert test[0]['used_joins'] == ['public.orders', 'public.users']
+
+
+def test_iter_mapview_batches_offline(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    sdk = mapview_sdk(25)
+    batches = ipe.iter_mapview_batches(
+        sdk, index, page_size=10, batch_size=3, offline=True)
+    test = ipe.write_csv_batches(batches, tmp_path / 'test.csv')
+    assert test == (17, 17)
+    assert sdk.run_query.call_count == 0
+
+
+def test_iter_mapview_batches_incremental(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    fingerprint = ipe.state_fingerprint(index)
+
+    state = ipe.run_state.RunState(tmp_path / 'mapview.state', fingerprint)
+    batches = ipe.iter_mapview_batches(
+        mapview_sdk(25), index, page_size=10, batch_size=4, state=state)
+    ipe.write_csv_batches(batches, tmp_path / 'first.csv')
+    state.close()
+
+    sdk = mapview_sdk(22, changed={0, 4})
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=4)
+    ipe.write_csv_batches(batches, tmp_path / 'expected.csv')
+
+    sdk.run_query.reset_mock()
+    stats = Counter()
+    state = ipe.run_state.RunState(tmp_path / 'mapview.state', fingerprint)
+    batches = ipe.iter_mapview_batches(
+        sdk, index, page_size=10, batch_size=4, stats=stats, state=state)
+    test = ipe.write_csv_batches(batches, tmp_path / 'test.csv')
+    state.close()
+    assert test == (15, 15)
+    assert (tmp_path / 'test.csv').read_text() == (tmp_path / 'expected.csv').read_text()
+    assert stats['elements_reused'] == 13
+    assert stats['elements_deleted'] == 2
+    assert sdk.run_query.call_count == 2
+
+
+def test_iter_mapview_batches_resumes_from_checkpoint(tmp_path, mapview_sdk):
+    index = ipe.lookml_index.LookmlIndex.from_path(
+        "./tests/test_lookml_files/the_look")
+    fingerprint = ipe.state_fingerprint(index)
+    sdk = mapview_sdk(25)
+    batches = ipe.iter_mapview_batches(sdk, index, page_size=10, batch_size=3)
+    ipe.write_csv_batches(batches, tmp_path / 'expected.csv')
+
+    sdk = mapview_sdk(25)
+    state = ipe.run_state.RunState(tmp_path / 'mapview.checkpoint', fingerprint)
+    batches = ipe.iter_mapview_batches(
+        sdk, index, page_size=10, batch_size=3, state=state)
+    done = list(chain.from_iterable(next(batches) for _ in range(3)))
+    state.close()
+    assert [row['element_id'] for row in done] == [0, 1, 3, 4, 6, 7, 9]
+
+    sdk.run_inline_query.reset_mock()
+    sdk.run_query.reset_mock()
+    state = ipe.run_state.RunState(
+        tmp_path / 'mapview.checkpoint', fingerprint, resume=True)
+    assert state.resuming
+    assert state.last_element_id() == 9
+    batches = ipe.iter_mapview_batches(
+        sdk, index, page_size=10, batch_size=3, state=state)
+    test = ipe.write_csv_batches(batches, tmp_path / 'test.csv')
+    state.close()
+    assert test == (17, 17)
+    assert (tmp_path / 'test.csv').read_text() == (tmp_path / 'expected.csv').read_text()
+    assert [call.kwargs['body'].filters['dashboard_element.id']
+            for call in sdk.run_inline_query.call_args_list] == ['>9', '>19']
+    remaining = {element_id % 7 for element_id in range(10, 25) if element_id % 3 != 2}
+    assert sorted(call.kwargs['query_id'] for call in sdk.run_query.call_args_list) == sorted(remaining)
+
+    state = ipe.run_state.RunState(
+        tmp_path / 'mapview.checkpoint', fingerprint, resume=True)
+    assert not state.resuming
+    state.close()
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.client
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from lmanage import lineage_server
+
+project_path = "./tests/test_lookml_files/the_look"
+
+
+@pytest.fixture
+def service(mapview_sdk, tmp_path):
+    project_copy = tmp_path / 'the_look'
+    shutil.copytree(project_path, project_copy)
+    service = lineage_server.LineageService(
+        str(project_copy), mapview_sdk(25), page_size=10, batch_size=4)
+    service.load_project()
+    service.refresh()
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def server(service):
+    server = lineage_server.make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_snapshot_lookups(service):
+    assert len(service.snapshot.rows) == 17
+    users = service.lookup('table', 'users')
+    assert users['count'] == 5
+    assert all('users' in row['used_view_names'] for row in users['elements'])
+    assert service.lookup('field', 'users.id_2')['count'] == len(
+        [row for row in service.snapshot.rows if 'users.id_2' in row['fields_used']])
+    assert [row['element_id'] for row in service.lookup('dashboard', '1')['elements']] == [3, 4]
+    assert service.lookup('table', 'not_a_view') == {
+        'table': 'not_a_view', 'elements': [], 'count': 0}
+
+
+def test_http_api(service, server):
+    status, body = get(f'{server}/tables/users')
+    assert status == 200
+    assert body == json.loads(json.dumps(service.lookup('table', 'users')))
+    status, body = get(f'{server}/fields/{urllib.parse.quote("order_items.count")}')
+    assert body['count'] == 17
+    assert body['elements'][0]['fields_used'] == ['order_items.count', 'users.id_0']
+    status, body = get(f'{server}/dashboards/1')
+    assert [row['element_id'] for row in body['elements']] == [3, 4]
+    status, body = get(f'{server}/health')
+    assert body['elements'] == 17
+    assert body['refreshes'] == 1
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(f'{server}/explores/order_items')
+    assert error.value.code == 404
+
+    request = urllib.request.Request(f'{server}/refresh', method='POST')
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 202
+    assert service.refresh_requested.is_set()
+    assert service.poll()
+    assert not service.refresh_requested.is_set()
+    assert service.stats['refreshes'] == 2
+
+
+def test_poll_reindexes_changed_lookml(service):
+    assert not service.poll()
+    assert service.lookup('table', 'order_items')['count'] == 12
+
+    view = os.path.join(service.project_path, 'views', '01_order_items.view.lkml')
+    with open(view) as lookml_file:
+        text = lookml_file.read()
+    with open(view, 'w') as lookml_file:
+        lookml_file.write(text.replace(
+            'looker-private-demo.ecomm.order_items', 'looker-private-demo.ecomm.order_items_v2'))
+    assert service.poll()
+    assert service.project.view_sql_table_name(
+        'order_items') == '`looker-private-demo.ecomm.order_items_v2`'
+    assert service.lookup('table', 'order_items')['count'] < 12
+
+
+def test_refresh_interval(service):
+    assert not service.poll(refresh_interval=60)
+    service.last_refresh = time.monotonic() - 61
+    assert service.poll(refresh_interval=60)
+
+
+def test_unix_socket(service, tmp_path):
+    socket_path = str(tmp_path / 'lmanage.sock')
+    server = lineage_server.make_server(service, socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert umask != 0o177
+
+    connection = http.client.HTTPConnection('localhost')
+    connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.sock.connect(socket_path)
+    connection.request('GET', '/tables/users')
+    response = connection.getresponse()
+    assert response.status == 200
+    assert json.loads(response.read())['count'] == 5
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_main_listens_on_port_zero(mocker, tmp_path):
+    mocker.patch.object(lineage_server.create_df, 'check_ini')
+    mocker.patch.object(lineage_server.get_content_with_views, 'connect')
+    mocker.patch.object(lineage_server, 'LineageService')
+    make_server = mocker.patch.object(lineage_server, 'make_server')
+    make_server.return_value.server_address = ('127.0.0.1', 40000)
+    lineage_server.main(project=project_path, ini_file='looker.ini', no_cache=True, port=0)
+    assert make_server.call_args.kwargs['port'] == 0
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import pandas as pd
+from lmanage import query_lineage
+
+
+def test_query_lookups():
+    assert query_lineage.query_lookups(table=('users', 'users'), sql_table=('public.users',), field=None, dashboard='3') == [
+        ('table', 'users'), ('sql_table', 'public.users'), ('dashboard', '3')]
+
+
+def test_query_writes_csv(store, tmp_path, capsys):
+    test = query_lineage.main(db=store.path, table=('users',), field=('users.id_2',), path=tmp_path / 'users.csv')
+    df = pd.read_csv(tmp_path / 'users.csv', index_col=0)
+    assert list(df['element_id']) == [row['element_id'] for row in test] == [1, 4, 7, 12, 15, 18, 22]
+
+    capsys.readouterr()
+    query_lineage.main(db=store.path, dashboard=('1',))
+    printed = pd.read_csv(io.StringIO(capsys.readouterr().out), index_col=0)
+    assert list(printed['element_id']) == [3, 4]
+
+    test = query_lineage.main(db=store.path, table=('test_ndt',), explores=True)
+    assert ('thelook', 'order_items') in test
+    assert 'thelook::order_items' in capsys.readouterr().out
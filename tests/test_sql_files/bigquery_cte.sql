@@ -0,0 +1,33 @@
+        WITH order_items_parameter_test AS (SELECT
+                users.first_name  AS first_name
+        FROM `looker-private-demo.ecomm.order_items`
+             AS order_items
+        LEFT JOIN `looker-private-demo.ecomm.users`
+             AS users ON order_items.user_id = users.id
+
+        WHERE
+                (users.first_name = 'ABBEY')
+        GROUP BY 1)
+        SELECT
+                distribution_centers.latitude  AS distribution_centers_latitude,
+                inventory_items.cost  AS inventory_items_cost,
+                "Fix your broken Content Please"  AS order_items_broken_content,
+                order_items_parameter_test.first_name AS order_items_parameter_test_first_name,
+                products.category  AS products_category,
+                users.country  AS users_country
+        FROM `looker-private-demo.ecomm.order_items`
+             AS order_items
+        LEFT JOIN `looker-private-demo.ecomm.users`
+             AS users ON order_items.user_id = users.id
+        LEFT JOIN `looker-private-demo.ecomm.inventory_items`
+             AS inventory_items ON order_items.inventory_item_id = inventory_items.id
+        LEFT JOIN `looker-private-demo.ecomm.products`
+             AS products ON inventory_items.product_id = products.id
+        LEFT JOIN `looker-private-demo.ecomm.distribution_centers`
+             AS distribution_centers ON (CAST(products.distribution_center_id AS int64)) = distribution_centers.id
+        LEFT JOIN order_items_parameter_test ON order_items_parameter_test.first_name = users.first_name
+
+        GROUP BY 1,2,3,4,5,6
+        ORDER BY 1
+        LIMIT 500
+        
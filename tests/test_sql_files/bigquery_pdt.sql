@@ -0,0 +1,16 @@
+-- use existing user_order_facts in looker-private-demo.looker_scratch.LR_5ZB0M1622571318117_user_order_facts
+SELECT
+    users.state  AS users_state,
+    user_order_facts.lifetime_orders  AS user_order_facts_lifetime_orders,
+    COUNT(DISTINCT order_items.order_id ) AS order_items_order_count
+FROM `looker-private-demo.ecomm.order_items`
+     AS order_items
+LEFT JOIN `looker-private-demo.ecomm.users`
+     AS users ON order_items.user_id = users.id
+LEFT JOIN looker_scratch.LR_5ZB0M1622571318117_user_order_facts AS user_order_facts ON user_order_facts.user_id = order_items.user_id
+GROUP BY
+    1,
+    2
+ORDER BY
+    3 DESC
+LIMIT 500
@@ -0,0 +1,10 @@
+         SELECT
+            REGEXP_EXTRACT(_TABLE_SUFFIX,r'\d\d\d\d')  AS gsod_year,
+            case when gsod.prcp = 99.99 then null else gsod.prcp end AS gsod_rainfall,
+            AVG(( case when gsod.prcp = 99.99 then null else gsod.prcp end ) ) AS gsod_average_rainfall
+        FROM `bigquery-public-data.noaa_gsod.gsod*`  AS gsod
+        GROUP BY 1,2
+        ORDER BY
+            3 DESC
+        LIMIT 500
+        
@@ -0,0 +1,13 @@
+SELECT
+    `products`.`brand`  AS `products.brand`,
+    DATE_FORMAT(`order_items`.`created_at`,'%Y-%m') AS `order_items.created_month`,
+    COALESCE(SUM(`order_items`.`sale_price` ), 0) AS `order_items.total_sale_price`
+FROM demo_db.order_items  AS `order_items`
+LEFT JOIN demo_db.inventory_items  AS `inventory_items` ON `inventory_items`.`id` = `order_items`.`inventory_item_id`
+LEFT JOIN demo_db.products  AS `products` ON `products`.`id` = `inventory_items`.`product_id`
+GROUP BY
+    1,
+    2
+ORDER BY
+    3 DESC
+LIMIT 500
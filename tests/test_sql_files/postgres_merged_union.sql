@@ -0,0 +1,28 @@
+-- Did not use order_items::rollup__created_date; it does not include the following fields in the query: order_items.status
+WITH user_facts AS (SELECT
+        users.id  AS user_id,
+        COUNT(DISTINCT orders.id ) AS lifetime_orders
+    FROM public.users  AS users
+    LEFT JOIN public.orders  AS orders ON users.id = orders.user_id
+    GROUP BY 1),
+  latest_session AS (SELECT user_id, MAX(created_at) AS last_seen FROM public.sessions GROUP BY 1)
+SELECT
+    order_items.status  AS "order_items.status",
+    user_facts.lifetime_orders  AS "user_facts.lifetime_orders",
+    COUNT(*) AS "order_items.count"
+FROM public.order_items  AS order_items
+INNER JOIN user_facts ON order_items.user_id = user_facts.user_id
+LEFT JOIN latest_session ON latest_session.user_id = order_items.user_id
+WHERE (order_items.status IN ('Complete', 'Shipped')) AND order_items.created_at < (SELECT MAX(created_at) FROM public.calendar)
+GROUP BY
+    1,
+    2
+UNION ALL
+SELECT
+    'Total'  AS "order_items.status",
+    NULL  AS "user_facts.lifetime_orders",
+    COUNT(*) AS "order_items.count"
+FROM public.order_items  AS order_items
+ORDER BY
+    3 DESC
+LIMIT 500
@@ -0,0 +1,27 @@
+    WITH cs_user_order_ndt AS (SELECT
+            order_items.user_id  AS user_id,
+            COUNT(DISTINCT CASE WHEN (products.category = 'Jeans') THEN order_items.order_id  ELSE NULL END) AS count_orders_with_jeans,
+            COALESCE(SUM(CASE WHEN ((TRIM(TO_CHAR(order_items.created_at , 'Day'))) = 'Thursday') THEN order_items.sale_price  ELSE NULL END), 0) AS total_revenue_on_thursdays
+    FROM public.order_items  AS order_items
+    LEFT JOIN public.inventory_items  AS inventory_items ON order_items.inventory_item_id = inventory_items.id
+    LEFT JOIN public.products  AS products ON inventory_items.product_id = products.id
+
+    GROUP BY 1)
+    SELECT
+            cs_user_order_ndt.total_revenue_on_thursdays AS "cs_user_order_ndt.total_revenue_on_thursdays",
+            distribution_centers.latitude  AS "distribution_centers.latitude",
+            inventory_items.id  AS "inventory_items.id",
+            order_items.order_id  AS "order_items.order_id",
+            products.cost  AS "products.cost",
+            users.latitude  AS "users.latitude"
+    FROM public.order_items  AS order_items
+    LEFT JOIN public.users  AS users ON order_items.user_id = users.id
+    LEFT JOIN public.inventory_items  AS inventory_items ON order_items.inventory_item_id = inventory_items.id
+    LEFT JOIN public.products  AS products ON inventory_items.product_id = products.id
+    LEFT JOIN public.distribution_centers  AS distribution_centers ON products.distribution_center_id = distribution_centers.id
+    INNER JOIN cs_user_order_ndt ON order_items.user_id = cs_user_order_ndt.user_id
+
+    GROUP BY 1,2,3,4,5,6
+    ORDER BY 1
+    LIMIT 500
+    
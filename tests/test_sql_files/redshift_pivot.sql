@@ -0,0 +1,34 @@
+        WITH order_user_sequence_facts AS (select oi.user_id,oi.id as order_id,row_number() over(partition by oi.user_id order by oi.created_at asc ) as order_sequence,
+                oi.created_at,
+                MIN(oi.created_at) OVER(PARTITION BY oi.user_id) as first_ordered_date,
+                LAG(oi.created_at) OVER (PARTITION BY oi.user_id ORDER BY oi.created_at asc) as previous_order_date,
+                LEAD(oi.created_at) OVER(partition by oi.user_id ORDER BY oi.created_at) as next_order_date,
+                DATEDIFF(DAY,CAST(oi.created_at as date),CAST(LEAD(oi.created_at) over(partition by oi.user_id ORDER BY oi.created_at) AS date)) as repurchase_gap
+              from order_items oi
+         )
+        SELECT * FROM (
+        SELECT *, DENSE_RANK() OVER (ORDER BY z___min_rank) as z___pivot_row_rank, RANK() OVER (PARTITION BY z__pivot_col_rank ORDER BY z___min_rank) as z__pivot_col_ordering, CASE WHEN z___min_rank = z___rank THEN 1 ELSE 0 END AS z__is_h
+        ighest_ranked_cell FROM (
+        SELECT *, MIN(z___rank) OVER (PARTITION BY "order_user_sequence_facts.created_at_month") as z___min_rank FROM (
+        SELECT *, RANK() OVER (ORDER BY "order_user_sequence_facts.created_at_month" DESC, z__pivot_col_rank) AS z___rank FROM (
+        SELECT *, DENSE_RANK() OVER (ORDER BY "users.gender" NULLS LAST) AS z__pivot_col_rank FROM (
+        SELECT
+            users.gender  AS "users.gender",
+                (TO_CHAR(DATE_TRUNC('month', CONVERT_TIMEZONE('UTC', 'America/New_York', order_user_sequence_facts.created_at )), 'YYYY-MM')) AS "order_user_sequence_facts.created_at_month",
+            COUNT(DISTINCT order_user_sequence_facts.user_id ) AS "order_user_sequence_facts.count"
+        FROM public.order_items  AS order_items
+        INNER JOIN public.users  AS users ON order_items.user_id = users.id
+        LEFT JOIN public.inventory_items  AS inventory_items ON inventory_items.id = order_items.inventory_item_id
+        LEFT JOIN order_user_sequence_facts ON users.id = order_user_sequence_facts.user_id
+        WHERE (order_user_sequence_facts.order_sequence = 1
+            )
+        GROUP BY
+            (DATE_TRUNC('month', CONVERT_TIMEZONE(
+                'UTC', 'America/New_York', order_user_sequence_facts.created_at ))),
+            1) ww
+        ) bb WHERE z__pivot_col_rank <= 16384
+        ) aa
+        ) xx
+        ) zz
+         WHERE (z__pivot_col_rank <= 50 OR z__is_highest_ranked_cell = 1) AND (z___pivot_row_rank <= 500 OR z__pivot_col_ordering = 1) ORDER BY z___pivot_row_rank
+            
@@ -0,0 +1,6 @@
+        SELECT
+            COUNT(DISTINCT order_items.order_id ) AS "order_items.count"
+        FROM
+            "public"."order_items" AS "order_items"
+        LIMIT 500
+        
@@ -0,0 +1,13 @@
+SELECT
+    orders.id  AS "orders.id",
+    users.state  AS "users.state",
+    COUNT(DISTINCT products.id ) AS "products.count"
+FROM (PUBLIC.ORDERS  AS orders
+    LEFT JOIN PUBLIC.USERS  AS users ON orders.user_id = users.id)
+INNER JOIN ((PUBLIC.PRODUCTS  AS products
+    INNER JOIN PUBLIC.BRANDS  AS brands ON products.brand_id = brands.id)) ON orders.product_id = products.id
+LEFT JOIN PUBLIC.DISTRIBUTION_CENTERS  AS distribution_centers USING (distribution_center_id)
+WHERE (orders.status = 'complete')
+GROUP BY 1,2
+ORDER BY 3 DESC
+LIMIT 500
@@ -0,0 +1,21 @@
+SELECT * FROM (
+SELECT *, DENSE_RANK() OVER (ORDER BY z___min_rank) as z___pivot_row_rank, RANK() OVER (PARTITION BY z__pivot_col_rank ORDER BY z___min_rank) as z__pivot_col_ordering, CASE WHEN z___min_rank = z___rank THEN 1 ELSE 0 END AS z__is_highest_ranked_cell FROM (
+SELECT *, MIN(z___rank) OVER (PARTITION BY "ORDER_ITEMS.CREATED_MONTH") as z___min_rank FROM (
+SELECT *, RANK() OVER (ORDER BY CASE WHEN z__pivot_col_rank=1 THEN (CASE WHEN "ORDER_ITEMS.COUNT" IS NOT NULL THEN 0 ELSE 1 END) ELSE 2 END, CASE WHEN z__pivot_col_rank=1 THEN "ORDER_ITEMS.COUNT" ELSE NULL END DESC, "ORDER_ITEMS.COUNT" DESC, z__pivot_col_rank, "ORDER_ITEMS.CREATED_MONTH") AS z___rank FROM (
+SELECT *, DENSE_RANK() OVER (ORDER BY "USERS.GENDER" NULLS LAST) AS z__pivot_col_rank FROM (
+SELECT
+    users."GENDER"  AS "USERS.GENDER",
+    TO_CHAR(DATE_TRUNC('month', order_items."CREATED_AT" ), 'YYYY-MM') AS "ORDER_ITEMS.CREATED_MONTH",
+    COUNT(DISTINCT order_items."ID" ) AS "ORDER_ITEMS.COUNT"
+FROM "ECOMM"."ORDER_ITEMS"
+     AS order_items
+LEFT JOIN "ECOMM"."USERS"
+     AS users ON (order_items."USER_ID") = (users."ID")
+GROUP BY
+    (TO_CHAR(DATE_TRUNC('month', order_items."CREATED_AT" ), 'YYYY-MM')),
+    1) ww
+) bb WHERE z__pivot_col_rank <= 16384
+) aa
+) xx
+) zz
+WHERE (z__pivot_col_rank <= 50 OR z__is_highest_ranked_cell = 1) AND (z___pivot_row_rank <= 500 OR z__pivot_col_ordering = 1) ORDER BY z___pivot_row_rank
@@ -0,0 +1,21 @@
+        SELECT
+                distribution_centers."LATITUDE"  AS "distribution_centers.latitude",
+                inventory_items."COST"  AS "inventory_items.cost",
+                order_items."INVENTORY_ITEM_ID"  AS "order_items.inventory_item_id",
+                products."BRAND"  AS "products.brand",
+                users."COUNTRY"  AS "users.country"
+        FROM "PUBLIC"."ORDER_ITEMS"
+             AS order_items
+        LEFT JOIN "PUBLIC"."USERS"
+             AS users ON (order_items."USER_ID") = (users."ID")
+        LEFT JOIN "PUBLIC"."INVENTORY_ITEMS"
+             AS inventory_items ON (order_items."INVENTORY_ITEM_ID") = (inventory_items."ID")
+        LEFT JOIN "PUBLIC"."PRODUCTS"
+             AS products ON (inventory_items."PRODUCT_ID") = (products."ID")
+        LEFT JOIN "PUBLIC"."DISTRIBUTION_CENTERS"
+             AS distribution_centers ON (products."DISTRIBUTION_CENTER_ID") = (distribution_centers."ID")
+
+        GROUP BY 1,2,3,4,5
+        ORDER BY 1
+        LIMIT 500
+    
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+from itertools import chain
+import pandas as pd
+import pytest
+from lmanage import get_content_with_views as ipe
+from lmanage.utils import columnar
+
+
+def batches(mapview_sdk, project, broken=()):
+    for batch in ipe.iter_mapview_batches(mapview_sdk(25), project, page_size=10, batch_size=4):
+        yield [dict(row, sql_joins='No Content') if row['element_id'] in broken else row for row in batch]
+
+
+def expected_rows(mapview_sdk, project, broken=()):
+    rows = list(chain.from_iterable(batches(mapview_sdk, project, broken=broken)))
+    return columnar.native_rows(pd.DataFrame(rows, columns=ipe.OUTPUT_COLUMNS))
+
+
+def test_native_rows():
+    df = pd.DataFrame([{'element_id': 1, 'fields_used': '["users.id"]', 'sql_joins': 'No Content', 'used_joins': []},
+                       {'element_id': 2, 'fields_used': None, 'sql_joins': ['public.users'], 'used_joins': ['public.users']}])
+    assert columnar.native_rows(df) == [
+        {'element_id': 1, 'fields_used': ['users.id'], 'sql_joins': None, 'sql_error': 'No Content', 'used_joins': []},
+        {'element_id': 2, 'fields_used': None, 'sql_joins': ['public.users'], 'sql_error': None, 'used_joins': ['public.users']}]
+
+
+def test_write_jsonl(mapview_sdk, project, tmp_path):
+    test = ipe.write_csv_batches(batches(mapview_sdk, project, broken=(3,)), tmp_path / 'mapview.jsonl', file_format='jsonl')
+    assert test == (17, 17)
+    rows = [json.loads(line) for line in (tmp_path / 'mapview.jsonl').read_text().splitlines()]
+    assert rows == expected_rows(mapview_sdk, project, broken=(3,))
+    assert rows[2]['sql_error'] == 'No Content'
+    assert rows[0]['used_view_names'] == ['order_items']
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_write_arrow_formats(mapview_sdk, project, tmp_path, file_format):
+    pa = pytest.importorskip('pyarrow')
+    file_path = tmp_path / f'mapview.{file_format}'
+    test = ipe.write_csv_batches(batches(mapview_sdk, project, broken=(3,)), file_path, table_mask='order_items',
+                                 file_format=file_format)
+    assert test == (17, 12)
+
+    if file_format == 'parquet':
+        parquet = pytest.importorskip('pyarrow.parquet')
+        assert parquet.ParquetFile(str(file_path)).num_row_groups == 5
+        table = parquet.read_table(str(file_path))
+    else:
+        reader = pytest.importorskip('pyarrow.ipc').open_file(str(file_path))
+        assert reader.num_record_batches == 5
+        table = reader.read_all()
+    assert table.schema.field('used_view_names').type == pa.list_(pa.dictionary(pa.int32(), pa.string()))
+    assert table.schema.field('element_id').type == pa.int64()
+    rows = [row for row in expected_rows(mapview_sdk, project, broken=(3,)) if 'order_items' in row['used_view_names']]
+    for row in rows:
+        row['dashboard_id'] = str(row['dashboard_id'])
+    assert table.to_pylist() == rows
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_write_arrow_formats_string_ids(mapview_sdk, project, tmp_path, file_format):
+    pa = pytest.importorskip('pyarrow')
+    # System Activity returns ids as strings, as in the test_get_dashboards fixture
+    string_batches = ([dict(row, dashboard_id=str(row['dashboard_id']), element_id=str(row['element_id'])) for row in batch]
+                      for batch in batches(mapview_sdk, project))
+    file_path = tmp_path / f'mapview.{file_format}'
+    assert ipe.write_csv_batches(string_batches, file_path, file_format=file_format) == (17, 17)
+    if file_format == 'parquet':
+        table = pytest.importorskip('pyarrow.parquet').read_table(str(file_path))
+    else:
+        table = pytest.importorskip('pyarrow.ipc').open_file(str(file_path)).read_all()
+    assert table.schema.field('element_id').type == pa.int64()
+    assert table.column('element_id').to_pylist() == [row['element_id'] for row in expected_rows(mapview_sdk, project)]
+
+
+def test_write_mask_batches_long_parquet(mapview_sdk, project, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    masks = [('table', 'users'), ('field', 'users.id_2')]
+    test = ipe.write_mask_csv_batches(batches(mapview_sdk, project), tmp_path / 'mapview.parquet', masks, layout='long',
+                                      file_format='parquet')
+    table = parquet.read_table(str(tmp_path / 'mapview.parquet')).to_pandas()
+    assert test[1] == {('table', 'users'): 5, ('field', 'users.id_2'): 3}
+    assert list(table.columns[:3]) == ['mask_type', 'mask', 'dashboard_id']
+    assert table.groupby(['mask_type', 'mask'], observed=True).size().to_dict() == {
+        ('field', 'users.id_2'): 3, ('table', 'users'): 5}
+
+
+def test_arrow_formats_need_pyarrow(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(ImportError, match='pip install pyarrow'):
+        columnar.open_writer(tmp_path / 'mapview.parquet', ipe.OUTPUT_COLUMNS, file_format='parquet')
+    with pytest.raises(ValueError):
+        columnar.open_writer(tmp_path / 'mapview.xlsx', ipe.OUTPUT_COLUMNS, file_format='xlsx')
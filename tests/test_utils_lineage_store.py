@@ -0,0 +1,55 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pandas as pd
+from lmanage import get_content_with_views as ipe
+
+
+def test_store_matches_csv_filters(store, rows):
+    df = pd.DataFrame(rows, columns=ipe.OUTPUT_COLUMNS)
+    for table_mask in ['users', 'order_items', 'test_ndt', 'not_a_view']:
+        expected = ipe.filter_rows(df, table_mask=table_mask)
+        assert [row['element_id'] for row in store.elements([('table', table_mask)])] == list(expected['element_id'])
+    for field_mask in ['users.id_2', 'order_items.count']:
+        expected = ipe.filter_rows(df, field_mask=field_mask)
+        assert [row['element_id'] for row in store.elements([('field', field_mask)])] == list(expected['element_id'])
+
+    stored = store.elements([('dashboard', 1)])
+    assert stored == [dict(row, dashboard_id=str(row['dashboard_id']))
+                      for row in rows if row['dashboard_id'] == 1]
+    assert store.meta()['elements'] == '17'
+
+
+def test_store_lookups(store):
+    assert [row['element_id'] for row in store.elements(
+        [('sql_table', '`LOOKER-PRIVATE-DEMO.ecomm.users`')])] == [1, 4, 15, 18, 22]
+    assert [row['element_id'] for row in store.elements(
+        [('sql_table', 'looker-private-demo.ecomm.users'), ('dashboard', '0')])] == [0, 1, 4, 15, 18, 22]
+    assert store.elements([]) == []
+    assert ('thelook', 'order_items') in store.explores(['test_ndt'])
+    assert store.explores(['not_a_view']) == []
+
+
+def test_store_replaces_rows(store, rows, project):
+    changed = dict(rows[0], used_view_names=['users'], sql_joins='No Content')
+    store.put_rows(pd.DataFrame([changed], columns=ipe.OUTPUT_COLUMNS))
+    assert store.elements([('table', 'order_items')])[0]['element_id'] != 0
+    assert store.elements([('table', 'users')])[0]['sql_joins'] == 'No Content'
+    assert store.meta()['elements'] == '17'
+
+    store.reset(project.model_explore_joins)
+    assert store.elements([('dashboard', '0')]) == []
+    assert store.meta()['elements'] == '0'
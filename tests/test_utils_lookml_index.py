@@ -0,0 +1,294 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import lookml
+from collections import Counter
+from lmanage.utils import lookml_index
+from lmanage.utils import lookml_cache
+from lmanage import get_content_with_views as ipe
+
+project_path = "./tests/test_lookml_files/the_look"
+project = lookml.Project(path=project_path)
+
+
+def test_normalize_table_name():
+    assert lookml_index.normalize_table_name(
+        ' "PUBLIC"."ORDER_ITEMS"') == 'public.order_items'
+    assert lookml_index.normalize_table_name(
+        '`looker-private-demo.ecomm.users`') == 'looker-private-demo.ecomm.users'
+    assert lookml_index.normalize_table_name(
+        'looker-private-demo.ecomm.users') == 'looker-private-demo.ecomm.users'
+
+
+def test_index_matches_project_walk():
+    index = lookml_index.LookmlIndex.from_path(project_path)
+    assert sorted(index.sql_table_names) == sorted(
+        ipe.get_sql_table_name(project))
+    assert sorted(index.explore_joins) == sorted(ipe.fetch_view_files(project))
+    assert index.explore_joins['order_items'] == ipe.fetch_view_files(project)[
+        'order_items']
+    assert index.explore_joins['events'] == [
+        'events', 'sessions', 'session_landing_page', 'events', 'session_bounce_page',
+        'events', 'product_viewed', 'products', 'users', 'user_order_facts']
+    assert index.view_files['order_items'] == [
+        'views/01_order_items.view.lkml']
+    assert len(index.view_files) == 14
+
+
+def test_index_from_project():
+    index = lookml_index.build_index(project)
+    assert lookml_index.build_index(index) is index
+    assert index.explore_joins == lookml_index.LookmlIndex.from_path(
+        project_path).explore_joins
+
+
+def test_views_for_table():
+    index = lookml_index.LookmlIndex.from_path(project_path)
+    assert index.views_for_table(
+        '`looker-private-demo.ecomm.order_items`') == ['order_items']
+    assert index.views_for_table('public.not_modelled') == []
+
+
+def test_match_views_per_query_does_not_walk_project(mocker):
+    index = lookml_index.LookmlIndex.from_path(project_path)
+    spy = mocker.spy(project, "files")
+    data = {'used_joins': ['`looker-private-demo.ecomm.users`', 'test_ndt']}
+    test = ipe.match_views_per_query(data, index)
+    assert test['used_view_names'] == ['test_ndt', 'users', 'order_items']
+    assert spy.call_count == 0
+
+
+def test_index_cache_only_parses_changed_files(tmp_path, mocker):
+    project_copy = tmp_path / 'the_look'
+    shutil.copytree(project_path, project_copy)
+    expected = lookml_index.LookmlIndex.from_path(project_copy)
+
+    stats = Counter()
+    cache = lookml_cache.LookmlCache(tmp_path / 'cache', project_copy)
+    lookml_index.LookmlIndex.from_path(project_copy, cache=cache, stats=stats)
+    cache.close()
+    assert stats['lookml_cache_hits'] == 0
+    assert stats['lookml_cache_misses'] == len(expected.files)
+
+    view = project_copy / 'views' / '01_order_items.view.lkml'
+    view.write_text(view.read_text().replace(
+        'looker-private-demo.ecomm.order_items', 'looker-private-demo.ecomm.order_items_v2'))
+    (project_copy / 'views' / '02_users.view.lkml').unlink()
+    spy = mocker.spy(lookml_index, 'index_text')
+    stats = Counter()
+    cache = lookml_cache.LookmlCache(tmp_path / 'cache', project_copy)
+    test = lookml_index.LookmlIndex.from_path(
+        project_copy, cache=cache, stats=stats)
+    assert spy.call_count == 1
+    assert stats['lookml_cache_misses'] == 1
+    assert stats['lookml_cache_hits'] == len(expected.files) - 2
+    assert test.views_for_table(
+        '`looker-private-demo.ecomm.order_items_v2`') == ['order_items']
+    assert 'users' not in test.view_files
+    assert cache.conn.execute(
+        'SELECT COUNT(*) FROM lookml_files').fetchone()[0] == len(expected.files) - 1
+    cache.close()
+
+
+def test_index_with_workers_matches_serial_scan():
+    expected = lookml_index.LookmlIndex.from_path(project_path)
+    test = lookml_index.LookmlIndex.from_path(project_path, workers=2)
+    assert test.files == expected.files
+    assert test.views_by_table == expected.views_by_table
+    assert test.view_files == expected.view_files
+    assert test.explore_joins == expected.explore_joins
+    assert test.sql_table_names == expected.sql_table_names
+
+
+def multi_model_project(root):
+    (root / 'models').mkdir(parents=True)
+    (root / 'views').mkdir()
+    (root / 'explores').mkdir()
+    (root / 'views' / 'orders.view.lkml').write_text(
+        'view: orders { sql_table_name: public.orders ;; }\n'
+        'view: users { sql_table_name: public.users ;; }\n')
+    (root / 'explores' / 'shared.explore.lkml').write_text(
+        'explore: shared_orders { from: orders join: users {} }\n')
+    (root / 'explores' / 'unused.explore.lkml').write_text(
+        'explore: unused { view_name: orders }\n')
+    (root / 'models' / 'finance.model.lkml').write_text(
+        'include: "/views/*.view"\n'
+        'include: "../explores/shared.explore"\n'
+        'explore: orders { join: users {} }\n')
+    (root / 'models' / 'marketing.model.lkml').write_text(
+        'include: "/views/*.view"\n'
+        'explore: orders {}\n')
+    return root
+
+
+def test_index_catalogs_every_model(tmp_path):
+    index = lookml_index.LookmlIndex.from_path(
+        multi_model_project(tmp_path / 'project'))
+    assert dict(index.model_explore_joins) == {
+        ('finance', 'orders'): ['orders', 'users'],
+        ('finance', 'shared_orders'): ['orders', 'users'],
+        ('marketing', 'orders'): ['orders'],
+    }
+    assert index.explore_views('marketing', 'orders') == ['orders']
+    assert index.explore_views('marketing', 'shared_orders') is None
+
+    content_results = [{'dashboard.id': 1, 'dashboard_element.id': element_id, 'query.model': model, 'query.view': explore,
+                        'query.formatted_fields': '["orders.count"]', 'sql_joins': ['public.orders']}
+                       for element_id, (model, explore) in enumerate(
+                           [('finance', 'orders'), ('marketing', 'orders'), ('marketing', 'shared_orders'), ('finance', 'shared_orders')])]
+    test = ipe.match_view_to_dash(
+        content_results, index.model_explore_joins, None, proj=index)
+    assert [(row['element_id'], row['potential_join']) for row in test] == [
+        (0, ['orders', 'users']), (1, ['orders']), (3, ['orders', 'users'])]
+
+
+def test_include_pattern():
+    pattern = lookml_index.include_pattern(
+        '/views/**/*.view', 'models/thelook.model.lkml')
+    assert pattern.match('views/01_order_items.view.lkml')
+    assert pattern.match('views/ecomm/users.view.lkml')
+    assert not pattern.match('views/orders.explore.lkml')
+    assert lookml_index.include_pattern(
+        '*.explore.lkml', 'explores/all.model.lkml').match('explores/a.explore.lkml')
+    assert lookml_index.include_pattern(
+        '//other_project/views/*.view', 'a.model.lkml') is None
+
+
+def test_derived_table_sources():
+    assert lookml_index.derived_table_sources({'sql': '''
+        WITH calendar AS (SELECT 1)
+        SELECT * FROM ${orders.SQL_TABLE_NAME} o
+        JOIN "PUBLIC"."USERS" u ON {% condition date %} u.created {% endcondition %}
+        JOIN calendar ON 1=1'''}) == {
+        'views': ['orders'], 'tables': ['public.users'], 'explore_source': None, 'fields': []}
+    assert lookml_index.derived_table_sources({'explore_source': {
+        'name': 'orders', 'columns': [{'name': 'id'}, {'name': 'user_id', 'field': 'users.id'}]}}) == {
+        'views': [], 'tables': [], 'explore_source': 'orders', 'fields': ['orders.id', 'users.id']}
+    assert lookml_index.derived_table_sources({'sql_create': 'CREATE TABLE x'}) is None
+
+
+def test_sql_sources():
+    assert lookml_index.sql_sources([
+        '${TABLE}.created_at', None, 'EXTRACT(YEAR FROM ${TABLE}.created_at)',
+        '(SELECT COUNT(*) FROM "PUBLIC"."ORDERS" WHERE user_id = ${TABLE}.id)',
+        '${users.id} IN (SELECT user_id FROM ${user_facts.SQL_TABLE_NAME})']) == {
+        'views': ['user_facts'], 'tables': ['public.orders']}
+    assert lookml_index.merge_sources(None, {'views': ['a'], 'tables': ['t']}, {'views': ['a'], 'tables': []}) == {
+        'views': ['a'], 'tables': ['t']}
+
+
+def test_view_lineage():
+    index = lookml_index.LookmlIndex.from_path(project_path)
+    assert index.view_lineage('affinity') == lookml_index.Lineage(
+        ('user_order_product', 'total_order_product'),
+        ('ecomm.order_items', 'ecomm.inventory_items', 'ecomm.products'), True)
+    assert index.view_lineage('order_facts').views == (
+        'order_items', 'inventory_items')
+    assert index.lineage_sql_table_names('test_ndt') == [
+        '`looker-private-demo.ecomm.order_items`']
+    assert index.view_lineage('users') == lookml_index.Lineage(
+        (), ('looker-private-demo.ecomm.users',), True)
+    assert index.views_for_table(
+        'looker_scratch.LR$5B6HE1587138455880_user_order_facts') == ['user_order_facts']
+    assert index.pdt_view('looker_scratch.LR$5B6HE1587138455880_users') is None
+    assert index.explore_reach('thelook', 'inventory_snapshot') == {
+        'inventory_snapshot', 'trailing_sales_snapshot', 'products', 'distribution_centers',
+        'inventory_items', 'order_items'}
+
+
+def test_view_lineage_of_deep_chains(tmp_path):
+    views = ['view: pdt_0 { sql_table_name: public.base ;; }'] + [
+        f'view: pdt_{i} {{ derived_table: {{ sql: SELECT * FROM ${{pdt_{i - 1}.SQL_TABLE_NAME}} ;; }} }}'
+        for i in range(1, 2000)]
+    views.append(
+        'view: cycle_a { derived_table: { sql: SELECT * FROM ${cycle_b.SQL_TABLE_NAME} ;; } }')
+    views.append(
+        'view: cycle_b { derived_table: { sql: SELECT * FROM ${cycle_a.SQL_TABLE_NAME} JOIN public.base ;; } }')
+    views.append(
+        'view: broken { derived_table: { sql: SELECT * FROM ${missing.SQL_TABLE_NAME} ;; } }')
+    (tmp_path / 'chain.view.lkml').write_text('\n'.join(views))
+    (tmp_path / 'chain.model.lkml').write_text(
+        'include: "*.view"\nexplore: pdt_1999 {}\nexplore: broken {}\n')
+    index = lookml_index.LookmlIndex.from_path(tmp_path)
+
+    lineage = index.view_lineage('pdt_1999')
+    assert len(lineage.views) == 1999
+    assert lineage.tables == ('public.base',)
+    assert lineage.complete
+    assert index.view_lineage('pdt_1000').views[-1] == 'pdt_0'
+    assert len(index._lineage) == 2000
+    assert index.explore_reach('chain', 'pdt_1999') == {
+        f'pdt_{i}' for i in range(2000)}
+
+    assert index.view_lineage('cycle_a').views[0] == 'cycle_b'
+    assert not index.view_lineage('broken').complete
+    assert index.explore_reach('chain', 'broken') is None
+
+
+def test_index_resolves_extends_and_refinements(tmp_path):
+    (tmp_path / 'views.view.lkml').write_text(
+        'view: orders { sql_table_name: public.orders ;; }\n'
+        'view: users { sql_table_name: public.users ;; }\n'
+        'view: kitten_users { extends: [users] }\n'
+        'view: +users { sql_table_name: public.users_v2 ;; }\n'
+        'view: base_facts { extension: required }\n'
+        'view: order_facts { extends: [base_facts] derived_table: { sql: SELECT * FROM public.orders ;; } }\n')
+    (tmp_path / 'shop.model.lkml').write_text(
+        'include: "*.view"\n'
+        'explore: base { extension: required from: orders join: users {} }\n'
+        'explore: orders { extends: [base] join: order_facts {} }\n'
+        'explore: kitten_orders { extends: [orders] join: users { from: kitten_users } }\n'
+        'explore: +orders { join: refined {} }\n'
+        'explore: plain { extends: [plain_parent] }\n'
+        'explore: plain_parent { join: users {} }\n'
+        'explore: loop_a { extends: [loop_b] }\n'
+        'explore: loop_b { extends: [loop_a] }\n')
+    index = lookml_index.LookmlIndex.from_path(tmp_path)
+
+    assert index.explore_views('shop', 'base') is None
+    assert index.explore_views('shop', 'orders') == [
+        'orders', 'users', 'order_facts', 'refined']
+    assert index.explore_views('shop', 'kitten_orders') == [
+        'orders', 'users', 'kitten_users', 'order_facts', 'refined']
+    assert index.model_explore_aliases[('shop', 'kitten_orders')]['users'] == 'kitten_users'
+    assert index.model_explore_aliases[('shop', 'kitten_orders')]['kitten_orders'] == 'orders'
+    assert index.explore_views('shop', 'plain') == ['plain_parent', 'users']
+    assert index.explore_views('shop', 'loop_a') is not None
+    assert ipe.fetch_view_files(index)['kitten_orders'] == index.explore_views(
+        'shop', 'kitten_orders')
+
+    assert index.view_sql_table_name('users') == 'public.users_v2'
+    assert index.view_sql_table_name('kitten_users') == 'public.users_v2'
+    assert index.views_for_table('public.users_v2') == ['users', 'kitten_users']
+    assert index.view_files['users'] == ['views.view.lkml', 'views.view.lkml']
+    assert index.view_lineage('order_facts').tables == ('public.orders',)
+    assert not index.open_views
+
+
+def test_resolve_extends_merges_each_explore_once(mocker):
+    explores = {'layer_0': {'name': 'layer_0', 'joins': [{'name': 'join_0'}]}}
+    for layer in range(1, 500):
+        explores[f'layer_{layer}'] = {'name': f'layer_{layer}', 'extends': [f'layer_{layer - 1}'],
+                                      'joins': [{'name': f'join_{layer}'}]}
+    for leaf in range(500):
+        explores[f'leaf_{leaf}'] = {'name': f'leaf_{leaf}', 'extends': ['layer_499']}
+    spy = mocker.spy(lookml_index, 'merge_explores')
+    resolved = lookml_index.resolve_extends(
+        explores, lookml_index.merge_explores)
+    assert spy.call_count == 999
+    assert len(resolved['leaf_0']['joins']) == 500
+    assert resolved['leaf_0']['view_name'] == 'layer_0'
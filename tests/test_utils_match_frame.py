@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pandas as pd
+from lmanage import get_content_with_views as ipe
+from lmanage.utils import lookml_index
+from lmanage.utils import match_frame as mf
+
+index = lookml_index.LookmlIndex.from_path("./tests/test_lookml_files/the_look")
+
+sql_joins = [
+    ['`looker-private-demo.ecomm.order_items`'],
+    ['`looker-private-demo.ecomm.events`', '`looker-private-demo.ecomm.users`'],
+    ['test_ndt', '`looker-private-demo.ecomm.order_items`', 'test_ndt'],
+    ['`LOOKER-PRIVATE-DEMO.ecomm.Users`', 'public.not_modelled',
+        '`looker-private-demo.ecomm.users`'],
+    'No Content',
+    [],
+    ['order_facts', 'looker_scratch.LR$5B6HE1587138455880_user_order_facts',
+        'affinity', '`looker-private-demo.ecomm.products`'],
+]
+
+content_results = [{'dashboard.id': element_id // 2,
+                    'dashboard_element.id': element_id,
+                    'query.model': 'thelook',
+                    'query.view': ['order_items', 'events', 'not_an_explore', 'order_items'][element_id % 4],
+                    'query.formatted_fields': f'["order_items.count", "users.id_{element_id}"]',
+                    'sql_joins': sql_joins[element_id % len(sql_joins)]}
+                   for element_id in range(36)]
+
+
+def python_rows(all_sql_table_names=False):
+    combine = ipe.match_view_to_dash(
+        content_results, index.model_explore_joins,
+        index.sql_table_names if all_sql_table_names else None, proj=index)
+    for row in combine:
+        ipe.match_join_per_query(row, index)
+        ipe.match_views_per_query(row, index)
+        ipe.find_unused_views(row)
+    return pd.DataFrame(combine, columns=ipe.OUTPUT_COLUMNS)
+
+
+def test_match_frame_matches_python_engine():
+    for all_sql_table_names in [False, True]:
+        expected = python_rows(all_sql_table_names)
+        test = mf.match_frame(content_results, index,
+                              all_sql_table_names=all_sql_table_names)
+        assert len(test) == 27
+        assert list(test.columns) == ipe.OUTPUT_COLUMNS
+        assert test.to_dict('records') == expected.to_dict('records')
+
+
+def test_match_frame_unused_joins_multiset():
+    test = mf.match_frame(
+        [dict(content_results[0], sql_joins=sql_joins[2])], index)
+    assert test['used_joins'][0] == [
+        'test_ndt', '`looker-private-demo.ecomm.order_items`', 'test_ndt']
+    assert test['used_view_names'][0] == [
+        'test_ndt', 'test_ndt', 'order_items']
+    assert test['unused_joins'][0] == sorted(
+        ['order_facts', 'inventory_items', 'users', 'user_order_facts', 'products',
+         'repeat_purchase_facts', 'distribution_centers'])
+
+
+def test_match_frame_derived_table_lineage():
+    test = mf.match_frame(
+        [dict(content_results[0], sql_joins=sql_joins[6])], index)
+    assert test['used_joins'][0] == [
+        'order_facts', 'looker_scratch.LR$5B6HE1587138455880_user_order_facts',
+        'affinity', '`looker-private-demo.ecomm.products`']
+    assert test['used_view_names'][0] == [
+        'order_facts', 'affinity', 'user_order_facts', 'products',
+        'order_items', 'inventory_items', 'user_order_product', 'total_order_product']
+    assert test['sql_table_name'][0] == [
+        '`looker-private-demo.ecomm.products`', '`looker-private-demo.ecomm.order_items`',
+        '`looker-private-demo.ecomm.inventory_items`']
+
+
+def test_match_frame_no_content():
+    test = mf.match_frame(content_results[4:5], index)
+    assert test['sql_joins'][0] == 'No Content'
+    assert test['used_joins'][0] == []
+    assert test['sql_table_name'][0] == []
+
+
+def test_match_frame_empty_batch():
+    test = mf.match_frame([], index)
+    assert test.empty
+    assert list(test.columns) == ipe.OUTPUT_COLUMNS
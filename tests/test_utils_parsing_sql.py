@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import pytest
+from lmanage.utils import parsing_sql
+
+sql_files = sorted(Path('./tests/test_sql_files').glob('*.sql'))
+
+# tables extract_tables_sqlparse reports that are not tables
+sqlparse_false_positives = {
+    'postgres_merged_union.sql': {'3'}
+}
+# tables extract_tables_sqlparse misses, the tables of parenthesized join groups
+sqlparse_false_negatives = {
+    'snowflake_join_group.sql': {'public.orders', 'public.users', 'public.products', 'public.brands'}
+}
+
+
+@pytest.mark.parametrize('sql_file', sql_files, ids=lambda f: f.name)
+def test_extract_tables_matches_sqlparse(sql_file):
+    sql = sql_file.read_text()
+    expected = set(parsing_sql.extract_tables_sqlparse(sql)) - \
+        sqlparse_false_positives.get(sql_file.name, set()) | \
+        sqlparse_false_negatives.get(sql_file.name, set())
+    test = parsing_sql.extract_tables(sql)
+    assert len(test) == len(set(test))
+    assert set(test) == expected
+
+
+def test_extract_tables_order_of_appearance():
+    sql = (Path('./tests/test_sql_files') / 'redshift_pivot.sql').read_text()
+    test = parsing_sql.extract_tables(sql)
+    assert test == ['order_items', 'public.order_items', 'public.users',
+                    'public.inventory_items', 'order_user_sequence_facts']
+
+
+def test_extract_tables_skips_non_tables():
+    sql = """
+        SELECT EXTRACT(YEAR FROM orders.created_at) AS year,
+            TRIM(BOTH ' ' FROM users.name) AS name, 'FROM quoted' AS label
+        -- FROM commented_out
+        FROM `looker-private-demo.ecomm.orders` AS orders
+        CROSS JOIN UNNEST(orders.items) AS item
+        /* LEFT JOIN commented_out_too */
+        LEFT JOIN looker-private-demo.ecomm.users AS users ON users.id = orders.user_id
+        """
+    test = parsing_sql.extract_tables(sql)
+    assert test == ['`looker-private-demo.ecomm.orders`',
+                    'looker-private-demo.ecomm.users']
+
+
+def test_extract_tables_from_lists_and_statements():
+    sql = '''SELECT 1 FROM a, "SCHEMA"."B" AS b, [dbo].[C] WHERE a.id = b.id;
+             SELECT 2 FROM a JOIN d USING (id, other_id)'''
+    test = parsing_sql.extract_tables(sql)
+    assert test == ['a', 'schema.b', '[dbo].[c]', 'd']
+
+
+def test_extract_tables_from_join_groups():
+    assert parsing_sql.extract_tables('SELECT * FROM (a JOIN b ON a.id = b.id)') == ['a', 'b']
+    assert parsing_sql.extract_tables(
+        'SELECT 1 FROM a LEFT JOIN ((b JOIN c ON b.id = c.id) JOIN d USING (id)) ON a.id = b.id') == ['a', 'b', 'c', 'd']
+    assert parsing_sql.extract_tables('SELECT 1 FROM (a JOIN b ON a.id = b.id), c') == ['a', 'b', 'c']
+    assert parsing_sql.extract_tables('SELECT 1 FROM (SELECT id FROM a) AS x JOIN b ON (x.id = b.id)') == ['a', 'b']
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from lmanage.utils import run_state
+
+row = {'dashboard_id': 1, 'element_id': 2, 'used_view_names': ['users']}
+
+
+def test_run_state_reuses_rows_of_unchanged_queries(tmp_path):
+    state = run_state.RunState(tmp_path / 'mapview.state', 'lookml-1')
+    state.put(2, 59, row)
+    state.commit()
+    state.close()
+
+    state = run_state.RunState(tmp_path / 'mapview.state', 'lookml-1')
+    assert state.run == 2
+    assert state.get(2, 59) == row
+    assert state.get('2', '59') == row
+    assert state.get(2, 60) is None
+    state.close()
+
+    state = run_state.RunState(tmp_path / 'mapview.state', 'lookml-2')
+    assert state.get(2, 59) is None
+    state.close()
+
+
+def test_run_state_drops_unseen_elements(tmp_path):
+    state = run_state.RunState(tmp_path / 'mapview.state', 'lookml-1')
+    for element_id in range(3):
+        state.put(element_id, 59, dict(row, element_id=element_id))
+    state.commit()
+    state.close()
+
+    state = run_state.RunState(tmp_path / 'mapview.state', 'lookml-1')
+    state.seen([0, 2])
+    assert state.finish() == 1
+    assert state.get(1, 59) is None
+    assert state.get(2, 59)['element_id'] == 2
+    state.close()
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import pytest
+import looker_sdk
+from collections import Counter
+from lmanage.utils import scheduler
+from lmanage.utils import sql_cache
+from lmanage import get_content_with_views as ipe
+
+
+class MockSDK():
+    def run_inline_query():
+        pass
+
+    def run_query():
+        pass
+
+
+class MockResponse():
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class MockSession():
+    def __init__(self):
+        self.hooks = {'response': []}
+
+
+class MockTransport():
+    def __init__(self):
+        self.session = MockSession()
+
+
+def test_is_transient():
+    assert scheduler.is_transient(429, 'whatever')
+    assert scheduler.is_transient(503, '')
+    assert not scheduler.is_transient(404, 'Too Many Requests')
+    assert scheduler.is_transient(
+        None, "HTTPSConnectionPool(host='looker', port=443): Read timed out. (read timeout=10)")
+    assert not scheduler.is_transient(None, 'Not found')
+
+
+def test_scheduler_retries_transient_errors(mocker):
+    sleep = mocker.patch('lmanage.utils.scheduler.time.sleep')
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    sdk.run_query.side_effect = [looker_sdk.error.SDKError('Too Many Requests'),
+                                 looker_sdk.error.SDKError('Service Unavailable'), 'SELECT 1']
+    proxy = scheduler.RequestScheduler(sdk, backoff=1)
+    assert proxy.run_query(query_id=1, result_format='sql') == 'SELECT 1'
+    assert sdk.run_query.call_count == 3
+    assert proxy.stats['retries'] == 2
+    assert 0.5 <= sleep.call_args_list[0].args[0] <= 1
+    assert 1 <= sleep.call_args_list[1].args[0] <= 2
+
+
+def test_scheduler_raises_permanent_errors_at_once(mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    sdk.run_query.side_effect = looker_sdk.error.SDKError('Not found')
+    proxy = scheduler.RequestScheduler(sdk)
+    with pytest.raises(looker_sdk.error.SDKError) as error:
+        proxy.run_query(query_id=1, result_format='sql')
+    assert not isinstance(error.value, scheduler.TransientError)
+    assert sdk.run_query.call_count == 1
+
+
+def test_scheduler_reads_status_from_session_hook(mocker):
+    mocker.patch('lmanage.utils.scheduler.time.sleep')
+    sdk = MockSDK()
+    sdk.transport = MockTransport()
+    mocker.patch.object(sdk, "run_query")
+    proxy = scheduler.RequestScheduler(sdk, retries=2, timeout=5)
+
+    def server_error(**kwargs):
+        for hook in sdk.transport.session.hooks['response']:
+            hook(MockResponse(502))
+        raise looker_sdk.error.SDKError('<html>oops</html>')
+    sdk.run_query.side_effect = server_error
+    with pytest.raises(scheduler.TransientError):
+        proxy.run_query(query_id=1, result_format='sql')
+    assert sdk.run_query.call_count == 3
+    assert sdk.run_query.call_args.kwargs['transport_options'] == {
+        'timeout': 5}
+    # looker-sdk 0.1.x reads the options by attribute
+    assert sdk.run_query.call_args.kwargs['transport_options'].timeout == 5
+    assert proxy.limiter.limit == 1
+
+
+def test_get_sql_from_elements_keeps_transient_failures_apart(mocker, tmp_path):
+    mocker.patch('lmanage.utils.scheduler.time.sleep')
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    responses = {1: looker_sdk.error.SDKError('Gateway Timeout'),
+                 2: looker_sdk.error.SDKError('Unknown field'),
+                 3: 'SELECT 1 FROM public.users'}
+
+    def run_query(query_id, result_format):
+        if isinstance(responses[query_id], Exception):
+            raise responses[query_id]
+        return responses[query_id]
+    sdk.run_query.side_effect = run_query
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    stats = Counter()
+    content_results = [{'query.id': query_id} for query_id in [1, 2, 3]]
+    test = ipe.get_sql_from_elements(scheduler.RequestScheduler(
+        sdk, retries=1), content_results, stats=stats, cache=cache)
+    assert [dash['sql_joins'] for dash in test] == [
+        ipe.FETCH_FAILED, 'No Content', ['public.users']]
+    assert stats['fetch_failed_transient'] == 1
+    assert stats['fetch_failed_permanent'] == 1
+    assert cache.get(1) is None
+    assert cache.get(3) is not None
+
+
+def test_get_sql_from_elements_reads_errors_of_looker_sdk_0_1(mocker):
+    mocker.patch('lmanage.utils.scheduler.time.sleep')
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+
+    def run_query(query_id, result_format):
+        error = looker_sdk.error.SDKError(
+            'Read timed out' if query_id == 1 else 'Unknown field')
+        # the SDKError of looker-sdk 0.1.x is a plain exception without a message attribute
+        del error.message
+        raise error
+    sdk.run_query.side_effect = run_query
+    stats = Counter()
+    test = ipe.get_sql_from_elements(scheduler.RequestScheduler(sdk, retries=1), [
+        {'query.id': 1}, {'query.id': 2}], stats=stats)
+    assert [dash['sql_joins'] for dash in test] == [ipe.FETCH_FAILED, 'No Content']
+    assert stats['fetch_failed_transient'] == 1
+    assert stats['fetch_failed_permanent'] == 1
+
+
+def test_adaptive_limiter():
+    limiter = scheduler.AdaptiveLimiter(8)
+    for _ in range(2):
+        limiter.acquire()
+    limiter.release(0.1)
+    limiter.release(0.1, congested=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(0.5)
+    assert limiter.limit == 3
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.1)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_token_bucket_rate():
+    bucket = scheduler.TokenBucket(rate=200, burst=10)
+    start = time.monotonic()
+    for _ in range(30):
+        bucket.acquire()
+    assert time.monotonic() - start >= 20 / 200 * 0.9
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import stat
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import looker_sdk
+from lmanage import get_content_with_views
+from lmanage.utils import sdk_session
+
+
+class LookerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.calls['connections'] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, content_type='application/json'):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.calls['login'] += 1
+        self.reply(json.dumps(
+            {'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3600}))
+
+    def do_GET(self):
+        self.server.calls['run_query'] += 1
+        self.server.calls[self.headers.get('Authorization')] += 1
+        if self.headers.get('Authorization') == 'Bearer revoked':
+            body = json.dumps({'message': 'Requires authentication.'}).encode('utf-8')
+            self.send_response(401)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.reply('SELECT 1', content_type='text/plain')
+
+
+@pytest.fixture
+def looker(tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LookerHandler)
+    server.daemon_threads = True
+    server.calls = Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    ini_file = tmp_path / 'looker.ini'
+    ini_file.write_text(
+        f'[Looker]\nbase_url=http://127.0.0.1:{server.server_port}\nclient_id=abc\nclient_secret=xyz\nverify_ssl=False\n')
+    yield server, str(ini_file)
+    server.shutdown()
+    server.server_close()
+
+
+def run_queries(sdk, calls, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda query_id: sdk.run_query(
+            query_id=query_id, result_format='sql'), range(calls)))
+
+
+def test_configure_session_sizes_pool(looker):
+    server, ini_file = looker
+    sdk = looker_sdk.init31(config_file=ini_file)
+    session = sdk_session.configure_session(sdk, pool_size=16)
+    assert session is sdk.transport.session
+    assert session.get_adapter('https://looker.example.com')._pool_maxsize == 16
+    assert session.get_adapter('http://127.0.0.1')._pool_maxsize == 16
+    assert sdk_session.configure_session(object(), pool_size=16) is None
+
+
+def test_pooled_session_reuses_connections(looker):
+    server, ini_file = looker
+    sdk = looker_sdk.init31(config_file=ini_file)
+    sdk_session.configure_session(sdk, pool_size=16)
+    sdk.run_query(query_id=0, result_format='sql')
+
+    run_queries(sdk, 200, concurrency=16)
+    assert server.calls['run_query'] == 201
+    assert server.calls['login'] == 1
+    assert server.calls['connections'] <= 17
+
+
+def test_token_cache_skips_login(looker, tmp_path):
+    server, ini_file = looker
+    token_cache = sdk_session.TokenCache(tmp_path / 'cache' / 'tokens.json')
+
+    sdk = looker_sdk.init31(config_file=ini_file)
+    assert not token_cache.restore(sdk)
+    sdk.run_query(query_id=1, result_format='sql')
+    token_cache.save(sdk)
+    assert server.calls['login'] == 1
+    assert stat.S_IMODE(os.stat(token_cache.path).st_mode) == 0o600
+    assert 'xyz' not in token_cache.path.read_text()
+
+    sdk = looker_sdk.init31(config_file=ini_file)
+    assert token_cache.restore(sdk)
+    sdk.run_query(query_id=1, result_format='sql')
+    assert server.calls['login'] == 1
+    assert server.calls['Bearer token'] == 2
+
+
+def test_token_cache_ignores_expiring_tokens(looker, tmp_path):
+    server, ini_file = looker
+    token_cache = sdk_session.TokenCache(tmp_path / 'tokens.json')
+    sdk = looker_sdk.init31(config_file=ini_file)
+    token_cache.path.write_text(json.dumps({token_cache._key(sdk): {
+        'access_token': 'old', 'token_type': 'Bearer', 'expires_at': time.time() + 30}}))
+    assert not token_cache.restore(sdk)
+
+    token_cache.path.write_text('not json')
+    assert not token_cache.restore(sdk)
+    sdk.run_query(query_id=1, result_format='sql')
+    token_cache.save(sdk)
+    assert list(json.loads(token_cache.path.read_text())) == [
+        token_cache._key(sdk)]
+
+
+def test_token_cache_keys_by_client(looker, tmp_path):
+    server, ini_file = looker
+    token_cache = sdk_session.TokenCache(tmp_path / 'tokens.json')
+    sdk = looker_sdk.init31(config_file=ini_file)
+    sdk.run_query(query_id=1, result_format='sql')
+    token_cache.save(sdk)
+
+    other_ini = tmp_path / 'other.ini'
+    other_ini.write_text(open(ini_file).read().replace('abc', 'def'))
+    assert not token_cache.restore(looker_sdk.init31(config_file=str(other_ini)))
+
+
+def test_revoked_cached_token_logs_in_again(looker, tmp_path):
+    server, ini_file = looker
+    token_cache = sdk_session.TokenCache(tmp_path / 'tokens.json')
+    token_cache.path.write_text(json.dumps({token_cache._key(looker_sdk.init31(config_file=ini_file)): {
+        'access_token': 'revoked', 'token_type': 'Bearer', 'expires_at': time.time() + 3600}}))
+
+    sdk = get_content_with_views.connect(ini_file, retries=0, token_cache=token_cache)
+    assert sdk.auth.token.access_token == 'revoked'
+    assert sdk.run_query(query_id=1, result_format='sql') == 'SELECT 1'
+    assert server.calls['Bearer revoked'] == 1
+    assert server.calls['login'] == 1
+    assert sdk.stats['tokens_dropped'] == 1
+    assert json.loads(token_cache.path.read_text()) == {}
+
+    token_cache.save(sdk.sdk)
+    sdk.run_query(query_id=2, result_format='sql')
+    assert server.calls['Bearer token'] == 2
+    assert list(json.loads(token_cache.path.read_text()).values())[0]['access_token'] == 'token'
+
+
+def test_rejected_token_without_cache_fails(looker):
+    server, ini_file = looker
+    sdk = get_content_with_views.connect(ini_file, retries=0)
+    sdk.sdk.auth.token = sdk_session.auth_token.AuthToken(sdk_session.access_token(
+        sdk.sdk, access_token='revoked', token_type='Bearer', expires_in=3600))
+    with pytest.raises(looker_sdk.error.SDKError):
+        sdk.run_query(query_id=1, result_format='sql')
+    assert server.calls['login'] == 0
+
+
+def test_token_cache_logs_in_when_token_cannot_be_rebuilt(looker, tmp_path, mocker):
+    server, ini_file = looker
+    token_cache = sdk_session.TokenCache(tmp_path / 'tokens.json')
+    sdk = looker_sdk.init31(config_file=ini_file)
+    token_cache.path.write_text(json.dumps({token_cache._key(sdk): {
+        'access_token': 'abc123', 'token_type': 'Bearer', 'expires_at': time.time() + 3600}}))
+    assert sdk_session.access_token(sdk, access_token='abc123').access_token == 'abc123'
+
+    # e.g. an SDK whose AccessToken takes other arguments
+    mocker.patch.object(sdk_session, 'access_token', side_effect=TypeError('unexpected keyword'))
+    assert not token_cache.restore(sdk)
+    assert sdk.run_query(query_id=1, result_format='sql') == 'SELECT 1'
+    assert server.calls['login'] == 1
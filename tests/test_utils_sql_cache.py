@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3
+import time
+from lmanage.utils import sql_cache
+from collections import Counter
+from lmanage import get_content_with_views as ipe
+
+
+class MockSDK():
+    def run_query():
+        pass
+
+
+def test_sql_cache_round_trip(tmp_path):
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    cache.put(59, 'SELECT 1 FROM public.users', ['public.users'])
+    assert cache.get(59) == ('SELECT 1 FROM public.users', ['public.users'])
+    assert cache.get('59') == ('SELECT 1 FROM public.users', ['public.users'])
+    assert cache.get(60) is None
+    cache.close()
+
+    other_instance = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://b')
+    assert other_instance.get(59) is None
+    reopened = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    assert reopened.get(59)[1] == ['public.users']
+    refreshed = sql_cache.SqlCache(
+        cache_dir=tmp_path, base_url='https://a', refresh=True)
+    assert refreshed.get(59) is None
+
+
+def test_sql_cache_misses_other_extractor_versions(tmp_path, mocker):
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    cache.put(59, 'SELECT 1 FROM (a JOIN b ON a.id = b.id)', [])
+    cache.close()
+    mocker.patch.object(sql_cache, 'EXTRACTOR_VERSION', sql_cache.EXTRACTOR_VERSION + 1)
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    assert cache.get(59) is None
+    cache.put(59, 'SELECT 1 FROM (a JOIN b ON a.id = b.id)', ['a', 'b'])
+    assert cache.get(59)[1] == ['a', 'b']
+    cache.close()
+
+
+def test_sql_cache_upgrades_unversioned_cache(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'query_sql.sqlite'))
+    conn.execute('''CREATE TABLE query_sql (base_url TEXT NOT NULL, query_id TEXT NOT NULL, sql TEXT NOT NULL,
+        tables TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,
+        PRIMARY KEY (base_url, query_id))''')
+    conn.execute('INSERT INTO query_sql VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 ('https://a', '59', 'SELECT 1', '[]', 8, time.time(), time.time()))
+    conn.commit()
+    conn.close()
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    assert cache.get(59) is None
+    cache.put(59, 'SELECT 1', [])
+    assert cache.get(59) == ('SELECT 1', [])
+    cache.close()
+
+
+def test_sql_cache_evicts_by_age(tmp_path, mocker):
+    cache = sql_cache.SqlCache(
+        cache_dir=tmp_path, base_url='https://a', max_age_days=1)
+    cache.put(1, 'SELECT 1', [])
+    mocker.patch('lmanage.utils.sql_cache.time.time',
+                 return_value=time.time() + 2 * 24 * 60 * 60)
+    cache.evict()
+    assert cache.get(1) is None
+
+
+def test_sql_cache_evicts_least_recently_used(tmp_path):
+    cache = sql_cache.SqlCache(
+        cache_dir=tmp_path, base_url='https://a', max_size_mb=250 / (1024 * 1024))
+    for query_id in range(3):
+        cache.put(query_id, 'x' * 100, [])
+        time.sleep(0.01)
+    cache.get(0)
+    cache.evict()
+    assert cache.get(0) is not None
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+
+
+def test_get_sql_from_elements_uses_cache(tmp_path, mocker):
+    sdk = MockSDK()
+    mocker.patch.object(sdk, "run_query")
+    sdk.run_query.return_value = 'SELECT 1 FROM public.order_items'
+    content_results = [{'query.id': qid} for qid in [1, 2, 2]]
+
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    ipe.get_sql_from_elements(sdk, content_results, cache=cache)
+    assert sdk.run_query.call_count == 2
+    cache.close()
+
+    stats = Counter()
+    cache = sql_cache.SqlCache(cache_dir=tmp_path, base_url='https://a')
+    content_results = [{'query.id': qid} for qid in [1, 2, 2, 3]]
+    response = ipe.get_sql_from_elements(
+        sdk, content_results, stats=stats, cache=cache)
+    assert sdk.run_query.call_count == 3
+    assert stats['cache_hits'] == 2
+    assert stats['api_calls'] == 1
+    assert [r['sql_joins'] for r in response] == [['public.order_items']] * 4